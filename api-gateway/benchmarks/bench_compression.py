@@ -0,0 +1,88 @@
+"""
+Сжатие ответов в gateway: объём, CPU и время передачи ответа со списком заказов.
+
+Режимы:
+- identity - как было до согласования кодировок: httpx распаковывал ответ сервиса,
+  и клиент получал тело без сжатия;
+- <coding> passthrough - сервис сжал ответ кодировкой клиента, gateway пересылает байты
+  как есть (CPU сжатия - в сервисе);
+- <coding> in gateway - сервис ответил без сжатия, gateway сжимает сам;
+- gzip -> <coding> - сервис сжал gzip, клиент его не принимает: распаковка и сжатие заново.
+
+Время передачи - оценка по размеру тела для канала заданной скорости (без RTT и TLS).
+br и zstd участвуют, если установлены brotli и zstandard.
+Запуск из каталога сервиса: python benchmarks/bench_compression.py
+"""
+import asyncio
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from compression import COMPRESSORS, encode_body, parse_accept_encoding  # noqa: E402
+from config import settings  # noqa: E402
+from serialization import dumps  # noqa: E402
+
+SIZES = (10, 100, 1000)
+# Скорость канала клиента, Мбит/с
+LINKS = (10, 100)
+REPEAT = 50
+
+
+def orders(count):
+    created_at = datetime(2026, 10, 19, tzinfo=timezone.utc)
+    return dumps([
+        {"id": i, "user_id": 42, "amount": 100.0 + i, "description": f"Заказ {i}",
+         "status": "FINISHED" if i % 3 else "CANCELLED", "created_at": created_at}
+        for i in range(count)
+    ])
+
+
+async def gateway_cpu(body, upstream_encoding, accepted):
+    """Среднее время encode_body (мкс) и результат"""
+    result = await encode_body(body, upstream_encoding, accepted)
+    started = time.perf_counter()
+    for _ in range(REPEAT):
+        await encode_body(body, upstream_encoding, accepted)
+    return (time.perf_counter() - started) / REPEAT * 1e6, result[0]
+
+
+def service_cpu(coding, body):
+    started = time.perf_counter()
+    for _ in range(REPEAT):
+        COMPRESSORS[coding](body)
+    return (time.perf_counter() - started) / REPEAT * 1e6
+
+
+def row(label, size, service_us, gateway_us):
+    transfer = "".join(f" {size * 8 / (mbit * 1e6) * 1000:>9.2f}" for mbit in LINKS)
+    print(f"{label:<22} {size:>9} {service_us:>11.0f} {gateway_us:>11.0f}{transfer}")
+
+
+async def main():
+    # Сжатие в самом цикле: измеряется CPU, а не переход в пул потоков
+    settings.compression_offload_size = 1 << 62
+    links = "".join(f" {f'{mbit} Mbit ms':>9}" for mbit in LINKS)
+    for count in SIZES:
+        body = orders(count)
+        print(f"-- {count} orders")
+        print(f"{'mode':<22} {'bytes':>9} {'service us':>11} {'gateway us':>11}{links}")
+
+        gateway_us, sent = await gateway_cpu(body, None, parse_accept_encoding("identity"))
+        row("identity", len(sent), 0, gateway_us)
+        for coding in COMPRESSORS:
+            accepted = parse_accept_encoding(coding)
+            compressed = COMPRESSORS[coding](body)
+            gateway_us, sent = await gateway_cpu(compressed, coding, accepted)
+            row(f"{coding} passthrough", len(sent), service_cpu(coding, body), gateway_us)
+            gateway_us, sent = await gateway_cpu(body, None, accepted)
+            row(f"{coding} in gateway", len(sent), 0, gateway_us)
+            if coding != "gzip":
+                gateway_us, sent = await gateway_cpu(COMPRESSORS["gzip"](body), "gzip", accepted)
+                row(f"gzip -> {coding}", len(sent), service_cpu("gzip", body), gateway_us)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
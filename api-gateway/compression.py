@@ -0,0 +1,117 @@
+"""
+Сжатие ответов API Gateway.
+
+- Кодировка выбирается по Accept-Encoding клиента (с учётом q) из доступных:
+  zstd и br - если установлены zstandard и brotli, gzip - всегда.
+- Микросервис получает Accept-Encoding с кодировками, которые принимает клиент, поэтому
+  его сжатый ответ пересылается клиенту как есть, без распаковки и повторного сжатия.
+- Несжатые ответы больше COMPRESSION_MIN_SIZE сжимаются в gateway; ответы больше
+  COMPRESSION_OFFLOAD_SIZE сжимаются (и при необходимости распаковываются) в пуле
+  потоков, чтобы не блокировать event loop.
+"""
+import asyncio
+import gzip
+import zlib
+from typing import Callable, Dict, Optional, Tuple
+
+from config import settings
+
+try:
+    import brotli
+except ImportError:  # brotli - опциональная зависимость
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # zstandard - опциональная зависимость
+    zstandard = None
+
+IDENTITY = "identity"
+
+# Кодировки в порядке предпочтения gateway
+COMPRESSORS: Dict[str, Callable[[bytes], bytes]] = {}
+DECOMPRESSORS: Dict[str, Callable[[bytes], bytes]] = {}
+
+if zstandard is not None:
+    COMPRESSORS["zstd"] = zstandard.ZstdCompressor(level=settings.compression_zstd_level).compress
+    # Потоковый декодер: в кадре от сервиса размер содержимого может быть не указан
+    DECOMPRESSORS["zstd"] = lambda data: zstandard.ZstdDecompressor().decompressobj().decompress(data)
+if brotli is not None:
+    COMPRESSORS["br"] = lambda data: brotli.compress(data, quality=settings.compression_brotli_quality)
+    DECOMPRESSORS["br"] = brotli.decompress
+COMPRESSORS["gzip"] = lambda data: gzip.compress(data, compresslevel=settings.compression_gzip_level, mtime=0)
+DECOMPRESSORS["gzip"] = lambda data: zlib.decompress(data, 16 + zlib.MAX_WBITS)
+DECOMPRESSORS["deflate"] = zlib.decompress
+
+
+def parse_accept_encoding(header: Optional[str]) -> Dict[str, float]:
+    """Разбор "gzip;q=1.0, br;q=0.5, *;q=0" в словарь кодировка -> q"""
+    accepted = {}
+    for item in (header or "").split(","):
+        coding, _, params = item.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+def _quality(accepted: Dict[str, float], coding: str) -> float:
+    if coding in accepted:
+        return accepted[coding]
+    return accepted.get("*", 0.0)
+
+
+def acceptable(accepted: Dict[str, float], coding: str) -> bool:
+    if coding == IDENTITY:
+        # identity допустима, если её явно не запретили
+        return _quality(accepted, IDENTITY) > 0 if (IDENTITY in accepted or "*" in accepted) else True
+    return _quality(accepted, coding) > 0
+
+
+def negotiate(accepted: Dict[str, float]) -> Optional[str]:
+    """Лучшая кодировка для клиента (None - не сжимать)"""
+    best, best_q = None, 0.0
+    for coding in COMPRESSORS:
+        q = _quality(accepted, coding)
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def upstream_accept_encoding(accepted: Dict[str, float]) -> str:
+    """Accept-Encoding для микросервиса: только то, что примет клиент и умеет разобрать gateway"""
+    codings = [coding for coding in DECOMPRESSORS if _quality(accepted, coding) > 0]
+    return ", ".join(codings) if codings else IDENTITY
+
+
+async def _run(func: Callable[[bytes], bytes], data: bytes) -> bytes:
+    if len(data) >= settings.compression_offload_size:
+        return await asyncio.to_thread(func, data)
+    return func(data)
+
+
+async def encode_body(body: bytes, upstream_encoding: Optional[str],
+                      accepted: Dict[str, float]) -> Tuple[bytes, Optional[str]]:
+    """
+    Тело ответа клиенту и его Content-Encoding.
+    body - тело от микросервиса в кодировке upstream_encoding (без распаковки).
+    """
+    upstream_encoding = (upstream_encoding or IDENTITY).lower()
+    if upstream_encoding != IDENTITY:
+        if acceptable(accepted, upstream_encoding) or upstream_encoding not in DECOMPRESSORS:
+            # Сервис уже сжал ответ подходящей кодировкой - пересылаем как есть
+            return body, upstream_encoding
+        body = await _run(DECOMPRESSORS[upstream_encoding], body)
+
+    coding = negotiate(accepted) if settings.compression_enabled else None
+    if coding is None or len(body) < settings.compression_min_size:
+        return body, None
+    return await _run(COMPRESSORS[coding], body), coding
@@ -18,8 +18,73 @@ class Settings(BaseSettings):
         "http://payments-service:8000"
     )
 
+    redis_url: str = os.getenv("REDIS_URL", "redis://localhost:6379")
+
     # Таймауты
     request_timeout: float = float(os.getenv("REQUEST_TIMEOUT", 30.0))
+    # Бюджеты времени отдельных маршрутов (сек): "METHOD service/path=seconds;..."
+    route_timeouts: str = os.getenv("ROUTE_TIMEOUTS", "GET orders/orders/export=300;POST orders/orders=10")
+
+    # Ограничение частоты запросов (token bucket, состояние в Redis)
+    rate_limit_enabled: bool = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+    # Лимит на пользователя по всем маршрутам: запросов в секунду и размер всплеска
+    rate_limit_user_rate: float = float(os.getenv("RATE_LIMIT_USER_RATE", 20))
+    rate_limit_user_burst: float = float(os.getenv("RATE_LIMIT_USER_BURST", 40))
+    # Лимиты пользователя на отдельные маршруты: "METHOD service/path=rate/burst;..."
+    rate_limit_routes: str = os.getenv("RATE_LIMIT_ROUTES", "POST orders/orders=5/10")
+    # Сколько токенов забирать из Redis за один запрос и сколько секунд их можно тратить локально
+    rate_limit_lease_size: int = int(os.getenv("RATE_LIMIT_LEASE_SIZE", 5))
+    rate_limit_lease_ttl: float = float(os.getenv("RATE_LIMIT_LEASE_TTL", 1.0))
+    # Размер локального кэша бакетов
+    rate_limit_local_cache_size: int = int(os.getenv("RATE_LIMIT_LOCAL_CACHE_SIZE", 100_000))
+
+    # Сброс нагрузки: адаптивный лимит одновременных запросов к каждому сервису
+    load_shedding_enabled: bool = os.getenv("LOAD_SHEDDING_ENABLED", "true").lower() == "true"
+    # Целевая задержка ответа микросервиса (сек), выше которой лимит снижается
+    load_shedding_latency_target: float = float(os.getenv("LOAD_SHEDDING_LATENCY_TARGET", 0.5))
+    load_shedding_min_concurrency: int = int(os.getenv("LOAD_SHEDDING_MIN_CONCURRENCY", 4))
+    load_shedding_max_concurrency: int = int(os.getenv("LOAD_SHEDDING_MAX_CONCURRENCY", 256))
+
+    # Хеджирование идемпотентных GET-запросов: дублирующий запрос к другому инстансу,
+    # если основной не ответил за p95 задержки (с ограничением снизу и сверху, сек)
+    hedging_enabled: bool = os.getenv("HEDGING_ENABLED", "true").lower() == "true"
+    hedge_min_delay: float = float(os.getenv("HEDGE_MIN_DELAY", 0.01))
+    hedge_max_delay: float = float(os.getenv("HEDGE_MAX_DELAY", 1.0))
+    # Сколько последних замеров задержки хранить для расчёта p95
+    hedge_latency_window: int = int(os.getenv("HEDGE_LATENCY_WINDOW", 500))
+
+    # Бюджет повторов: доля от основных запросов + минимальный запас токенов в секунду
+    retry_budget_ratio: float = float(os.getenv("RETRY_BUDGET_RATIO", 0.1))
+    retry_budget_min_per_second: float = float(os.getenv("RETRY_BUDGET_MIN_PER_SECOND", 1.0))
+    retry_budget_max_tokens: float = float(os.getenv("RETRY_BUDGET_MAX_TOKENS", 10.0))
+
+    # Circuit breaker на каждый инстанс микросервиса
+    breaker_failure_threshold: int = int(os.getenv("BREAKER_FAILURE_THRESHOLD", 5))
+    breaker_reset_timeout: float = float(os.getenv("BREAKER_RESET_TIMEOUT", 10.0))
+
+    # WebSocket-соединения клиентов
+    ws_max_connections: int = int(os.getenv("WS_MAX_CONNECTIONS", 10_000))
+    ws_max_connections_per_user: int = int(os.getenv("WS_MAX_CONNECTIONS_PER_USER", 5))
+    # Сервер шлёт ping, если от клиента ничего не было ws_ping_interval секунд,
+    # и закрывает соединение, если ответ не пришёл за ws_pong_timeout
+    ws_ping_interval: float = float(os.getenv("WS_PING_INTERVAL", 20.0))
+    ws_pong_timeout: float = float(os.getenv("WS_PONG_TIMEOUT", 10.0))
+    # Закрытие соединений без полезного трафика (сек)
+    ws_idle_timeout: float = float(os.getenv("WS_IDLE_TIMEOUT", 3600.0))
+    # Максимальный объём неотправленных сообщений одного соединения (байт)
+    ws_max_pending_bytes: int = int(os.getenv("WS_MAX_PENDING_BYTES", 256 * 1024))
+    # Сколько последних event_id помнить для отсечения повторных событий из Redis
+    ws_event_dedup_window: int = int(os.getenv("WS_EVENT_DEDUP_WINDOW", 10_000))
+
+    # Сжатие ответов (gzip; br и zstd - если установлены brotli и zstandard)
+    compression_enabled: bool = os.getenv("COMPRESSION_ENABLED", "true").lower() == "true"
+    # Ответы меньше этого размера (байт) не сжимаются
+    compression_min_size: int = int(os.getenv("COMPRESSION_MIN_SIZE", 1024))
+    # Ответы больше этого размера (байт) сжимаются в пуле потоков, а не в event loop
+    compression_offload_size: int = int(os.getenv("COMPRESSION_OFFLOAD_SIZE", 256 * 1024))
+    compression_gzip_level: int = int(os.getenv("COMPRESSION_GZIP_LEVEL", 6))
+    compression_brotli_quality: int = int(os.getenv("COMPRESSION_BROTLI_QUALITY", 4))
+    compression_zstd_level: int = int(os.getenv("COMPRESSION_ZSTD_LEVEL", 3))
 
     # Логирование
     log_level: str = os.getenv("LOG_LEVEL", "INFO")
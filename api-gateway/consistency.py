@@ -0,0 +1,42 @@
+"""
+Read-your-writes при чтении с реплик БД.
+
+Сервисы отвечают на запись заголовком X-Write-Timestamp. Gateway запоминает время
+последней записи каждого пользователя (а также время событий order_update из Redis,
+которые означают запись воркером) и передаёт его сервисам в X-Read-After.
+Сервис направляет чтение в primary, пока реплики могут не содержать эту запись.
+"""
+import time
+from collections import OrderedDict
+from typing import Optional
+
+WRITE_TIMESTAMP_HEADER = "X-Write-Timestamp"
+READ_AFTER_HEADER = "X-Read-After"
+
+
+class WriteTracker:
+    def __init__(self, max_users: int = 100_000):
+        self.max_users = max_users
+        self.last_writes: "OrderedDict[int, float]" = OrderedDict()
+
+    def record(self, user_id: int, timestamp: Optional[float] = None):
+        timestamp = timestamp if timestamp is not None else time.time()
+        if timestamp > self.last_writes.get(user_id, 0.0):
+            self.last_writes[user_id] = timestamp
+        self.last_writes.move_to_end(user_id)
+        if len(self.last_writes) > self.max_users:
+            self.last_writes.popitem(last=False)
+
+    def record_response(self, user_id: int, headers):
+        value = headers.get(WRITE_TIMESTAMP_HEADER)
+        if value:
+            try:
+                self.record(user_id, float(value))
+            except ValueError:
+                pass
+
+    def read_after(self, user_id: int) -> Optional[float]:
+        return self.last_writes.get(user_id)
+
+
+write_tracker = WriteTracker()
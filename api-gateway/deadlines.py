@@ -0,0 +1,46 @@
+"""
+Бюджеты времени маршрутов и дедлайн запроса.
+
+Gateway считает дедлайн (unix time, сек) по бюджету маршрута и передаёт его
+микросервису в заголовке X-Request-Deadline. Сервис не начинает работу, дедлайн
+которой уже прошёл, и ограничивает им запросы к БД - после таймаута gateway
+ответ никому не нужен. Клиент может прислать свой дедлайн: он учитывается,
+только если наступает раньше бюджета маршрута.
+"""
+import time
+from typing import Dict, Optional, Tuple
+
+from config import settings
+
+DEADLINE_HEADER = "X-Request-Deadline"
+# Так сервис помечает свой 504 по истёкшему дедлайну
+DEADLINE_EXCEEDED_HEADER = "X-Deadline-Exceeded"
+
+
+def parse_route_budgets(spec: str) -> Dict[Tuple[str, str], float]:
+    """Разбор строки вида "GET orders/orders/export=300;POST orders/orders=5" """
+    budgets = {}
+    for item in filter(None, (part.strip() for part in spec.split(";"))):
+        route, _, seconds = item.partition("=")
+        method, _, path = route.strip().partition(" ")
+        budgets[(method.upper(), path.strip().strip("/"))] = float(seconds)
+    return budgets
+
+
+ROUTE_BUDGETS = parse_route_budgets(settings.route_timeouts)
+
+
+def route_budget(method: str, service_name: str, path: str) -> float:
+    """Бюджет маршрута в секундах (по умолчанию - request_timeout)"""
+    key = (method.upper(), f"{service_name}/{path.strip('/')}")
+    return ROUTE_BUDGETS.get(key, settings.request_timeout)
+
+
+def request_deadline(budget: float, client_deadline: Optional[str]) -> float:
+    deadline = time.time() + budget
+    if client_deadline:
+        try:
+            deadline = min(deadline, float(client_deadline))
+        except ValueError:
+            pass
+    return deadline
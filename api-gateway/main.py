@@ -1,16 +1,25 @@
 from fastapi import FastAPI, Request, HTTPException, Header, Depends, WebSocket, WebSocketDisconnect
-from fastapi.responses import JSONResponse, HTMLResponse
+from fastapi.responses import Response, HTMLResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.openapi.docs import get_swagger_ui_html, get_redoc_html
 from fastapi.openapi.utils import get_openapi
 import httpx
 import asyncio
 from typing import Dict, Any, Optional, List
-import json
 import logging
+import time
 from contextlib import asynccontextmanager
-import redis.asyncio as aioredis
-import os
+
+from profiling import setup_profiling
+from loop_monitor import loop_monitor, setup_loop_monitor
+from serialization import DecodeError, FastJSONResponse, loads
+from rate_limiter import rate_limiter, load_shedder
+from upstream import UpstreamPool, UpstreamUnavailable
+from config import settings
+from consistency import READ_AFTER_HEADER, write_tracker
+from deadlines import DEADLINE_HEADER, request_deadline, route_budget
+import compression
+from websocket_manager import gateway_ws_manager
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
@@ -28,55 +37,26 @@ SERVICE_CONFIG = {
     }
 }
 
+# Пулы инстансов с circuit breaker'ами, хеджированием и бюджетом повторов
+UPSTREAM_POOLS = {
+    "orders": UpstreamPool("orders", SERVICE_CONFIG["orders"]["base_urls"]),
+    "payments": UpstreamPool("payments", [SERVICE_CONFIG["payments"]["base_url"]]),
+}
 
-# Менеджер WebSocket соединений для Gateway
-class GatewayWebSocketManager:
-    def __init__(self):
-        self.active_connections: Dict[int, WebSocket] = {}
-        self.redis_url = os.getenv("REDIS_URL", "redis://localhost:6379")
-        self.redis_client = None
-
-    async def connect_redis(self):
-        """Подключение к Redis для получения обновлений от сервисов"""
-        try:
-            self.redis_client = aioredis.from_url(
-                self.redis_url,
-                decode_responses=True,
-                encoding='utf-8'
-            )
-            logger.info("Gateway connected to Redis")
-        except Exception as e:
-            logger.error(f"Failed to connect to Redis: {e}")
-
-    async def disconnect_redis(self):
-        """Отключение от Redis"""
-        if self.redis_client:
-            await self.redis_client.close()
-            logger.info("Gateway disconnected from Redis")
-
-    async def connect(self, websocket: WebSocket, user_id: int):
-        await websocket.accept()
-        self.active_connections[user_id] = websocket
-        logger.info(f"User {user_id} connected to Gateway WebSocket")
-
-    async def disconnect(self, user_id: int):
-        if user_id in self.active_connections:
-            del self.active_connections[user_id]
-            logger.info(f"User {user_id} disconnected from Gateway WebSocket")
-
-    async def send_to_user(self, user_id: int, message: dict):
-        """Отправка сообщения пользователю через Gateway"""
-        if user_id in self.active_connections:
-            try:
-                await self.active_connections[user_id].send_json(message)
-                return True
-            except Exception as e:
-                logger.error(f"Error sending to user {user_id}: {e}")
-        return False
+# Идемпотентные методы, которые можно хеджировать
+HEDGE_METHODS = {"GET", "HEAD"}
 
+# Маршруты с потоковыми ответами: тело пересылается клиенту по мере получения, без буферизации
+STREAMING_ROUTES = {("orders", "orders/export")}
 
-# Создаем глобальный экземпляр менеджера
-gateway_ws_manager = GatewayWebSocketManager()
+# Заголовки, которые не пересылаются клиенту из ответа микросервиса.
+# content-encoding и content-length выставляются заново: gateway пересылает тело сервиса
+# как есть или перекодирует его под Accept-Encoding клиента (compression.encode_body).
+HOP_BY_HOP_HEADERS = {
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+    "te", "trailers", "transfer-encoding", "upgrade",
+    "content-encoding", "content-length",
+}
 
 
 @asynccontextmanager
@@ -84,21 +64,26 @@ async def lifespan(app: FastAPI):
     """Lifespan events для управления ресурсами"""
     # Startup
     logger.info("Starting up API Gateway with WebSocket...")
-    app.state.http_client = httpx.AsyncClient(timeout=30.0)
+    await loop_monitor.start()
+    app.state.http_client = httpx.AsyncClient(timeout=settings.request_timeout)
 
     # Подключаемся к Redis
     await gateway_ws_manager.connect_redis()
+    await rate_limiter.connect()
 
     # Запускаем задачу для прослушивания Redis
     if gateway_ws_manager.redis_client:
-        asyncio.create_task(listen_for_order_updates())
+        asyncio.create_task(listen_for_order_updates(), name="redis:order_updates")
+    heartbeat_task = asyncio.create_task(gateway_ws_manager.run_heartbeat(), name="ws-heartbeat")
 
     yield
 
     # Shutdown
     logger.info("Shutting down API Gateway...")
+    heartbeat_task.cancel()
     await app.state.http_client.aclose()
     await gateway_ws_manager.disconnect_redis()
+    await rate_limiter.close()
 
 
 async def listen_for_order_updates():
@@ -112,13 +97,19 @@ async def listen_for_order_updates():
         async for message in pubsub.listen():
             if message["type"] == "message":
                 try:
-                    data = json.loads(message["data"])
+                    data = loads(message["data"])
                     user_id = data.get("user_id")
-                    # Пересылаем сообщение клиенту через Gateway
+                    event_id = data.get("event_id")
+                    # Один и тот же переход статуса могут опубликовать несколько воркеров
+                    if event_id and not gateway_ws_manager.is_new_event(event_id):
+                        continue
+                    # Пересылаем исходную строку клиенту через Gateway, не кодируя её заново
                     if user_id:
-                        await gateway_ws_manager.send_to_user(user_id, data)
+                        # Событие означает запись воркером - последующие чтения пользователя идут в primary
+                        write_tracker.record(user_id)
+                        await gateway_ws_manager.send_encoded(user_id, message["data"])
                         logger.debug(f"Order update forwarded to user {user_id}")
-                except json.JSONDecodeError as e:
+                except DecodeError as e:
                     logger.error(f"Invalid JSON from Redis: {e}")
                 except Exception as e:
                     logger.error(f"Error processing Redis message: {e}")
@@ -133,7 +124,8 @@ app = FastAPI(
     ## Единая точка входа для микросервисов магазина с WebSocket поддержкой
     """,
     version="2.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse
 )
 
 # CORS middleware
@@ -145,16 +137,22 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Профилирование (admin-маршруты должны быть объявлены раньше прокси /{service_name}/{path})
+setup_profiling(app, sqlalchemy=False)
+setup_loop_monitor(app)
+
 
 # WebSocket endpoint в Gateway
 @app.websocket("/ws/{user_id}")
 async def gateway_websocket_endpoint(websocket: WebSocket, user_id: int):
     """WebSocket подключение через Gateway"""
-    await gateway_ws_manager.connect(websocket, user_id)
+    conn = await gateway_ws_manager.connect(websocket, user_id)
+    if conn is None:
+        return
 
     try:
         # Отправляем приветственное сообщение
-        await websocket.send_json({
+        gateway_ws_manager.send(conn, {
             "type": "gateway_connected",
             "message": "Connected to API Gateway WebSocket",
             "user_id": user_id,
@@ -162,24 +160,22 @@ async def gateway_websocket_endpoint(websocket: WebSocket, user_id: int):
             "note": "You will receive real-time order status updates"
         })
 
-        # Ждём сообщений от клиента
-        while True:
+        # Ждём сообщений от клиента. Таймаут нужен, чтобы заметить закрытие соединения
+        # heartbeat-задачей, даже если клиент пропал без FIN.
+        while not conn.closed:
             try:
-                data = await websocket.receive_json()
-                # Обработка сообщений от клиента
-                if data.get("type") == "ping":
-                    await websocket.send_json({
-                        "type": "pong",
-                        "timestamp": asyncio.get_event_loop().time()
-                    })
-            except Exception:
-                break
+                text = await asyncio.wait_for(websocket.receive_text(), timeout=settings.ws_pong_timeout)
+            except asyncio.TimeoutError:
+                continue
+            gateway_ws_manager.on_client_message(conn, text)
 
     except WebSocketDisconnect:
-        await gateway_ws_manager.disconnect(user_id)
+        pass
     except Exception as e:
         logger.error(f"Gateway WebSocket error: {e}")
-        await gateway_ws_manager.disconnect(user_id)
+    finally:
+        # Соединение снимается с учёта при любом исходе
+        await gateway_ws_manager.disconnect(conn)
 
 
 # Health check endpoints
@@ -190,8 +186,13 @@ async def health_check():
         "status": "healthy",
         "service": "api-gateway",
         "timestamp": asyncio.get_event_loop().time(),
-        "websocket_connections": len(gateway_ws_manager.active_connections),
-        "redis_connected": gateway_ws_manager.redis_client is not None
+        "websocket_connections": gateway_ws_manager.total,
+        "websocket": gateway_ws_manager.snapshot(),
+        "redis_connected": gateway_ws_manager.redis_client is not None,
+        "rate_limiter": rate_limiter.stats,
+        "load_shedding": load_shedder.snapshot(),
+        "upstreams": {name: pool.snapshot() for name, pool in UPSTREAM_POOLS.items()},
+        "event_loop": loop_monitor.snapshot()
     }
 
 
@@ -209,7 +210,7 @@ async def health_all_services():
                     "status": "healthy" if response.status_code == 200 else "unhealthy",
                     "status_code": response.status_code,
                     "response_time": response.elapsed.total_seconds(),
-                    "data": response.json() if response.content else {}
+                    "data": loads(response.content) if response.content else {}
                 }
         except Exception as e:
             results[f"orders_{i + 1}"] = {
@@ -225,7 +226,7 @@ async def health_all_services():
                 "status": "healthy" if response.status_code == 200 else "unhealthy",
                 "status_code": response.status_code,
                 "response_time": response.elapsed.total_seconds(),
-                "data": response.json() if response.content else {}
+                "data": loads(response.content) if response.content else {}
             }
     except Exception as e:
         results["payments"] = {
@@ -240,6 +241,17 @@ async def health_all_services():
 
 
 # Основной прокси-роут
+async def relay_body(response: httpx.Response, raw: bool = False):
+    """Пересылает тело потокового ответа (raw - без распаковки). Соединение с микросервисом
+    закрывается, когда клиент дочитал ответ или отключился."""
+    try:
+        chunks = response.aiter_raw() if raw else response.aiter_bytes()
+        async for chunk in chunks:
+            yield chunk
+    finally:
+        await response.aclose()
+
+
 @app.api_route(
     "/api/{service_name}/{path:path}",
     methods=["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS", "HEAD"],
@@ -273,56 +285,102 @@ async def proxy_to_service(
             detail=f"Сервис '{service_name}' не найден. Доступные сервисы: {list(SERVICE_CONFIG.keys())}"
         )
 
-    # Выбор целевого URL
-    if service_name == "orders":
-        # Простая round-robin балансировка
-        index = x_user_id % len(SERVICE_CONFIG["orders"]["base_urls"])
-        target_url = f"{SERVICE_CONFIG['orders']['base_urls'][index]}/{path.lstrip('/')}"
-    else:
-        config = SERVICE_CONFIG[service_name]
-        target_url = f"{config['base_url']}/{path.lstrip('/')}"
+    # Ограничение частоты запросов пользователя (429 с Retry-After при превышении)
+    await rate_limiter.check(x_user_id, request.method, service_name, path)
 
-    logger.info(f"Proxying {request.method} {request.url} -> {target_url} (user_id={x_user_id})")
+    # Инстанс выбирается пулом: закреплённый за пользователем, если его circuit breaker закрыт
+    pool = UPSTREAM_POOLS[service_name]
 
-    try:
-        # Подготавливаем headers
-        headers = dict(request.headers)
-        headers.pop("host", None)
-        headers["X-Forwarded-For"] = request.client.host if request.client else ""
-        headers["X-Original-Path"] = str(request.url)
-
-        # Получаем тело запроса
-        body = await request.body()
-
-        # Отправляем запрос к микросервису
-        response = await app.state.http_client.request(
-            method=request.method,
-            url=target_url,
-            headers=headers,
-            content=body,
-            params=dict(request.query_params)
-        )
+    logger.info(f"Proxying {request.method} {request.url} -> {service_name}/{path.lstrip('/')} (user_id={x_user_id})")
 
-        # Возвращаем ответ
-        return JSONResponse(
-            content=response.json() if response.content else {},
-            status_code=response.status_code,
-            headers=dict(response.headers)
-        )
+    # Сброс нагрузки: если сервис перегружен, сразу отвечаем 503 с Retry-After
+    async with load_shedder.slot(service_name):
+        try:
+            # Подготавливаем headers
+            headers = dict(request.headers)
+            headers.pop("host", None)
+            headers["X-Forwarded-For"] = request.client.host if request.client else ""
+            headers["X-Original-Path"] = str(request.url)
+
+            # Read-your-writes: передаём время последней записи пользователя
+            headers.pop(READ_AFTER_HEADER.lower(), None)
+            last_write = write_tracker.read_after(x_user_id)
+            if last_write is not None:
+                headers[READ_AFTER_HEADER] = f"{last_write:.6f}"
+
+            # Дедлайн по бюджету маршрута: сервис не станет работать над запросом, который мы уже не ждём
+            budget = route_budget(request.method, service_name, path)
+            deadline = request_deadline(budget, headers.pop(DEADLINE_HEADER.lower(), None))
+            headers[DEADLINE_HEADER] = f"{deadline:.6f}"
+
+            # Сервис сжимает ответ только кодировками, которые примет клиент: тогда его не нужно перепаковывать
+            accepted = compression.parse_accept_encoding(request.headers.get("accept-encoding"))
+            headers["accept-encoding"] = compression.upstream_accept_encoding(accepted)
+
+            # Получаем тело запроса
+            body = await request.body()
+
+            stream = (service_name, path.strip("/")) in STREAMING_ROUTES
+
+            # Отправляем запрос к микросервису (GET хеджируется ко второму инстансу)
+            response = await pool.request(
+                app.state.http_client,
+                request.method,
+                path,
+                affinity=x_user_id,
+                hedge=request.method in HEDGE_METHODS,
+                stream=stream,
+                timeout=max(0.001, deadline - time.time()),
+                headers=headers,
+                content=body,
+                params=dict(request.query_params)
+            )
 
-    except httpx.ConnectError:
-        raise HTTPException(
-            status_code=503,
-            detail=f"Сервис '{service_name}' временно недоступен"
-        )
-    except httpx.TimeoutException:
-        raise HTTPException(
-            status_code=504,
-            detail=f"Таймаут при обращении к сервису '{service_name}'"
-        )
-    except Exception as e:
-        logger.error(f"Ошибка при проксировании: {str(e)}")
-        raise HTTPException(
-            status_code=500,
-            detail=f"Внутренняя ошибка сервера: {str(e)}"
-        )
\ No newline at end of file
+            write_tracker.record_response(x_user_id, response.headers)
+
+            # Возвращаем тело ответа как есть, без разбора и повторной сериализации JSON
+            response_headers = {
+                name: value for name, value in response.headers.items()
+                if name.lower() not in HOP_BY_HOP_HEADERS
+            }
+            response_headers["vary"] = "Accept-Encoding"
+            upstream_encoding = response.headers.get("content-encoding")
+            if stream:
+                passthrough = upstream_encoding is not None and compression.acceptable(accepted, upstream_encoding)
+                if passthrough:
+                    response_headers["content-encoding"] = upstream_encoding
+                return StreamingResponse(
+                    relay_body(response.response, raw=passthrough),
+                    status_code=response.status_code,
+                    headers=response_headers,
+                    media_type=response.headers.get("content-type")
+                )
+
+            content, content_encoding = b"{}", None
+            if response.raw_body:
+                content, content_encoding = await compression.encode_body(response.raw_body, upstream_encoding, accepted)
+            if content_encoding is not None:
+                response_headers["content-encoding"] = content_encoding
+            return Response(
+                content=content,
+                status_code=response.status_code,
+                headers=response_headers,
+                media_type=response.headers.get("content-type", "application/json")
+            )
+
+        except (httpx.ConnectError, UpstreamUnavailable):
+            raise HTTPException(
+                status_code=503,
+                detail=f"Сервис '{service_name}' временно недоступен"
+            )
+        except httpx.TimeoutException:
+            raise HTTPException(
+                status_code=504,
+                detail=f"Таймаут при обращении к сервису '{service_name}'"
+            )
+        except Exception as e:
+            logger.error(f"Ошибка при проксировании: {str(e)}")
+            raise HTTPException(
+                status_code=500,
+                detail=f"Внутренняя ошибка сервера: {str(e)}"
+            )
\ No newline at end of file
@@ -0,0 +1,275 @@
+"""
+Ограничение частоты запросов и сброс нагрузки в API Gateway.
+
+RateLimiter - token bucket на пользователя (X-User-ID) и на пару пользователь+маршрут.
+Состояние бакетов хранится в Redis и меняется атомарным Lua-скриптом, поэтому лимит
+общий для всех инстансов Gateway. Чтобы не ходить в Redis на каждый запрос, токены
+забираются «арендой» по несколько штук и тратятся локально, а отказ кэшируется
+до момента, когда в бакете появится токен.
+
+LoadShedder - адаптивный лимит одновременных запросов к каждому микросервису.
+Если задержка ответов выше целевой, лимит уменьшается, и лишние запросы сразу
+получают 503 с Retry-After вместо того, чтобы копиться в очереди.
+"""
+import logging
+import math
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional, Tuple
+
+import redis.asyncio as aioredis
+from fastapi import HTTPException
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Атомарное списание токенов: пополняет бакет по прошедшему времени (часы Redis)
+# и выдаёт до ARGV[3] токенов. Возвращает {выдано, секунд до следующего токена}.
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+
+local granted = math.min(requested, math.floor(tokens))
+tokens = tokens - granted
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+
+local wait = 0
+if granted == 0 then
+    wait = (1 - tokens) / rate
+end
+return {granted, tostring(wait)}
+"""
+
+
+class BucketLimit:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+
+
+def parse_route_limits(spec: str) -> Dict[Tuple[str, str], BucketLimit]:
+    """Разбор строки вида "POST orders/orders=5/10;GET payments/accounts=50/100" """
+    limits = {}
+    for item in filter(None, (part.strip() for part in spec.split(";"))):
+        route, _, values = item.partition("=")
+        method, _, path = route.strip().partition(" ")
+        rate, _, burst = values.partition("/")
+        limits[(method.upper(), path.strip().strip("/"))] = BucketLimit(float(rate), float(burst or rate))
+    return limits
+
+
+class LocalLease:
+    """Локальная копия состояния бакета: арендованные токены и кэш отказа"""
+    __slots__ = ("tokens", "expires_at", "deny_until")
+
+    def __init__(self):
+        self.tokens = 0
+        self.expires_at = 0.0
+        self.deny_until = 0.0
+
+
+class RateLimiter:
+    def __init__(self):
+        self.enabled = settings.rate_limit_enabled
+        self.user_limit = BucketLimit(settings.rate_limit_user_rate, settings.rate_limit_user_burst)
+        self.route_limits = parse_route_limits(settings.rate_limit_routes)
+        self.lease_size = max(1, settings.rate_limit_lease_size)
+        self.lease_ttl = settings.rate_limit_lease_ttl
+        self.cache_size = settings.rate_limit_local_cache_size
+        self.redis_client = None
+        self.script = None
+        self.leases: "OrderedDict[str, LocalLease]" = OrderedDict()
+        self.stats = {"allowed": 0, "rejected": 0, "redis_calls": 0, "redis_errors": 0}
+
+    async def connect(self):
+        if not self.enabled:
+            return
+        try:
+            self.redis_client = aioredis.from_url(settings.redis_url)
+            self.script = self.redis_client.register_script(TOKEN_BUCKET_SCRIPT)
+            logger.info("Rate limiter connected to Redis")
+        except Exception as e:
+            logger.error(f"Rate limiter failed to connect to Redis: {e}")
+
+    async def close(self):
+        if self.redis_client:
+            await self.redis_client.close()
+
+    def _lease(self, key: str) -> LocalLease:
+        lease = self.leases.get(key)
+        if lease is None:
+            lease = self.leases[key] = LocalLease()
+            if len(self.leases) > self.cache_size:
+                self.leases.popitem(last=False)
+        else:
+            self.leases.move_to_end(key)
+        return lease
+
+    async def _acquire(self, key: str, limit: BucketLimit) -> Tuple[float, Optional[LocalLease]]:
+        """
+        Списывает один токен. Возвращает (0, аренда, из которой взят токен) при успехе
+        или (сколько секунд ждать, None). Без Redis запрос пропускается без списания.
+        """
+        now = time.monotonic()
+        lease = self._lease(key)
+
+        # Быстрый путь без обращения к Redis
+        if lease.deny_until > now:
+            return lease.deny_until - now, None
+        if lease.tokens > 0 and lease.expires_at > now:
+            lease.tokens -= 1
+            return 0.0, lease
+
+        if self.script is None:
+            # Redis недоступен - не блокируем пользователей
+            return 0.0, None
+
+        try:
+            self.stats["redis_calls"] += 1
+            granted, wait = await self.script(
+                keys=[f"ratelimit:{key}"],
+                args=[limit.rate, limit.burst, min(self.lease_size, max(1, int(limit.burst)))]
+            )
+        except Exception as e:
+            self.stats["redis_errors"] += 1
+            logger.warning(f"Rate limiter Redis error, failing open: {e}")
+            return 0.0, None
+
+        granted = int(granted)
+        if granted == 0:
+            lease.tokens = 0
+            lease.deny_until = now + float(wait)
+            return max(float(wait), 0.001), None
+
+        lease.tokens = granted - 1
+        lease.expires_at = now + self.lease_ttl
+        return 0.0, lease
+
+    def _buckets(self, user_id: int, method: str, service_name: str, path: str) -> List[Tuple[str, BucketLimit]]:
+        buckets = [(f"user:{user_id}", self.user_limit)]
+        route = f"{service_name}/{path.strip('/')}"
+        route_limit = self.route_limits.get((method.upper(), route))
+        if route_limit is not None:
+            buckets.append((f"route:{method.upper()} {route}:{user_id}", route_limit))
+        return buckets
+
+    async def check(self, user_id: int, method: str, service_name: str, path: str):
+        """Проверка лимитов. При превышении выбрасывает HTTP 429 с Retry-After."""
+        if not self.enabled:
+            return
+
+        taken: List[LocalLease] = []
+        for key, limit in self._buckets(user_id, method, service_name, path):
+            wait, lease = await self._acquire(key, limit)
+            if wait > 0:
+                # Всё или ничего: токены, уже списанные из других бакетов, возвращаем
+                # в их аренду, иначе отказ по маршруту расходовал бы лимит пользователя
+                for held in taken:
+                    held.tokens += 1
+                self.stats["rejected"] += 1
+                raise HTTPException(
+                    status_code=429,
+                    detail="Слишком много запросов, повторите позже",
+                    headers={"Retry-After": str(max(1, math.ceil(wait)))}
+                )
+            if lease is not None:
+                taken.append(lease)
+        self.stats["allowed"] += 1
+
+
+class ServiceConcurrency:
+    """Адаптивный лимит одновременных запросов к одному сервису (AIMD)"""
+
+    def __init__(self, initial_limit: int):
+        self.limit = float(initial_limit)
+        self.in_flight = 0
+        self.latency_ewma: Optional[float] = None
+        self.last_adjusted = 0.0
+        self.shed = 0
+
+
+class LoadShedder:
+    # Сглаживание EWMA и минимальный интервал между изменениями лимита
+    EWMA_ALPHA = 0.2
+    ADJUST_INTERVAL = 0.1
+
+    def __init__(self):
+        self.enabled = settings.load_shedding_enabled
+        self.latency_target = settings.load_shedding_latency_target
+        self.min_limit = settings.load_shedding_min_concurrency
+        self.max_limit = settings.load_shedding_max_concurrency
+        self.services: Dict[str, ServiceConcurrency] = {}
+
+    def _state(self, service_name: str) -> ServiceConcurrency:
+        state = self.services.get(service_name)
+        if state is None:
+            state = self.services[service_name] = ServiceConcurrency(self.max_limit)
+        return state
+
+    def _record(self, state: ServiceConcurrency, latency: float):
+        if state.latency_ewma is None:
+            state.latency_ewma = latency
+        else:
+            state.latency_ewma += self.EWMA_ALPHA * (latency - state.latency_ewma)
+
+        now = time.monotonic()
+        if now - state.last_adjusted < self.ADJUST_INTERVAL:
+            return
+        state.last_adjusted = now
+        if state.latency_ewma > self.latency_target:
+            # Мультипликативное снижение при превышении целевой задержки
+            state.limit = max(self.min_limit, state.limit * 0.9)
+        else:
+            # Аддитивное восстановление
+            state.limit = min(self.max_limit, state.limit + 1)
+
+    @asynccontextmanager
+    async def slot(self, service_name: str):
+        """Занимает слот запроса к сервису или сразу отвечает 503 с Retry-After"""
+        if not self.enabled:
+            yield
+            return
+
+        state = self._state(service_name)
+        if state.in_flight >= int(state.limit):
+            state.shed += 1
+            retry_after = max(1, math.ceil(state.latency_ewma or 1))
+            raise HTTPException(
+                status_code=503,
+                detail=f"Сервис '{service_name}' перегружен, повторите позже",
+                headers={"Retry-After": str(retry_after)}
+            )
+
+        state.in_flight += 1
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            state.in_flight -= 1
+            self._record(state, time.monotonic() - started)
+
+    def snapshot(self) -> dict:
+        return {
+            name: {
+                "limit": int(state.limit),
+                "in_flight": state.in_flight,
+                "latency_ewma": state.latency_ewma,
+                "shed": state.shed,
+            }
+            for name, state in self.services.items()
+        }
+
+
+rate_limiter = RateLimiter()
+load_shedder = LoadShedder()
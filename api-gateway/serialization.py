@@ -0,0 +1,113 @@
+"""
+Единый слой сериализации JSON.
+
+Используется во всех точках, где данные превращаются в JSON и обратно:
+HTTP-ответы, сообщения RabbitMQ, события Redis и отправка в WebSocket.
+Если установлен orjson - используется он, иначе стандартный json.
+Бэкенд можно принудительно выбрать переменной окружения JSON_BACKEND.
+"""
+import json
+import os
+from datetime import date, datetime
+from decimal import Decimal
+from enum import Enum
+from typing import Any, Union
+
+from fastapi.responses import JSONResponse, Response
+from pydantic import TypeAdapter
+
+try:
+    import orjson
+except ImportError:  # orjson - опциональная зависимость
+    orjson = None
+
+# Ошибка разбора JSON (orjson.JSONDecodeError наследуется от неё)
+DecodeError = json.JSONDecodeError
+
+
+def _default(obj: Any) -> Any:
+    """Приведение типов, которые не умеет сериализовать JSON"""
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, Enum):
+        return obj.value
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError(f"Type {type(obj).__name__} is not JSON serializable")
+
+
+class StdlibBackend:
+    name = "json"
+
+    def dumps(self, obj: Any) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        return json.loads(data)
+
+
+class OrjsonBackend:
+    name = "orjson"
+
+    def dumps(self, obj: Any) -> bytes:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        return orjson.loads(data)
+
+
+_BACKENDS = {"json": StdlibBackend}
+if orjson is not None:
+    _BACKENDS["orjson"] = OrjsonBackend
+
+_backend = None
+
+
+def set_backend(name: str):
+    """Переключение бэкенда сериализации (json / orjson)"""
+    global _backend
+    if name not in _BACKENDS:
+        raise ValueError(f"JSON backend '{name}' is not available, choose from {list(_BACKENDS)}")
+    _backend = _BACKENDS[name]()
+
+
+def get_backend():
+    return _backend
+
+
+def dumps(obj: Any) -> bytes:
+    """Сериализация в байты UTF-8 (для RabbitMQ, Redis и HTTP)"""
+    return _backend.dumps(obj)
+
+
+def dumps_str(obj: Any) -> str:
+    """Сериализация в строку (для текстовых колонок и WebSocket-фреймов)"""
+    return _backend.dumps(obj).decode("utf-8")
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    """Разбор JSON из байтов или строки"""
+    return _backend.loads(data)
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON-ответ FastAPI, сериализуемый через выбранный бэкенд"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def validated_response(adapter: TypeAdapter, data: Any, status_code: int = 200) -> Response:
+    """
+    Готовый JSON-ответ по схеме: проверка и сериализация - по одному вызову pydantic-core
+    на весь список, атрибуты ORM-объектов и строк SQLAlchemy читаются напрямую.
+    FastAPI не проверяет такой ответ повторно по response_model (она остаётся для OpenAPI).
+    Даты - в том же формате, что и у response_model: ISO 8601 от pydantic, UTC с суффиксом
+    «Z» (2026-10-19T12:00:00Z). dumps() пишет datetime.isoformat() («+00:00») - так
+    сериализуются события и кэш, но не ответы API.
+    """
+    body = adapter.dump_json(adapter.validate_python(data, from_attributes=True))
+    return Response(content=body, status_code=status_code, media_type="application/json")
+
+
+set_backend(os.getenv("JSON_BACKEND", "orjson" if orjson is not None else "json"))
@@ -0,0 +1,4 @@
+import os
+
+# Тесты не должны зависеть от Redis и лимитов окружения
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
@@ -0,0 +1,114 @@
+import gzip
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+import compression
+import main
+from compression import COMPRESSORS, encode_body, negotiate, parse_accept_encoding, upstream_accept_encoding
+from config import settings
+
+BODY = b'{"items": [' + b'{"id": 1, "status": "FINISHED"}, ' * 200 + b'{}]}'
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, {}),
+    ("", {}),
+    ("gzip", {"gzip": 1.0}),
+    ("GZIP, br;q=0.5", {"gzip": 1.0, "br": 0.5}),
+    ("gzip;q=0, *;q=0.1", {"gzip": 0.0, "*": 0.1}),
+    ("identity;q=0, deflate; q=bad", {"identity": 0.0, "deflate": 0.0}),
+    (" , gzip ,", {"gzip": 1.0}),
+])
+def test_parse_accept_encoding(header, expected):
+    assert parse_accept_encoding(header) == expected
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("", None),
+    ("gzip", "gzip"),
+    ("gzip;q=0", None),
+    ("*", next(iter(COMPRESSORS))),
+    ("deflate", None),
+    ("*;q=0.5, gzip;q=0", next((c for c in COMPRESSORS if c != "gzip"), None)),
+])
+def test_negotiate(header, expected):
+    assert negotiate(parse_accept_encoding(header)) == expected
+
+
+@pytest.mark.skipif("br" not in COMPRESSORS, reason="brotli не установлен")
+def test_negotiate_respects_client_preference():
+    assert negotiate(parse_accept_encoding("gzip;q=1.0, br;q=0.5")) == "gzip"
+    assert negotiate(parse_accept_encoding("gzip;q=0.5, br")) == "br"
+
+
+def test_upstream_gets_only_codings_client_accepts():
+    assert upstream_accept_encoding(parse_accept_encoding("gzip, deflate;q=0")) == "gzip"
+    assert upstream_accept_encoding(parse_accept_encoding("")) == "identity"
+
+
+async def test_compressed_upstream_body_is_passed_through():
+    compressed = gzip.compress(BODY)
+    body, coding = await encode_body(compressed, "gzip", parse_accept_encoding("gzip"))
+    # Тот же объект: без распаковки и повторного сжатия
+    assert body is compressed and coding == "gzip"
+
+
+async def test_upstream_body_is_decoded_for_client_without_its_coding():
+    body, coding = await encode_body(gzip.compress(BODY), "gzip", parse_accept_encoding("identity"))
+    assert (body, coding) == (BODY, None)
+
+
+async def test_plain_body_is_compressed_for_client():
+    body, coding = await encode_body(BODY, None, parse_accept_encoding("gzip"))
+    assert coding == "gzip" and gzip.decompress(body) == BODY
+
+
+async def test_small_body_is_not_compressed():
+    body, coding = await encode_body(b"{}", None, parse_accept_encoding("gzip"))
+    assert (body, coding) == (b"{}", None)
+
+
+async def test_large_body_is_compressed_off_loop(monkeypatch):
+    calls = []
+
+    async def to_thread(func, data):
+        calls.append(len(data))
+        return func(data)
+    monkeypatch.setattr(settings, "compression_offload_size", len(BODY))
+    monkeypatch.setattr(compression.asyncio, "to_thread", to_thread)
+
+    body, coding = await encode_body(BODY, None, parse_accept_encoding("gzip"))
+
+    assert calls == [len(BODY)] and gzip.decompress(body) == BODY
+
+
+async def test_compression_can_be_disabled(monkeypatch):
+    monkeypatch.setattr(settings, "compression_enabled", False)
+    assert await encode_body(BODY, None, parse_accept_encoding("gzip")) == (BODY, None)
+
+
+@pytest.mark.parametrize("path", ["orders/orders", "orders/orders/export"])
+def test_proxy_passes_compressed_upstream_body_through(path, monkeypatch):
+    compressed = gzip.compress(BODY)
+    seen = []
+
+    def upstream(request: httpx.Request) -> httpx.Response:
+        seen.append(request.headers["accept-encoding"])
+
+        async def chunks():
+            # Потоковое тело, как у настоящего соединения: gateway читает его без распаковки
+            yield compressed
+        return httpx.Response(200, content=chunks(),
+                              headers={"content-encoding": "gzip", "content-type": "application/json"})
+
+    monkeypatch.setattr(main.app.state, "http_client", httpx.AsyncClient(transport=httpx.MockTransport(upstream)),
+                        raising=False)
+    response = TestClient(main.app).get(f"/api/{path}", headers={"X-User-ID": "1", "Accept-Encoding": "gzip"})
+
+    assert seen == ["gzip"]
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert int(response.headers.get("content-length", len(compressed))) == len(compressed)
+    assert response.content == BODY
@@ -0,0 +1,50 @@
+import fakeredis
+import pytest
+from fastapi import HTTPException
+
+from rate_limiter import TOKEN_BUCKET_SCRIPT, BucketLimit, RateLimiter
+
+# Практически без пополнения: за время теста бакеты не наполняются
+SLOW = 0.001
+
+
+@pytest.fixture
+def limiter():
+    limiter = RateLimiter()
+    limiter.enabled = True
+    limiter.lease_size = 1
+    limiter.user_limit = BucketLimit(SLOW, 3)
+    limiter.route_limits = {("POST", "orders/orders"): BucketLimit(SLOW, 1)}
+    limiter.redis_client = fakeredis.aioredis.FakeRedis()
+    limiter.script = limiter.redis_client.register_script(TOKEN_BUCKET_SCRIPT)
+    return limiter
+
+
+async def test_route_denial_does_not_spend_user_token(limiter):
+    await limiter.check(1, "POST", "orders", "orders")
+    with pytest.raises(HTTPException) as denied:
+        await limiter.check(1, "POST", "orders", "orders")
+    assert denied.value.status_code == 429
+
+    # Из 3 токенов пользователя потрачен только один - на пропущенный POST
+    await limiter.check(1, "GET", "orders", "orders")
+    await limiter.check(1, "GET", "orders", "orders")
+    with pytest.raises(HTTPException):
+        await limiter.check(1, "GET", "orders", "orders")
+    assert limiter.stats["allowed"] == 3
+
+
+async def test_user_limit_is_shared_through_redis(limiter):
+    other = RateLimiter()
+    other.__dict__.update(limiter.__dict__, leases=type(limiter.leases)())
+
+    for instance in (limiter, other, limiter):
+        await instance.check(2, "GET", "orders", "orders")
+    with pytest.raises(HTTPException):
+        await other.check(2, "GET", "orders", "orders")
+
+
+async def test_redis_failure_fails_open(limiter):
+    limiter.script = None
+    for _ in range(10):
+        await limiter.check(3, "POST", "orders", "orders")
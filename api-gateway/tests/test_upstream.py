@@ -0,0 +1,173 @@
+import asyncio
+
+import httpx
+import pytest
+
+from config import settings
+from deadlines import DEADLINE_EXCEEDED_HEADER
+from upstream import CircuitBreaker, UpstreamPool, UpstreamUnavailable
+
+SLOW = "http://slow"
+FAST = "http://fast"
+BROKEN = "http://broken"
+OVERLOADED = "http://overloaded"
+EXPIRED = "http://expired"
+
+
+def body(text: str):
+    # Потоковое тело, как у настоящего соединения: пул читает его без распаковки
+    async def chunks():
+        yield text.encode()
+    return chunks()
+
+
+async def handler(request: httpx.Request) -> httpx.Response:
+    host = f"http://{request.url.host}"
+    if host == SLOW:
+        await asyncio.sleep(0.2)
+    if host == BROKEN:
+        return httpx.Response(502, content=body(host))
+    if host == OVERLOADED:
+        return httpx.Response(503, headers={"Retry-After": "1"}, content=body(host))
+    if host == EXPIRED:
+        return httpx.Response(504, headers={DEADLINE_EXCEEDED_HEADER: "1"}, content=body(host))
+    return httpx.Response(200, content=body(host))
+
+
+@pytest.fixture
+def client():
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+@pytest.fixture(autouse=True)
+def fast_hedging(monkeypatch):
+    monkeypatch.setattr(settings, "hedging_enabled", True)
+    monkeypatch.setattr(settings, "hedge_max_delay", 0.05)
+
+
+def test_breaker_opens_after_threshold_and_half_opens_after_timeout():
+    breaker = CircuitBreaker("svc", failure_threshold=2, reset_timeout=10)
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow() and not breaker.is_available()
+
+    breaker.opened_at -= 10
+    assert breaker.is_available()
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    # Пока идёт пробный запрос, остальные отклоняются
+    assert not breaker.allow() and not breaker.is_available()
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.failures == 0
+
+
+def test_failed_probe_reopens_breaker():
+    breaker = CircuitBreaker("svc", failure_threshold=5, reset_timeout=10)
+    breaker.state, breaker.opened_at = CircuitBreaker.OPEN, 0.0
+    assert breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN and not breaker.allow()
+
+
+def test_cancelled_probe_releases_half_open_slot():
+    breaker = CircuitBreaker("svc", failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.release()
+    assert breaker.allow()
+
+
+async def test_slow_primary_is_hedged_and_loser_cancelled(client):
+    pool = UpstreamPool("svc", [SLOW, FAST])
+
+    response = await pool.request(client, "GET", "/items", affinity=0, hedge=True)
+
+    assert response.raw_body.decode() == FAST
+    assert (pool.hedges, pool.hedge_wins) == (1, 1)
+    # Отменённый запрос к медленному инстансу не считается его ошибкой
+    slow = pool.instances[0].breaker
+    assert slow.state == CircuitBreaker.CLOSED and slow.failures == 0
+
+
+async def test_no_hedge_without_retry_budget(client):
+    pool = UpstreamPool("svc", [SLOW, FAST])
+    pool.retry_budget.tokens = 0
+    pool.retry_budget.min_per_second = 0
+    pool.retry_budget.ratio = 0
+
+    response = await pool.request(client, "GET", "/items", affinity=0, hedge=True)
+
+    assert response.raw_body.decode() == SLOW
+    assert pool.hedges == 0 and pool.retry_budget.denied == 1
+
+
+async def test_non_idempotent_request_is_not_hedged(client):
+    pool = UpstreamPool("svc", [SLOW, FAST])
+
+    response = await pool.request(client, "POST", "/items", affinity=0)
+
+    assert response.raw_body.decode() == SLOW and pool.hedges == 0
+
+
+async def test_5xx_opens_breaker_and_traffic_moves_to_healthy_instance(client, monkeypatch):
+    monkeypatch.setattr(settings, "hedging_enabled", False)
+    pool = UpstreamPool("svc", [BROKEN, FAST])
+    threshold = pool.instances[0].breaker.failure_threshold
+
+    for _ in range(threshold):
+        response = await pool.request(client, "GET", "/items", affinity=0)
+        assert response.status_code == 502
+
+    assert pool.instances[0].breaker.state == CircuitBreaker.OPEN
+    response = await pool.request(client, "GET", "/items", affinity=0)
+    assert response.raw_body.decode() == FAST
+
+
+async def test_all_breakers_open_raises_unavailable(client):
+    pool = UpstreamPool("svc", [BROKEN])
+    breaker = pool.instances[0].breaker
+    breaker.state, breaker.opened_at = CircuitBreaker.OPEN, float("inf")
+
+    with pytest.raises(UpstreamUnavailable):
+        await pool.request(client, "GET", "/items", affinity=0)
+
+
+@pytest.mark.parametrize("host, status", [(OVERLOADED, 503), (EXPIRED, 504)])
+async def test_intentional_rejections_do_not_open_breaker(client, monkeypatch, host, status):
+    monkeypatch.setattr(settings, "hedging_enabled", False)
+    pool = UpstreamPool("svc", [host, FAST])
+    breaker = pool.instances[0].breaker
+
+    for _ in range(breaker.failure_threshold * 3):
+        response = await pool.request(client, "POST", "/orders", affinity=0)
+        assert response.status_code == status
+
+    # Отказы контроля приёма не выводят инстанс из балансировки для остальных маршрутов
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.failures == 0
+    assert pool.candidates(0)[0] is pool.instances[0]
+
+
+async def test_503_with_retry_after_releases_half_open_probe(client):
+    pool = UpstreamPool("svc", [OVERLOADED])
+    breaker = pool.instances[0].breaker
+    breaker.state, breaker.opened_at = CircuitBreaker.OPEN, 0.0
+
+    await pool.request(client, "POST", "/orders", affinity=0)
+
+    assert breaker.state == CircuitBreaker.HALF_OPEN and breaker.allow()
+
+
+async def test_unmarked_504_still_counts_as_failure():
+    async def gateway_timeout(request):
+        return httpx.Response(504, content=body("proxy"))
+    client = httpx.AsyncClient(transport=httpx.MockTransport(gateway_timeout))
+    pool = UpstreamPool("svc", [BROKEN])
+
+    await pool.request(client, "GET", "/items", affinity=0)
+
+    assert pool.instances[0].breaker.failures == 1
@@ -0,0 +1,220 @@
+import asyncio
+import gc
+import time
+import tracemalloc
+
+import pytest
+
+import main
+from config import settings
+from serialization import dumps_str, loads
+from websocket_manager import CLOSE_GOING_AWAY, CLOSE_INTERNAL_ERROR, CLOSE_TRY_AGAIN_LATER, GatewayWebSocketManager
+
+
+class FakeSocket:
+    def __init__(self, fail_send=False):
+        self.accepted = False
+        self.sent = []
+        self.close_code = None
+        self.fail_send = fail_send
+
+    async def accept(self):
+        self.accepted = True
+
+    async def send_text(self, payload):
+        if self.fail_send:
+            raise RuntimeError("connection reset")
+        self.sent.append(payload)
+
+    async def close(self, code=1000, reason=""):
+        self.close_code = code
+
+
+@pytest.fixture
+def manager():
+    return GatewayWebSocketManager()
+
+
+async def settle(manager):
+    """Даёт отработать задачам отправки и фоновому закрытию"""
+    for _ in range(3):
+        await asyncio.sleep(0)
+    if manager._closing:
+        await asyncio.gather(*manager._closing)
+
+
+async def test_per_user_cap_rejects_with_try_again_later(manager, monkeypatch):
+    monkeypatch.setattr(settings, "ws_max_connections_per_user", 2)
+    sockets = [FakeSocket() for _ in range(3)]
+
+    conns = [await manager.connect(socket, user_id=1) for socket in sockets]
+
+    assert conns[2] is None and not sockets[2].accepted
+    assert sockets[2].close_code == CLOSE_TRY_AGAIN_LATER
+    # Другой пользователь под лимит не попадает
+    assert await manager.connect(FakeSocket(), user_id=2) is not None
+    assert manager.total == 3 and manager.stats["rejected"] == 1
+
+
+async def test_global_cap_rejects_any_user(manager, monkeypatch):
+    monkeypatch.setattr(settings, "ws_max_connections", 2)
+    for user_id in (1, 2):
+        await manager.connect(FakeSocket(), user_id=user_id)
+
+    socket = FakeSocket()
+    assert await manager.connect(socket, user_id=3) is None
+    assert socket.close_code == CLOSE_TRY_AGAIN_LATER
+
+
+async def test_idle_connection_is_reaped(manager):
+    socket = FakeSocket()
+    conn = await manager.connect(socket, user_id=1)
+    # Клиент отвечает на ping, но полезного трафика нет
+    conn.last_seen = conn.last_active + settings.ws_idle_timeout + 1
+
+    manager._heartbeat(conn.last_active + settings.ws_idle_timeout + 1)
+    await settle(manager)
+
+    assert socket.close_code == CLOSE_GOING_AWAY
+    assert manager.total == 0 and manager.connections == {}
+    assert manager.stats["idle_closed"] == 1
+
+
+async def test_pong_keeps_connection_alive(manager):
+    socket = FakeSocket()
+    conn = await manager.connect(socket, user_id=1)
+    now = time.monotonic()
+
+    for _ in range(5):
+        now += settings.ws_ping_interval
+        manager._heartbeat(now)
+        await settle(manager)
+        assert '"type":"ping"' in socket.sent[-1].replace(" ", "")
+        # Ответ приходит в пределах ws_pong_timeout
+        manager.on_client_message(conn, '{"type": "pong"}')
+        conn.last_seen = now + 1
+        conn.last_active = now
+        manager._heartbeat(now + settings.ws_pong_timeout / 2)
+
+    assert not conn.closed and conn.ping_sent_at is None and conn.rtt is not None
+    assert manager.stats["pong_timeouts"] == 0
+
+
+async def test_missing_pong_closes_connection(manager):
+    socket = FakeSocket()
+    conn = await manager.connect(socket, user_id=1)
+    now = conn.last_seen + settings.ws_ping_interval
+
+    manager._heartbeat(now)
+    manager._heartbeat(now + settings.ws_pong_timeout + 1)
+    await settle(manager)
+
+    assert socket.close_code == CLOSE_GOING_AWAY
+    assert manager.stats["pong_timeouts"] == 1 and manager.total == 0
+
+
+async def test_failed_send_unregisters_connection(manager):
+    socket = FakeSocket(fail_send=True)
+    conn = await manager.connect(socket, user_id=1)
+
+    assert await manager.send_encoded(1, '{"type": "order_update"}')
+    await settle(manager)
+
+    assert conn.closed and socket.close_code == CLOSE_INTERNAL_ERROR
+    assert manager.connections == {} and manager.total == 0 and manager.pending_bytes == 0
+    # Следующие события мёртвому сокету не отправляются
+    assert not await manager.send_encoded(1, '{"type": "order_update"}')
+
+
+async def test_slow_client_is_disconnected(manager, monkeypatch):
+    monkeypatch.setattr(settings, "ws_max_pending_bytes", 100)
+    socket = FakeSocket()
+    conn = await manager.connect(socket, user_id=1)
+
+    # Отправляющая задача не успевает запуститься между вызовами - очередь растёт
+    for _ in range(5):
+        await manager.send_encoded(1, "x" * 30)
+    await settle(manager)
+
+    assert conn.closed and socket.close_code == CLOSE_TRY_AGAIN_LATER
+    assert manager.stats["slow_closed"] == 1 and manager.pending_bytes == 0
+
+
+async def test_connection_churn_keeps_memory_flat(manager):
+    # Soak: 100k подключений и отключений, часть - через ошибку отправки
+    async def churn(count):
+        for n in range(count):
+            socket = FakeSocket(fail_send=n % 10 == 0)
+            conn = await manager.connect(socket, user_id=n % 1000)
+            await manager.send_encoded(conn.user_id, '{"type": "order_update"}')
+            await asyncio.sleep(0)
+            await manager.disconnect(conn)
+        await settle(manager)
+
+    await churn(10_000)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        await churn(100_000)
+        gc.collect()
+        grown = tracemalloc.get_traced_memory()[0] - baseline
+    finally:
+        tracemalloc.stop()
+
+    assert manager.total == 0 and manager.connections == {} and manager.pending_bytes == 0
+    assert not manager._closing
+    # Рост не зависит от числа соединений: меньше 1 байта на подключение
+    assert grown < 100_000
+
+
+class FakePubSub:
+    def __init__(self, payloads):
+        self.payloads = payloads
+
+    async def subscribe(self, channel):
+        pass
+
+    async def listen(self):
+        yield {"type": "subscribe", "data": 1}
+        for payload in self.payloads:
+            yield {"type": "message", "data": payload}
+
+
+class FakeRedis:
+    def __init__(self, payloads):
+        self.payloads = payloads
+
+    def pubsub(self):
+        return FakePubSub(self.payloads)
+
+
+def order_update(status, event_id=None):
+    return dumps_str({"type": "order_update", "event_id": event_id or f"order:1:{status}",
+                      "order_id": 1, "user_id": 7, "status": status})
+
+
+def test_is_new_event_forgets_oldest_beyond_window(manager, monkeypatch):
+    monkeypatch.setattr(settings, "ws_event_dedup_window", 2)
+
+    assert manager.is_new_event("a") and manager.is_new_event("b")
+    assert not manager.is_new_event("a")
+    assert manager.is_new_event("c")
+    # "a" вытеснено из окна и снова считается новым
+    assert manager.is_new_event("a")
+
+
+async def test_repeated_redis_event_reaches_client_once(manager, monkeypatch):
+    monkeypatch.setattr(main, "gateway_ws_manager", manager)
+    socket = FakeSocket()
+    await manager.connect(socket, user_id=7)
+    # Воркер результатов оплат обработал сообщение дважды, воркер таймаутов прислал тот же переход
+    manager.redis_client = FakeRedis([
+        order_update("FINISHED"), order_update("FINISHED"), order_update("FINISHED"), order_update("CANCELLED"),
+    ])
+
+    await main.listen_for_order_updates()
+    await settle(manager)
+
+    assert [loads(payload)["status"] for payload in socket.sent] == ["FINISHED", "CANCELLED"]
+    assert manager.stats["skipped_duplicate"] == 2
@@ -0,0 +1,305 @@
+"""
+Отказоустойчивые вызовы микросервисов из API Gateway.
+
+- CircuitBreaker на каждый инстанс: после серии ошибок (сбой соединения, 5xx) инстанс
+  исключается из балансировки, и запросы к нему сразу отклоняются, пока не пройдёт
+  пробный запрос. Намеренные отказы сервиса (is_backpressure) ошибками не считаются.
+- Хеджирование идемпотентных запросов: если основной инстанс не ответил за p95
+  своей задержки, тот же запрос отправляется другому здоровому инстансу,
+  и используется первый успешный ответ.
+- RetryBudget: хеджи и повторы тратят токены, которые накапливаются пропорционально
+  основным запросам, поэтому при деградации сервиса повторы не умножают нагрузку.
+"""
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from typing import List, Optional
+
+import httpx
+
+from config import settings
+from deadlines import DEADLINE_EXCEEDED_HEADER
+
+logger = logging.getLogger(__name__)
+
+
+class UpstreamUnavailable(Exception):
+    """Нет ни одного инстанса сервиса, готового принять запрос"""
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+
+    def allow(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self.state = self.HALF_OPEN
+        # HALF_OPEN: пропускаем только один пробный запрос
+        if self.probe_in_flight:
+            return False
+        self.probe_in_flight = True
+        return True
+
+    def is_available(self) -> bool:
+        """Проверка без захвата пробного запроса (для выбора инстанса)"""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            return time.monotonic() - self.opened_at >= self.reset_timeout
+        return not self.probe_in_flight
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self.probe_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.probe_in_flight = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logger.warning(f"Circuit breaker opened for {self.name}")
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def release(self):
+        """Пробный запрос отменён, не дождавшись результата"""
+        self.probe_in_flight = False
+
+
+class LatencyTracker:
+    """Скользящее окно задержек с ленивым пересчётом p95"""
+
+    def __init__(self, window: int):
+        self.samples = deque(maxlen=window)
+        self._p95: Optional[float] = None
+        self._dirty = 0
+
+    def record(self, latency: float):
+        self.samples.append(latency)
+        self._dirty += 1
+
+    def p95(self) -> Optional[float]:
+        if not self.samples:
+            return None
+        # Пересчитываем не чаще, чем раз в 1/10 окна, чтобы сортировка не попала на горячий путь
+        if self._p95 is None or self._dirty >= max(1, self.samples.maxlen // 10):
+            ordered = sorted(self.samples)
+            self._p95 = ordered[min(len(ordered) - 1, math.ceil(len(ordered) * 0.95) - 1)]
+            self._dirty = 0
+        return self._p95
+
+
+class RetryBudget:
+    """Токены на повторы: ratio за каждый основной запрос плюс min_per_second в секунду"""
+
+    def __init__(self, ratio: float, min_per_second: float, max_tokens: float):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+        self.updated_at = time.monotonic()
+        self.spent = 0
+        self.denied = 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.max_tokens, self.tokens + (now - self.updated_at) * self.min_per_second)
+        self.updated_at = now
+
+    def deposit(self):
+        self._refill()
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            self.spent += 1
+            return True
+        self.denied += 1
+        return False
+
+
+class UpstreamResponse:
+    """
+    Ответ инстанса: статус и заголовки httpx.Response и тело без распаковки (raw_body),
+    чтобы сжатый ответ сервиса можно было переслать клиенту как есть. У потокового
+    ответа raw_body - None: тело читает из response и закрывает вызывающий код.
+    """
+
+    def __init__(self, response: httpx.Response, raw_body: Optional[bytes] = None):
+        self.response = response
+        self.raw_body = raw_body
+
+    @property
+    def status_code(self) -> int:
+        return self.response.status_code
+
+    @property
+    def headers(self) -> httpx.Headers:
+        return self.response.headers
+
+
+class Upstream:
+    def __init__(self, base_url: str):
+        self.base_url = base_url.rstrip("/")
+        self.breaker = CircuitBreaker(self.base_url, settings.breaker_failure_threshold, settings.breaker_reset_timeout)
+        self.latency = LatencyTracker(settings.hedge_latency_window)
+
+
+class UpstreamPool:
+    """Набор инстансов одного микросервиса"""
+
+    def __init__(self, service_name: str, base_urls: List[str]):
+        self.service_name = service_name
+        self.instances = [Upstream(url) for url in base_urls]
+        self.retry_budget = RetryBudget(
+            settings.retry_budget_ratio,
+            settings.retry_budget_min_per_second,
+            settings.retry_budget_max_tokens
+        )
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def candidates(self, affinity: int) -> List[Upstream]:
+        """Инстансы в порядке предпочтения: закреплённый за пользователем, затем остальные"""
+        n = len(self.instances)
+        start = affinity % n
+        ordered = [self.instances[(start + i) % n] for i in range(n)]
+        return [u for u in ordered if u.breaker.is_available()]
+
+    def hedge_delay(self, upstream: Upstream) -> float:
+        p95 = upstream.latency.p95()
+        if p95 is None:
+            return settings.hedge_max_delay
+        return min(settings.hedge_max_delay, max(settings.hedge_min_delay, p95))
+
+    async def _attempt(self, client: httpx.AsyncClient, upstream: Upstream, method: str, path: str,
+                       stream: bool = False, **kwargs) -> UpstreamResponse:
+        if not upstream.breaker.allow():
+            raise UpstreamUnavailable(f"Circuit breaker open for {upstream.base_url}")
+
+        started = time.monotonic()
+        url = f"{upstream.base_url}/{path.lstrip('/')}"
+        raw_body = None
+        try:
+            response = await client.send(client.build_request(method, url, **kwargs), stream=True)
+            if not stream:
+                # Тело читается без распаковки
+                try:
+                    raw_body = b"".join([chunk async for chunk in response.aiter_raw()])
+                finally:
+                    await response.aclose()
+        except httpx.TransportError:
+            upstream.breaker.record_failure()
+            raise
+        except asyncio.CancelledError:
+            # Проигравший хедж отменяется - это не ошибка инстанса
+            upstream.breaker.release()
+            raise
+
+        upstream.latency.record(time.monotonic() - started)
+        if is_backpressure(response):
+            # Инстанс работает и сам просит повторить позже - это не ошибка инстанса
+            upstream.breaker.release()
+        elif response.status_code >= 500:
+            upstream.breaker.record_failure()
+        else:
+            upstream.breaker.record_success()
+        return UpstreamResponse(response, raw_body)
+
+    async def request(self, client: httpx.AsyncClient, method: str, path: str,
+                      affinity: int, hedge: bool = False, stream: bool = False, **kwargs) -> UpstreamResponse:
+        candidates = self.candidates(affinity)
+        if not candidates:
+            raise UpstreamUnavailable(f"No healthy instances of '{self.service_name}'")
+
+        self.retry_budget.deposit()
+        primary = candidates[0]
+        # Потоковые ответы не хеджируются: проигравший поток пришлось бы закрывать отдельно
+        if stream or not (hedge and settings.hedging_enabled and len(candidates) > 1):
+            return await self._attempt(client, primary, method, path, stream=stream, **kwargs)
+
+        first = asyncio.create_task(self._attempt(client, primary, method, path, **kwargs))
+        tasks = [first]
+        try:
+            done, _ = await asyncio.wait({first}, timeout=self.hedge_delay(primary))
+            if done and _is_success(first):
+                return first.result()
+
+            # Основной запрос медленный или завершился ошибкой - хеджируем, если позволяет бюджет
+            if not self.retry_budget.withdraw():
+                return await first
+
+            self.hedges += 1
+            second = asyncio.create_task(self._attempt(client, candidates[1], method, path, **kwargs))
+            tasks.append(second)
+            pending = {second} if done else {first, second}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if _is_success(task):
+                        if task is second:
+                            self.hedge_wins += 1
+                        return task.result()
+
+            # Оба запроса неуспешны: отдаём ответ с ошибкой, если он есть, иначе исключение
+            for task in reversed(tasks):
+                if task.exception() is None:
+                    return task.result()
+            raise tasks[-1].exception()
+        finally:
+            # Проигравший (или брошенный клиентом) запрос отменяем
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def snapshot(self) -> dict:
+        return {
+            "instances": {
+                u.base_url: {"breaker": u.breaker.state, "p95": u.latency.p95()}
+                for u in self.instances
+            },
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "retry_budget": {
+                "tokens": round(self.retry_budget.tokens, 2),
+                "spent": self.retry_budget.spent,
+                "denied": self.retry_budget.denied,
+            },
+        }
+
+
+def is_backpressure(response: httpx.Response) -> bool:
+    """
+    Отказ, который сервис вернул намеренно: 503 с Retry-After от контроля приёма заказов
+    или 504 с X-Deadline-Exceeded, когда истёк бюджет запроса. Такой ответ не считается
+    ни ошибкой, ни успехом для circuit breaker - иначе отклонённые под нагрузкой
+    POST /orders открыли бы breaker для всех маршрутов инстанса
+    """
+    if response.status_code == 503:
+        return "retry-after" in response.headers
+    if response.status_code == 504:
+        return DEADLINE_EXCEEDED_HEADER in response.headers
+    return False
+
+
+def _is_success(task: asyncio.Task) -> bool:
+    return task.exception() is None and task.result().status_code < 500
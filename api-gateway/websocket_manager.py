@@ -0,0 +1,284 @@
+"""
+WebSocket-соединения клиентов API Gateway.
+
+- У пользователя может быть несколько соединений (вкладки браузера); их число
+  ограничено на пользователя (ws_max_connections_per_user) и на весь Gateway (ws_max_connections).
+- Сервер сам отправляет {"type": "ping"} соединениям, от которых ничего не приходило
+  ws_ping_interval секунд. Если клиент не ответил за ws_pong_timeout, соединение закрывается.
+  Любое сообщение клиента считается признаком жизни.
+- Соединения без полезного трафика (кроме ping/pong) дольше ws_idle_timeout закрываются.
+- Исходящие сообщения ставятся в очередь соединения и отправляются отдельной задачей,
+  поэтому медленный клиент не задерживает рассылку остальным. Размер очереди
+  учитывается в байтах на соединение и суммарно; клиент, у которого в очереди
+  накопилось больше ws_max_pending_bytes, отключается.
+- Событие из Redis с уже виденным event_id (воркер результатов оплат и воркер
+  таймаутов, повторная доставка сообщения) клиентам не пересылается; помнятся
+  последние ws_event_dedup_window идентификаторов.
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from typing import Dict, Optional, Set
+
+import redis.asyncio as aioredis
+from fastapi import WebSocket
+
+from config import settings
+from serialization import DecodeError, dumps_str, loads
+
+logger = logging.getLogger(__name__)
+
+# Коды закрытия WebSocket (RFC 6455)
+CLOSE_GOING_AWAY = 1001
+CLOSE_INTERNAL_ERROR = 1011
+CLOSE_TRY_AGAIN_LATER = 1013
+
+
+class ClientConnection:
+    """Одно WebSocket-соединение и его учёт"""
+    __slots__ = (
+        "websocket", "user_id", "connected_at", "last_seen", "last_active", "ping_sent_at", "rtt",
+        "queue", "pending_bytes", "wakeup", "closed", "sender", "bytes_sent", "bytes_received",
+    )
+
+    def __init__(self, websocket: WebSocket, user_id: int):
+        now = time.monotonic()
+        self.websocket = websocket
+        self.user_id = user_id
+        self.connected_at = now
+        # Последнее сообщение от клиента (включая pong)
+        self.last_seen = now
+        # Последний полезный трафик в любую сторону
+        self.last_active = now
+        self.ping_sent_at: Optional[float] = None
+        self.rtt: Optional[float] = None
+        self.queue: deque = deque()
+        self.pending_bytes = 0
+        self.wakeup = asyncio.Event()
+        self.closed = False
+        self.sender: Optional[asyncio.Task] = None
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+
+class GatewayWebSocketManager:
+    def __init__(self):
+        self.connections: Dict[int, Set[ClientConnection]] = {}
+        self.total = 0
+        # Суммарный объём исходящих очередей всех соединений
+        self.pending_bytes = 0
+        self.redis_url = os.getenv("REDIS_URL", "redis://localhost:6379")
+        self.redis_client = None
+        # Задачи закрытия, запущенные в фоне (ссылки держим, чтобы их не собрал GC)
+        self._closing: Set[asyncio.Task] = set()
+        self.seen_events: "OrderedDict[str, None]" = OrderedDict()
+        self.stats = {
+            "accepted": 0, "rejected": 0, "closed": 0,
+            "pong_timeouts": 0, "idle_closed": 0, "slow_closed": 0, "skipped_duplicate": 0,
+        }
+
+    def is_new_event(self, event_id: str) -> bool:
+        """Запоминает event_id; False, если событие уже пересылалось"""
+        if event_id in self.seen_events:
+            self.stats["skipped_duplicate"] += 1
+            return False
+        self.seen_events[event_id] = None
+        if len(self.seen_events) > settings.ws_event_dedup_window:
+            self.seen_events.popitem(last=False)
+        return True
+
+    async def connect_redis(self):
+        """Подключение к Redis для получения обновлений от сервисов"""
+        try:
+            self.redis_client = aioredis.from_url(
+                self.redis_url,
+                decode_responses=True,
+                encoding='utf-8'
+            )
+            logger.info("Gateway connected to Redis")
+        except Exception as e:
+            logger.error(f"Failed to connect to Redis: {e}")
+
+    async def disconnect_redis(self):
+        """Отключение от Redis"""
+        if self.redis_client:
+            await self.redis_client.close()
+            logger.info("Gateway disconnected from Redis")
+
+    async def connect(self, websocket: WebSocket, user_id: int) -> Optional[ClientConnection]:
+        """Принимает соединение или отклоняет его при превышении лимитов (возвращает None)"""
+        user_connections = self.connections.get(user_id, ())
+        if self.total >= settings.ws_max_connections or len(user_connections) >= settings.ws_max_connections_per_user:
+            self.stats["rejected"] += 1
+            logger.warning(f"WebSocket connection limit reached, rejecting user {user_id}")
+            await websocket.close(code=CLOSE_TRY_AGAIN_LATER)
+            return None
+
+        await websocket.accept()
+        conn = ClientConnection(websocket, user_id)
+        self.connections.setdefault(user_id, set()).add(conn)
+        self.total += 1
+        self.stats["accepted"] += 1
+        conn.sender = asyncio.create_task(self._sender(conn))
+        logger.info(f"User {user_id} connected to Gateway WebSocket")
+        return conn
+
+    def _drop(self, conn: ClientConnection) -> bool:
+        """Снимает соединение с учёта и освобождает его очередь. Идемпотентно."""
+        if conn.closed:
+            return False
+        conn.closed = True
+
+        user_connections = self.connections.get(conn.user_id)
+        if user_connections is not None:
+            user_connections.discard(conn)
+            if not user_connections:
+                del self.connections[conn.user_id]
+        self.total -= 1
+        self.stats["closed"] += 1
+
+        self.pending_bytes -= conn.pending_bytes
+        conn.pending_bytes = 0
+        conn.queue.clear()
+        conn.wakeup.set()
+        if conn.sender is not None and conn.sender is not asyncio.current_task():
+            conn.sender.cancel()
+        return True
+
+    async def _close(self, conn: ClientConnection, code: int, reason: str = ""):
+        try:
+            await conn.websocket.close(code=code, reason=reason)
+        except Exception:
+            # Соединение уже закрыто клиентом или оборвано
+            pass
+
+    def _close_later(self, conn: ClientConnection, code: int, reason: str):
+        """Снимает соединение с учёта сразу, а закрывает в фоне"""
+        if self._drop(conn):
+            task = asyncio.create_task(self._close(conn, code, reason))
+            self._closing.add(task)
+            task.add_done_callback(self._closing.discard)
+
+    async def disconnect(self, conn: ClientConnection, code: int = 1000, reason: str = ""):
+        if self._drop(conn):
+            await self._close(conn, code, reason)
+            logger.info(f"User {conn.user_id} disconnected from Gateway WebSocket")
+
+    def _enqueue(self, conn: ClientConnection, payload: str) -> bool:
+        size = len(payload)
+        if conn.pending_bytes + size > settings.ws_max_pending_bytes:
+            # Клиент не успевает читать - отключаем, он переподключится и перечитает данные
+            self.stats["slow_closed"] += 1
+            logger.warning(f"WebSocket of user {conn.user_id} is too slow, {conn.pending_bytes} bytes pending")
+            self._close_later(conn, CLOSE_TRY_AGAIN_LATER, "Client too slow")
+            return False
+        conn.queue.append(payload)
+        conn.pending_bytes += size
+        self.pending_bytes += size
+        conn.wakeup.set()
+        return True
+
+    async def _sender(self, conn: ClientConnection):
+        """Отправляет очередь соединения по мере готовности клиента"""
+        try:
+            while not conn.closed:
+                if not conn.queue:
+                    conn.wakeup.clear()
+                    await conn.wakeup.wait()
+                    continue
+                payload = conn.queue.popleft()
+                size = len(payload)
+                conn.pending_bytes -= size
+                self.pending_bytes -= size
+                await conn.websocket.send_text(payload)
+                conn.bytes_sent += size
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.info(f"Error sending to user {conn.user_id}: {e}")
+            self._close_later(conn, CLOSE_INTERNAL_ERROR, "Send failed")
+
+    async def send_to_user(self, user_id: int, message: dict):
+        """Отправка сообщения пользователю через Gateway"""
+        return await self.send_encoded(user_id, dumps_str(message))
+
+    async def send_encoded(self, user_id: int, payload: str) -> bool:
+        """Ставит уже сериализованное сообщение в очередь всех соединений пользователя"""
+        user_connections = self.connections.get(user_id)
+        if not user_connections:
+            return False
+        now = time.monotonic()
+        delivered = False
+        for conn in list(user_connections):
+            if self._enqueue(conn, payload):
+                conn.last_active = now
+                delivered = True
+        return delivered
+
+    def send(self, conn: ClientConnection, message: dict) -> bool:
+        return self._enqueue(conn, dumps_str(message))
+
+    def on_client_message(self, conn: ClientConnection, text: str):
+        """Учёт входящего сообщения и ответы на heartbeat-сообщения"""
+        now = time.monotonic()
+        conn.last_seen = now
+        conn.bytes_received += len(text)
+        if conn.ping_sent_at is not None:
+            conn.rtt = now - conn.ping_sent_at
+            conn.ping_sent_at = None
+
+        try:
+            data = loads(text)
+        except DecodeError:
+            return
+        message_type = data.get("type") if isinstance(data, dict) else None
+        if message_type == "pong":
+            return
+        if message_type == "ping":
+            # Клиентский ping (старые версии фронтенда)
+            self.send(conn, {"type": "pong", "timestamp": time.time()})
+            return
+        conn.last_active = now
+
+    async def run_heartbeat(self):
+        """Фоновая задача: ping клиентов, закрытие мёртвых и простаивающих соединений"""
+        tick = max(1.0, min(settings.ws_ping_interval, settings.ws_pong_timeout) / 2)
+        while True:
+            await asyncio.sleep(tick)
+            try:
+                self._heartbeat(time.monotonic())
+            except Exception as e:
+                logger.error(f"WebSocket heartbeat error: {e}")
+
+    def _heartbeat(self, now: float):
+        ping = None
+        for user_connections in list(self.connections.values()):
+            for conn in list(user_connections):
+                if conn.ping_sent_at is not None:
+                    if now - conn.ping_sent_at > settings.ws_pong_timeout:
+                        self.stats["pong_timeouts"] += 1
+                        self._close_later(conn, CLOSE_GOING_AWAY, "Pong timeout")
+                    continue
+                if now - conn.last_active > settings.ws_idle_timeout:
+                    self.stats["idle_closed"] += 1
+                    self._close_later(conn, CLOSE_GOING_AWAY, "Idle timeout")
+                    continue
+                if now - conn.last_seen >= settings.ws_ping_interval:
+                    if ping is None:
+                        ping = dumps_str({"type": "ping", "timestamp": time.time()})
+                    if self._enqueue(conn, ping):
+                        conn.ping_sent_at = now
+
+    def snapshot(self) -> dict:
+        return {
+            "connections": self.total,
+            "users": len(self.connections),
+            "pending_bytes": self.pending_bytes,
+            **self.stats,
+        }
+
+
+# Создаем глобальный экземпляр менеджера
+gateway_ws_manager = GatewayWebSocketManager()
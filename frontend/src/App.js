@@ -23,8 +23,8 @@ function App() {
   const [darkMode, setDarkMode] = useState(() => JSON.parse(localStorage.getItem('darkMode')) || false);
 
   // Подключаем логику (хуки)
-  const { account, orders, loading, fetchData, actions } = useShopData(API_URL, userId, darkMode);
-  const wsConnected = useWebSocket(WS_URL, userId, fetchData, darkMode);
+  const { account, orders, loading, fetchData, applyOrderUpdate, scheduleReconcile, actions } = useShopData(API_URL, userId, darkMode);
+  const wsConnected = useWebSocket(WS_URL, userId, applyOrderUpdate, darkMode, scheduleReconcile);
 
   // Эффект темы
   useEffect(() => {
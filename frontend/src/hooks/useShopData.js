@@ -1,7 +1,19 @@
-import { useState, useCallback, useEffect } from 'react';
+import { useState, useCallback, useEffect, useRef } from 'react';
 import axios from 'axios';
 import { toast } from 'react-toastify';
 
+// Задержка сверки с сервером: несколько событий подряд дают один запрос
+const RECONCILE_DELAY_MS = 2000;
+
+// Вставка заказа в список или обновление существующего.
+// Статус из WebSocket-события новее статуса из ответа POST, поэтому он сохраняется.
+const upsertOrder = (orders, order) => {
+  if (!orders.some((o) => o.id === order.id)) {
+    return [order, ...orders];
+  }
+  return orders.map((o) => (o.id === order.id ? { ...order, status: o.status } : o));
+};
+
 // Кастомный хук для управления данными магазина
 export const useShopData = (apiUrl, userId, darkMode) => {
   // Состояния для хранения данных
@@ -38,13 +50,74 @@ export const useShopData = (apiUrl, userId, darkMode) => {
     fetchData();
   }, [fetchData]);
 
+  // Отложенная сверка с сервером (дебаунс)
+  const reconcileTimer = useRef(null);
+  const scheduleReconcile = useCallback(() => {
+    clearTimeout(reconcileTimer.current);
+    reconcileTimer.current = setTimeout(fetchData, RECONCILE_DELAY_MS);
+  }, [fetchData]);
+
+  useEffect(() => () => clearTimeout(reconcileTimer.current), []);
+
+  // Применение события order_update к локальному состоянию без перезапроса данных
+  const ordersRef = useRef(orders);
+  ordersRef.current = orders;
+
+  // Заказы этой вкладки, на которые ещё не пришёл ответ POST. Сервис рассылает событие NEW
+  // до ответа, поэтому оно обычно приходит раньше: такие события откладываются до ответа
+  const pendingCreates = useRef(0);
+  const earlyUpdates = useRef(new Map());
+
+  const applyUpdate = useCallback((update) => {
+    const known = ordersRef.current.some((o) => o.id === update.order_id);
+    setOrders((prev) => {
+      if (!prev.some((o) => o.id === update.order_id)) {
+        // Заказ создан в другой вкладке: показываем его сразу, остальное подтянет сверка
+        return [{
+          id: update.order_id,
+          user_id: update.user_id,
+          amount: update.amount,
+          description: null,
+          status: update.status,
+          created_at: new Date().toISOString()
+        }, ...prev];
+      }
+      return prev.map((o) => (o.id === update.order_id ? { ...o, status: update.status } : o));
+    });
+
+    // После успешной оплаты событие несёт новый баланс
+    if (update.remaining_balance !== undefined && update.remaining_balance !== null) {
+      setAccount((prev) => (prev ? { ...prev, balance: update.remaining_balance } : prev));
+    }
+
+    if (!known) scheduleReconcile();
+  }, [scheduleReconcile]);
+
+  const applyOrderUpdate = useCallback((update) => {
+    const known = ordersRef.current.some((o) => o.id === update.order_id);
+    if (!known && pendingCreates.current > 0) {
+      // Возможно, это заказ, который создаётся сейчас: статус применится вместе с ответом POST
+      earlyUpdates.current.set(update.order_id, update);
+      return;
+    }
+    applyUpdate(update);
+  }, [applyUpdate]);
+
+  // Отложенные события, не совпавшие ни с одним ответом POST, - заказы из других вкладок
+  const flushEarlyUpdates = () => {
+    if (pendingCreates.current > 0) return;
+    const leftovers = [...earlyUpdates.current.values()];
+    earlyUpdates.current.clear();
+    leftovers.forEach(applyUpdate);
+  };
+
   // Объект с действиями
   const actions = {
     // Создание нового счета
     createAccount: async () => {
       try {
-        await axios.post(`${apiUrl}/api/payments/accounts`, {}, { headers: { 'X-User-ID': userId } });
-        await fetchData(); // Обновляем интерфейс
+        const res = await axios.post(`${apiUrl}/api/payments/accounts`, {}, { headers: { 'X-User-ID': userId } });
+        setAccount(res.data); // Ответ уже содержит созданный счет
         toast.success('Счет успешно создан!', { theme: darkMode ? "dark" : "colored" });
       } catch (e) {
         toast.error('Не удалось создать счет. Возможно, он уже существует.');
@@ -54,8 +127,8 @@ export const useShopData = (apiUrl, userId, darkMode) => {
     // Пополнение счета
     topupAccount: async (amount) => {
       try {
-        await axios.post(`${apiUrl}/api/payments/accounts/topup`, { amount }, { headers: { 'X-User-ID': userId } });
-        await fetchData(); // Обновляем баланс
+        const res = await axios.post(`${apiUrl}/api/payments/accounts/topup`, { amount }, { headers: { 'X-User-ID': userId } });
+        setAccount(res.data); // Ответ содержит новый баланс
         toast.success(`Баланс пополнен на ${amount} ₽`, { theme: darkMode ? "dark" : "colored" });
       } catch (e) {
         toast.error('Ошибка при пополнении счета');
@@ -64,17 +137,29 @@ export const useShopData = (apiUrl, userId, darkMode) => {
 
     // Создание нового заказа
     createOrder: async (form) => {
+      pendingCreates.current += 1;
       try {
-        await axios.post(`${apiUrl}/api/orders/orders`, form, { headers: { 'X-User-ID': userId } });
+        const res = await axios.post(`${apiUrl}/api/orders/orders`, form, { headers: { 'X-User-ID': userId } });
+        // Заказ добавляется из ответа, смену статуса принесёт WebSocket.
+        // ref обновляется сразу: следующее событие по заказу может прийти до перерисовки
+        ordersRef.current = upsertOrder(ordersRef.current, res.data);
+        setOrders((prev) => upsertOrder(prev, res.data));
+        // Событие, пришедшее раньше ответа, новее его
+        const early = earlyUpdates.current.get(res.data.id);
+        if (early) {
+          earlyUpdates.current.delete(res.data.id);
+          applyUpdate(early);
+        }
         toast.success('Заказ успешно оформлен! Ожидайте обработки...', { theme: darkMode ? "dark" : "colored" });
-        // Небольшая задержка перед обновлением списка, чтобы успела пройти асинхронная обработка
-        setTimeout(fetchData, 1000);
       } catch (e) {
         toast.error('Не удалось создать заказ. Проверьте данные.');
+      } finally {
+        pendingCreates.current -= 1;
+        flushEarlyUpdates();
       }
     }
   };
 
   // Возвращаем данные и функции для использования в компонентах
-  return { account, orders, loading, fetchData, actions };
+  return { account, orders, loading, fetchData, applyOrderUpdate, scheduleReconcile, actions };
 };
\ No newline at end of file
@@ -2,13 +2,23 @@ import { useEffect, useState, useRef } from 'react';
 import { toast } from 'react-toastify';
 
 // Кастомный хук для управления WebSocket соединением
-export const useWebSocket = (url, userId, onOrderUpdate, darkMode) => {
+// onOrderUpdate получает данные события order_update, onReconnect вызывается после переподключения
+// (пока соединения не было, события могли быть пропущены)
+export const useWebSocket = (url, userId, onOrderUpdate, darkMode, onReconnect) => {
   // Состояние подключения (для отображения индикатора Online/Offline)
   const [isConnected, setIsConnected] = useState(false);
   // Используем useRef, чтобы хранить объект сокета между рендерами без вызова перерисовки
   const wsRef = useRef(null);
 
+  // Колбэки и тема читаются через ref, чтобы их смена не пересоздавала соединение
+  const handlersRef = useRef({ onOrderUpdate, onReconnect, darkMode });
+  handlersRef.current = { onOrderUpdate, onReconnect, darkMode };
+
   useEffect(() => {
+    let reconnectTimer = null;
+    let disposed = false;
+    let connectedBefore = false;
+
     // Функция создания соединения
     const connect = () => {
       try {
@@ -19,9 +29,11 @@ export const useWebSocket = (url, userId, onOrderUpdate, darkMode) => {
         // Обработчик успешного подключения
         ws.onopen = () => {
           setIsConnected(true);
+          if (connectedBefore) handlersRef.current.onReconnect?.();
+          connectedBefore = true;
           toast.success('✅ Соединение с сервером установлено!', {
             position: "bottom-right",
-            theme: darkMode ? "dark" : "colored",
+            theme: handlersRef.current.darkMode ? "dark" : "colored",
             autoClose: 1000,
             hideProgressBar: true
           });
@@ -32,6 +44,12 @@ export const useWebSocket = (url, userId, onOrderUpdate, darkMode) => {
           try {
             const data = JSON.parse(event.data);
 
+            // Сервер проверяет, что соединение живо - отвечаем сразу
+            if (data.type === 'ping') {
+              ws.send(JSON.stringify({ type: 'pong', timestamp: data.timestamp }));
+              return;
+            }
+
             // Если пришло событие об обновлении заказа
             if (data.type === 'order_update') {
               // Не показываем уведомление для статуса NEW,
@@ -41,12 +59,11 @@ export const useWebSocket = (url, userId, onOrderUpdate, darkMode) => {
                   position: "bottom-right",
                   autoClose: 1000,
                   hideProgressBar: true,
-                  theme: darkMode ? "dark" : "colored"
+                  theme: handlersRef.current.darkMode ? "dark" : "colored"
                 });
               }
-              // Вызываем функцию обновления данных ,
-              // чтобы в таблице обновились статусы и баланс
-              if (onOrderUpdate) onOrderUpdate();
+              // Применяем событие к локальному состоянию (статус заказа и баланс)
+              handlersRef.current.onOrderUpdate?.(data);
             }
           } catch (e) {
             console.error('Ошибка обработки сообщения WebSocket:', e);
@@ -56,9 +73,11 @@ export const useWebSocket = (url, userId, onOrderUpdate, darkMode) => {
         // Обработчик закрытия соединения
         ws.onclose = () => {
           setIsConnected(false);
+          // Соединение закрыто при размонтировании или смене пользователя - не переподключаемся
+          if (disposed) return;
           console.log('Соединение разорвано. Попытка переподключения...');
           // Пытаемся восстановить соединение через 3 секунды
-          setTimeout(connect, 3000);
+          reconnectTimer = setTimeout(connect, 3000);
         };
       } catch (e) {
         console.error('Ошибка при создании WebSocket:', e);
@@ -68,8 +87,12 @@ export const useWebSocket = (url, userId, onOrderUpdate, darkMode) => {
     connect();
 
     // Функция очистки при размонтировании компонента
-    return () => wsRef.current?.close();
-  }, [url, userId, onOrderUpdate, darkMode]);
+    return () => {
+      disposed = true;
+      clearTimeout(reconnectTimer);
+      wsRef.current?.close();
+    };
+  }, [url, userId]);
 
   return isConnected;
 };
\ No newline at end of file
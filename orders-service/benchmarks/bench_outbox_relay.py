@@ -0,0 +1,88 @@
+"""
+Пропускная способность outbox relay с брокером-заглушкой: ответ брокера (tx.commit-ok
+или подтверждение публикации) приходит через CONFIRM_LATENCY (сетевой RTT до RabbitMQ).
+Outbox - файл SQLite.
+
+Сравниваются текущая схема (сообщения пачки пишутся в транзакционный канал по очереди,
+пачка фиксируется одним commit) и ожидание подтверждения каждого сообщения перед следующим.
+Запуск из каталога сервиса: python benchmarks/bench_outbox_relay.py
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, insert  # noqa: E402
+
+from models import Base, OutboxMessage  # noqa: E402
+from outbox_relay import OutboxRelay  # noqa: E402
+
+MESSAGES = 5_000
+BATCH_SIZES = (10, 100)
+CONFIRM_LATENCY = 0.001
+
+
+class FakeExchange:
+    async def publish(self, message, routing_key):
+        # Без подтверждений publish ждёт только записи кадров в соединение
+        await asyncio.sleep(0)
+
+
+class FakeTransaction:
+    async def commit(self):
+        await asyncio.sleep(CONFIRM_LATENCY)
+
+
+class FakeChannel:
+    is_closed = False
+    default_exchange = FakeExchange()
+
+    def transaction(self):
+        return FakeTransaction()
+
+
+class AwaitEachRelay(OutboxRelay):
+    async def _publish(self, channel, rows):
+        for row in rows:
+            await channel.default_exchange.publish(row[1], routing_key=self._routing_key(row))
+            await asyncio.sleep(CONFIRM_LATENCY)
+        return [row[0] for row in rows]
+
+
+def make_outbox(path):
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(insert(OutboxMessage), [
+            {"event_type": "order_created", "event_data": b"{}", "routing_key": "orders.to_pay.p0"}
+            for _ in range(MESSAGES)
+        ])
+    return engine
+
+
+async def drain(relay_class, batch_size):
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = make_outbox(os.path.join(tmp, "outbox.db"))
+        relay = relay_class(engine, OutboxMessage, default_routing_key="orders.to_pay", batch_size=batch_size)
+        await relay._in_db_thread(relay._acquire)
+        started = time.perf_counter()
+        while await relay.relay_batch(FakeChannel()):
+            pass
+        seconds = time.perf_counter() - started
+        engine.dispose()
+    return MESSAGES / seconds
+
+
+async def main():
+    print(f"confirm latency {CONFIRM_LATENCY * 1000:.1f} ms, {MESSAGES} messages")
+    for batch_size in BATCH_SIZES:
+        for label, relay_class in (("transaction per batch", OutboxRelay), ("await each confirm", AwaitEachRelay)):
+            rate = await drain(relay_class, batch_size)
+            print(f"batch {batch_size:>4}  {label:<22} {rate:>9.0f} msg/s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
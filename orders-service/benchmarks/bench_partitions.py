@@ -0,0 +1,146 @@
+"""
+Пропускная способность конвейера оплат: один активный outbox relay публикует
+order_created в очереди партиций, K консьюмеров платежей делят партиции между собой.
+
+Брокер - очереди в памяти, commit пачки подтверждается через CONFIRM_LATENCY.
+Консьюмер - отдельный процесс сервиса платежей: оплата занимает PAYMENT_COST
+(транзакция с SELECT ... FOR UPDATE), и процесс выполняет их по одной, даже если
+читает несколько партиций. Outbox - файл SQLite.
+
+Показывает, что пропускная способность растёт с числом консьюмеров до числа партиций
+и упирается в потолок одного relay (строка relay only), и что оплаты каждого
+пользователя приходят по порядку. Запуск из каталога сервиса:
+python benchmarks/bench_partitions.py
+"""
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, insert  # noqa: E402
+
+import partitioning  # noqa: E402
+from models import Base, OutboxMessage  # noqa: E402
+from outbox_relay import OutboxRelay  # noqa: E402
+
+MESSAGES = 4_000
+USERS = 500
+CONFIRM_LATENCY = 0.001
+PAYMENT_COST = 0.002
+CONSUMERS = (1, 2, 4, 8)
+
+
+class FakeExchange:
+    def __init__(self):
+        self.pending = []
+
+    async def publish(self, message, routing_key):
+        self.pending.append((routing_key, message.body))
+        await asyncio.sleep(0)
+
+
+class FakeTransaction:
+    def __init__(self, channel):
+        self.channel = channel
+
+    async def commit(self):
+        await asyncio.sleep(CONFIRM_LATENCY)
+        # Сообщения транзакции попадают в очереди после commit
+        for routing_key, body in self.channel.default_exchange.pending:
+            self.channel.queues[routing_key].put_nowait(body)
+        self.channel.default_exchange.pending.clear()
+
+
+class FakeChannel:
+    is_closed = False
+
+    def __init__(self, queues):
+        self.queues = queues
+        self.default_exchange = FakeExchange()
+
+    def transaction(self):
+        return FakeTransaction(self)
+
+
+def make_outbox(path):
+    rng = random.Random(1)
+    seq = defaultdict(int)
+    rows = []
+    for _ in range(MESSAGES):
+        user_id = rng.randrange(USERS)
+        seq[user_id] += 1
+        rows.append({"event_type": "order_created", "event_data": f"{user_id}:{seq[user_id]}".encode(),
+                     "routing_key": partitioning.payment_queue_for(user_id)})
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(insert(OutboxMessage), rows)
+    return engine
+
+
+async def relay_until_empty(relay, channel):
+    while await relay.relay_batch(channel):
+        pass
+
+
+async def consume_partition(queue, process_lock, state):
+    while True:
+        body = await queue.get()
+        user_id, seq = map(int, body.split(b":"))
+        if seq != state["last_seq"][user_id] + 1:
+            state["out_of_order"] += 1
+        state["last_seq"][user_id] = seq
+        async with process_lock:
+            await asyncio.sleep(PAYMENT_COST)
+        state["processed"] += 1
+        if state["processed"] == MESSAGES:
+            state["done"].set()
+
+
+async def run_pipeline(consumers):
+    """consumers=0 - только relay, без оплат"""
+    queues = defaultdict(asyncio.Queue)
+    state = {"processed": 0, "out_of_order": 0, "last_seq": defaultdict(int), "done": asyncio.Event()}
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = make_outbox(os.path.join(tmp, "outbox.db"))
+        relay = OutboxRelay(engine, OutboxMessage, default_routing_key=partitioning.LEGACY_PAYMENT_QUEUE)
+        await relay._in_db_thread(relay._acquire)
+
+        tasks = []
+        for consumer in range(consumers):
+            process_lock = asyncio.Lock()
+            for partition in range(consumer, partitioning.PAYMENT_PARTITIONS, consumers):
+                queue = queues[partitioning.partition_queue(partition)]
+                tasks.append(asyncio.create_task(consume_partition(queue, process_lock, state)))
+
+        started = time.perf_counter()
+        await relay_until_empty(relay, FakeChannel(queues))
+        relayed = time.perf_counter() - started
+        if consumers:
+            await state["done"].wait()
+        seconds = time.perf_counter() - started
+
+        for task in tasks:
+            task.cancel()
+        await relay._in_db_thread(relay._release)
+        engine.dispose()
+    return MESSAGES / relayed, MESSAGES / seconds, state["out_of_order"]
+
+
+async def main():
+    print(f"{MESSAGES} payments of {USERS} users, {partitioning.PAYMENT_PARTITIONS} partitions, "
+          f"payment {PAYMENT_COST * 1000:.1f} ms, confirm latency {CONFIRM_LATENCY * 1000:.1f} ms")
+    relay_rate, _, _ = await run_pipeline(0)
+    print(f"{'relay only':<14} {relay_rate:>9.0f} msg/s")
+    for consumers in CONSUMERS:
+        _, rate, out_of_order = await run_pipeline(consumers)
+        print(f"{consumers:>2} consumer(s)  {rate:>9.0f} msg/s  out of order: {out_of_order}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
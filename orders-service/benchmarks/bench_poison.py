@@ -0,0 +1,95 @@
+"""
+Пропускная способность консьюмера результатов оплат при разной доле «ядовитых»
+сообщений (битое тело или нет обязательных полей). Брокер заменён очередью в памяти:
+повтор через очередь задержки возвращает сообщение в конец рабочей очереди сразу,
+без TTL, поэтому видна только лишняя работа консьюмера.
+
+Сравниваются ядовитые сообщения, которые сразу уходят в DLQ (EventDecodeError),
+и те же сообщения, если бы они повторялись до MESSAGE_MAX_ATTEMPTS.
+Запуск из каталога сервиса: python benchmarks/bench_poison.py
+"""
+import asyncio
+import os
+import random
+import sys
+import time
+from collections import deque
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import aiormq  # noqa: E402
+
+import events  # noqa: E402
+import retries  # noqa: E402
+
+MESSAGES = 20_000
+POISON_RATES = (0.0, 0.01, 0.1, 0.5)
+
+
+class FakeMessage:
+    def __init__(self, body, content_type, headers=None):
+        self.body = body
+        self.content_type = content_type
+        self.headers = headers or {}
+        self.message_id = None
+
+
+class FakeExchange:
+    def __init__(self, queue, stats):
+        self.queue = queue
+        self.stats = stats
+
+    async def publish(self, message, routing_key, mandatory=True):
+        if routing_key.endswith(".dlq"):
+            self.stats["dead_lettered"] += 1
+        else:
+            self.queue.append(FakeMessage(message.body, message.content_type, message.headers))
+        return aiormq.spec.Basic.Ack()
+
+
+class FakeChannel:
+    publisher_confirms = True
+
+    def __init__(self, queue, stats):
+        self.default_exchange = FakeExchange(queue, stats)
+
+
+def make_messages(poison_rate):
+    rng = random.Random(1)
+    good_body, content_type = events.encode(events.make_event(
+        "payment_result", {"order_id": 1, "user_id": 1, "success": True}))
+    bad_body, _ = events.encode(events.make_event("payment_result", {"user_id": 1}))
+    return deque(
+        FakeMessage(bad_body if rng.random() < poison_rate else good_body, content_type)
+        for _ in range(MESSAGES)
+    )
+
+
+async def consume(queue):
+    stats = {"deliveries": 0, "processed": 0, "dead_lettered": 0}
+    channel = FakeChannel(queue, stats)
+    started = time.perf_counter()
+    while queue:
+        message = queue.popleft()
+        stats["deliveries"] += 1
+        try:
+            data = events.decode(message.body, message.content_type)["data"]
+            events.require(data, order_id=int, success=bool)
+            stats["processed"] += 1
+        except Exception as e:
+            await retries.handle_failure(channel, message, "payment.results", e)
+    return stats, time.perf_counter() - started
+
+
+async def main():
+    retries.logger.disabled = True
+    print(f"{'poison':>7} {'mode':<12} {'deliveries':>11} {'good msg/s':>11}")
+    for rate in POISON_RATES:
+        for mode, non_retryable in (("dlq", (events.EventDecodeError,)), ("retry", ())):
+            retries.NON_RETRYABLE_ERRORS = non_retryable
+            stats, seconds = await consume(make_messages(rate))
+            print(f"{rate:>7.0%} {mode:<12} {stats['deliveries']:>11} {stats['processed'] / seconds:>11.0f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
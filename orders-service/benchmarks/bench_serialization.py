@@ -0,0 +1,45 @@
+"""
+Сериализация по звеньям: событие RabbitMQ/Redis, ответ со списком заказов и рассылка
+в WebSocket. Запуск из каталога сервиса: python benchmarks/bench_serialization.py
+"""
+import json
+import os
+import sys
+import timeit
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import serialization  # noqa: E402
+
+EVENT = {"type": "order_update", "order_id": 123456, "user_id": 42, "status": "FINISHED", "amount": 1999.9}
+ORDERS = [
+    {"id": i, "user_id": 42, "amount": 100.0 + i, "description": f"Заказ {i}", "status": "NEW",
+     "created_at": datetime(2026, 10, 19, tzinfo=timezone.utc)}
+    for i in range(100)
+]
+RECIPIENTS = 100
+
+
+def bench(label, func, number):
+    seconds = min(timeit.repeat(func, number=number, repeat=5)) / number
+    print(f"{label:<40} {seconds * 1e6:9.2f} us")
+
+
+def main():
+    for name in sorted(serialization._BACKENDS):
+        serialization.set_backend(name)
+        payload = serialization.dumps(EVENT)
+        print(f"-- backend {name}")
+        bench("event dumps", lambda: serialization.dumps(EVENT), 20000)
+        bench("event loads", lambda: serialization.loads(payload), 20000)
+        bench("100 orders dumps", lambda: serialization.dumps(ORDERS), 500)
+        # До: json.dumps на каждого получателя; после: один раз на событие
+        bench(f"fan-out x{RECIPIENTS}, encode per socket",
+              lambda: [json.dumps(EVENT) for _ in range(RECIPIENTS)], 500)
+        bench(f"fan-out x{RECIPIENTS}, encode once",
+              lambda: [serialization.dumps_str(EVENT)] * RECIPIENTS, 500)
+
+
+if __name__ == "__main__":
+    main()
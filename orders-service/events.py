@@ -0,0 +1,146 @@
+"""
+Конверт событий RabbitMQ.
+
+Каждое событие оборачивается в версионированный конверт:
+
+    {"v": 1, "type": "order_created", "id": "<uuid>", "ts": 1700000000.123, "data": {...}}
+
+и кодируется в msgpack (если установлен) или JSON. Кодировка передаётся в
+content_type сообщения и хранится рядом с event_data в outbox, поэтому
+консьюмер разбирает и старые JSON-сообщения без конверта (v0), и новые.
+
+Формат новых событий задаёт EVENT_ENVELOPE. По умолчанию v0 - JSON без конверта,
+как до перехода на v1: его читают и консьюмеры, которые ещё не обновлены.
+Порядок выката: обновить консьюмеры обоих сервисов, затем включить у продюсеров
+EVENT_ENVELOPE=v1 и, при желании, EVENT_ENCODING=msgpack.
+
+Необязательное поле "expires_at" (unix time) - момент, после которого событие
+обрабатывать уже не нужно (например, окно оплаты заказа закрылось).
+"""
+import os
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Optional, Tuple, Union
+
+from serialization import dumps, loads
+
+try:
+    import msgpack
+except ImportError:  # msgpack - опциональная зависимость
+    msgpack = None
+
+ENVELOPE_VERSION = 1
+
+JSON_CONTENT_TYPE = "application/json"
+MSGPACK_CONTENT_TYPE = "application/x-msgpack"
+
+_CONTENT_TYPES = {"json": JSON_CONTENT_TYPE}
+if msgpack is not None:
+    _CONTENT_TYPES["msgpack"] = MSGPACK_CONTENT_TYPE
+
+# Формат новых событий: v0 - JSON без конверта (совместим со старыми консьюмерами), v1 - конверт
+EVENT_ENVELOPE = os.getenv("EVENT_ENVELOPE", "v0")
+if EVENT_ENVELOPE not in ("v0", "v1"):
+    raise ValueError(f"Event envelope '{EVENT_ENVELOPE}' is not supported, choose from ['v0', 'v1']")
+
+# Кодировка конверта v1 (v0 - всегда JSON)
+EVENT_ENCODING = os.getenv("EVENT_ENCODING", "json")
+if EVENT_ENCODING not in _CONTENT_TYPES:
+    raise ValueError(f"Event encoding '{EVENT_ENCODING}' is not available, choose from {list(_CONTENT_TYPES)}")
+
+
+class EventDecodeError(ValueError):
+    """
+    Сообщение невозможно обработать: тело не разбирается или в данных нет обязательных
+    полей. Повтор бессмысленен - такое сообщение сразу уходит в DLQ (retries.py).
+    """
+
+
+def make_event(event_type: str, data: dict, event_id: Optional[str] = None,
+               expires_at: Optional[float] = None) -> dict:
+    """Новый конверт события. id служит ключом идемпотентности у получателя."""
+    event = {
+        "v": ENVELOPE_VERSION,
+        "type": event_type,
+        "id": event_id or str(uuid.uuid4()),
+        "ts": time.time(),
+        "data": data,
+    }
+    if expires_at is not None:
+        event["expires_at"] = expires_at
+    return event
+
+
+def is_expired(event: dict, now: Optional[float] = None) -> bool:
+    expires_at = event.get("expires_at")
+    return expires_at is not None and (now or time.time()) >= expires_at
+
+
+def _legacy_payload(event: dict) -> dict:
+    """
+    Тело v0: данные события и timestamp, из которого консьюмер платежей
+    выводит ID для дедупликации
+    """
+    payload = dict(event["data"])
+    payload["timestamp"] = datetime.fromtimestamp(event["ts"]).isoformat()
+    if "expires_at" in event:
+        payload["expires_at"] = event["expires_at"]
+    return payload
+
+
+def encode(event: dict, encoding: str = None, envelope: str = None) -> Tuple[bytes, str]:
+    """Кодирует событие в формате EVENT_ENVELOPE. Возвращает тело и content_type."""
+    if (envelope or EVENT_ENVELOPE) == "v0":
+        return dumps(_legacy_payload(event)), JSON_CONTENT_TYPE
+    content_type = _CONTENT_TYPES[encoding or EVENT_ENCODING]
+    if content_type == MSGPACK_CONTENT_TYPE:
+        return msgpack.packb(event, use_bin_type=True), content_type
+    return dumps(event), content_type
+
+
+def require(data: Any, **fields: Union[type, Tuple[type, ...]]) -> Tuple[Any, ...]:
+    """
+    Обязательные поля данных события в порядке перечисления:
+        order_id, success = require(data, order_id=int, success=bool)
+    Нет поля или тип не тот - EventDecodeError.
+    """
+    if not isinstance(data, dict):
+        raise EventDecodeError(f"Event data must be an object, got {type(data).__name__}")
+    values = []
+    for name, kind in fields.items():
+        value = data.get(name)
+        if not isinstance(value, kind):
+            raise EventDecodeError(f"Event field '{name}' is missing or has wrong type: {value!r}")
+        values.append(value)
+    return tuple(values)
+
+
+def decode(body: bytes, content_type: Optional[str]) -> dict:
+    """
+    Разбирает тело сообщения в конверт.
+    Сообщение без конверта (JSON до перехода на v1) возвращается как конверт v0
+    без id - получатель сам решает, как его дедуплицировать.
+    """
+    try:
+        if content_type == MSGPACK_CONTENT_TYPE:
+            if msgpack is None:
+                raise EventDecodeError("msgpack is not installed")
+            payload: Any = msgpack.unpackb(body, raw=False)
+        else:
+            payload = loads(body)
+    except EventDecodeError:
+        raise
+    except Exception as e:
+        raise EventDecodeError(f"Cannot decode {content_type or 'unknown'} event: {e}") from e
+
+    if not isinstance(payload, dict):
+        raise EventDecodeError(f"Event must be an object, got {type(payload).__name__}")
+    if "v" not in payload:
+        event = {"v": 0, "type": None, "id": None, "ts": None, "data": payload}
+        if "expires_at" in payload:
+            event["expires_at"] = payload["expires_at"]
+        return event
+    if payload["v"] > ENVELOPE_VERSION:
+        raise EventDecodeError(f"Unsupported event envelope version {payload['v']}")
+    return payload
@@ -1,42 +1,86 @@
-from fastapi import FastAPI, Depends, HTTPException, Header, status, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, Depends, HTTPException, Header, Query, Response, status, WebSocket, WebSocketDisconnect
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import text
-import json
-from datetime import datetime
+from sqlalchemy import select, text
 import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import Optional
 import logging
+import os
+import time
 from contextlib import asynccontextmanager
 
-from database import get_db
+from database import READ_AFTER_HEADER, choose_read_engine, get_db, get_read_db, mark_write
+from deadlines import DEADLINE_HEADER, check_deadline, deadline_exceeded, is_statement_timeout, setup_deadlines
 from models import Order, OrderStatus, OutboxMessage
-from schemas import OrderCreate, OrderResponse
+from schemas import ORDER_LIST_ADAPTER, OrderCreate, OrderResponse
 from websocket_manager import ws_manager
+import events
+from admission import admission
+import partitioning
+import export
+import rollups
+from profiling import require_admin, setup_profiling
+from loop_monitor import loop_monitor, setup_loop_monitor
+from serialization import FastJSONResponse, dumps_str, loads, validated_response
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Момент импорта приложения: от него считается время старта инстанса
+STARTED_AT = time.perf_counter()
+
+# Сколько секунд заказ ждёт оплаты: более старое событие order_created сервис платежей отклонит
+ORDER_PAYMENT_TTL = float(os.getenv("ORDER_PAYMENT_TTL", 900))
+# Запас после окна оплаты, за который успевает завершиться уже начатая оплата;
+# затем заказ без результата проверяет worker_timeouts.py
+ORDER_PAYMENT_GRACE = float(os.getenv("ORDER_PAYMENT_GRACE", 60))
+# Колонки заказа для ответов API (поля OrderResponse)
+ORDER_RESPONSE_COLUMNS = (
+    Order.id, Order.user_id, Order.amount, Order.description, Order.status, Order.created_at,
+)
+# Максимальный период, который можно запросить у /admin/rollups
+ROLLUPS_MAX_RANGE = timedelta(days=int(os.getenv("ROLLUPS_MAX_RANGE_DAYS", 7)))
+
 
 # --- Управление жизненным циклом приложения ---
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    await loop_monitor.start()
 
     # 1. Подключаемся к Redis (для обмена сообщениями между инстансами)
     await ws_manager.connect_redis()
 
     # 2. Запускаем фоновую задачу прослушивания канала обновлений
-    asyncio.create_task(ws_manager.listen_to_redis())
+    asyncio.create_task(ws_manager.listen_to_redis(), name="redis:order_updates")
 
-    logger.info("Сервис заказов запущен, Redis подключен.")
+    # Замеры отставания конвейера оплат для приёма заказов
+    asyncio.create_task(admission.run(), name="admission-sampler")
+
+    # Схема создаётся миграциями (migrate.py), поэтому старт не включает DDL
+    logger.info(f"Сервис заказов запущен за {time.perf_counter() - STARTED_AT:.3f} с, Redis подключен.")
 
     yield  # Здесь приложение работает
 
     # 3. При остановке отключаемся
     await ws_manager.disconnect_redis()
+    await admission.close()
     logger.info("Сервис заказов остановлен.")
 
 
-app = FastAPI(title="Orders Service", version="2.0.0", lifespan=lifespan)
+app = FastAPI(
+    title="Orders Service",
+    version="2.0.0",
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse
+)
+setup_profiling(app)
+setup_loop_monitor(app)
+setup_deadlines(app)
+# Сжатие ответов для API Gateway (он пересылает их клиенту без перепаковки)
+app.add_middleware(GZipMiddleware, minimum_size=int(os.getenv("GZIP_MIN_SIZE", 1024)))
 
 
 # --- Зависимости (Dependencies) ---
@@ -58,21 +102,24 @@ async def websocket_endpoint(websocket: WebSocket, user_id: int):
     await ws_manager.connect(websocket, user_id)
     try:
         # Отправляем приветственное сообщение при подключении
-        await websocket.send_json({
+        await websocket.send_text(dumps_str({
             "type": "connection_established",
             "message": f"Подключено к Сервису Заказов (Инстанс {ws_manager.instance_id})"
-        })
+        }))
 
         # Слушаем сообщения от клиента, чтобы соединение не разрывалось
         while True:
             try:
-                data = await websocket.receive_json()
+                data = loads(await websocket.receive_text())
                 if data.get("type") == "ping":
-                    await websocket.send_json({"type": "pong"})
+                    await websocket.send_text(dumps_str({"type": "pong"}))
             except:
                 break
     except WebSocketDisconnect:
-        ws_manager.disconnect(websocket, user_id)
+        pass
+    finally:
+        # Соединение снимается с учёта при любом выходе, иначе рассылка продолжит писать в мёртвый сокет
+        await ws_manager.disconnect(websocket, user_id)
 
 
 # --- REST API Эндпоинты ---
@@ -81,44 +128,55 @@ async def websocket_endpoint(websocket: WebSocket, user_id: int):
 async def health_check(db: Session = Depends(get_db)):
     # Проверяем, жива ли база данных
     db.execute(text("SELECT 1"))
-    return {"status": "healthy", "instance_id": ws_manager.instance_id}
+    return {"status": "healthy", "instance_id": ws_manager.instance_id, "websocket": ws_manager.stats,
+            "event_loop": loop_monitor.snapshot(), "admission": admission.snapshot()}
 
 
 @app.post("/orders", response_model=OrderResponse, status_code=201, tags=["Orders"])
 async def create_order(
         data: OrderCreate,
+        response: Response,
         user_id: int = Depends(verify_user_id),
         db: Session = Depends(get_db)
 ):
+    # Платежи отстают - не копим заказы в NEW, а просим клиента повторить позже (503)
+    admission.check()
 
     try:
         # Начинаем транзакцию базы данных
         db.begin()
 
+        payment_expires_at = time.time() + ORDER_PAYMENT_TTL
+
         # 1. Сохраняем сам заказ в таблицу orders
         order = Order(
             user_id=user_id,
             amount=data.amount,
             description=data.description,
-            status=OrderStatus.NEW
+            status=OrderStatus.NEW,
+            payment_due_at=datetime.fromtimestamp(payment_expires_at + ORDER_PAYMENT_GRACE, tz=timezone.utc)
         )
         db.add(order)
         db.flush()  # Получаем ID заказа, не завершая транзакцию
+        rollups.record_created(db, order.amount)
 
         # 2. Сохраняем сообщение в таблицу outbox_messages
+        event_data, content_type = events.encode(events.make_event("order_created", {
+            "order_id": order.id,
+            "user_id": user_id,
+            "amount": order.amount
+        }, expires_at=payment_expires_at))
         outbox = OutboxMessage(
             event_type="order_created",
-            event_data=json.dumps({
-                "order_id": order.id,
-                "user_id": user_id,
-                "amount": order.amount,
-                "timestamp": datetime.now().isoformat()
-            })
+            event_data=event_data,
+            content_type=content_type,
+            routing_key=partitioning.payment_queue_for(user_id)
         )
         db.add(outbox)
 
         # Фиксируем транзакцию
         db.commit()
+        mark_write(response)
 
         # 3. Мгновенно отправляем уведомление на фронтенд через WebSocket
         await ws_manager.broadcast_order_update(
@@ -134,27 +192,64 @@ async def create_order(
     except Exception as e:
         # В случае любой ошибки откатываем транзакцию
         db.rollback()
+        if is_statement_timeout(e):
+            raise deadline_exceeded()
         logger.error(f"Ошибка при создании заказа: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Ошибка сервера: {str(e)}")
 
 
 @app.get("/orders", response_model=list[OrderResponse], tags=["Orders"])
-async def get_orders(user_id: int = Depends(verify_user_id), db: Session = Depends(get_db)):
+async def get_orders(user_id: int = Depends(verify_user_id), db: Session = Depends(get_read_db)):
     """
     Получить список всех заказов текущего пользователя.
     """
-    orders = db.query(Order).filter(
-        Order.user_id == user_id
-    ).order_by(Order.created_at.desc()).all()
+    # Только нужные колонки: без ORM-объектов и identity map. Проверка и сериализация
+    # всего списка - один вызов TypeAdapter, без повторной проверки по response_model
+    rows = db.execute(
+        select(*ORDER_RESPONSE_COLUMNS)
+        .where(Order.user_id == user_id)
+        .order_by(Order.created_at.desc())
+    ).all()
+
+    return validated_response(ORDER_LIST_ADAPTER, rows)
+
+
+@app.get("/orders/export", tags=["Orders"])
+async def export_orders(
+        export_format: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$"),
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        all_users: bool = False,
+        x_user_id: Optional[int] = Header(None, alias="X-User-ID"),
+        x_admin_token: Optional[str] = Header(None, alias="X-Admin-Token"),
+        read_after: Optional[float] = Header(None, alias=READ_AFTER_HEADER),
+        deadline: Optional[float] = Header(None, alias=DEADLINE_HEADER)
+):
+    """
+    Потоковая выгрузка заказов в NDJSON или CSV.
+    По умолчанию - заказы текущего пользователя; all_users=true (нужен X-Admin-Token) -
+    заказы всех пользователей за период [since, until).
+    """
+    # Выгрузка идёт дольше бюджета запроса - дедлайн проверяется только на старте
+    check_deadline(deadline)
+    if all_users:
+        require_admin(x_admin_token)
+        user_id = None
+    else:
+        if x_user_id is None:
+            raise HTTPException(status_code=400, detail="Header 'X-User-ID' is required")
+        user_id = await verify_user_id(x_user_id)
 
-    return [OrderResponse.model_validate(o) for o in orders]
+    stmt = export.export_statement(user_id, since, until)
+    chunks = export.EXPORT_WRITERS[export_format](choose_read_engine(read_after), stmt)
+    return StreamingResponse(chunks, media_type=export.MEDIA_TYPES[export_format])
 
 
 @app.get("/orders/{order_id}", response_model=OrderResponse, tags=["Orders"])
 async def get_order(
         order_id: int,
         user_id: int = Depends(verify_user_id),
-        db: Session = Depends(get_db)
+        db: Session = Depends(get_read_db)
 ):
     """
     Получить детали конкретного заказа по ID.
@@ -167,4 +262,26 @@ async def get_order(
     if not order:
         raise HTTPException(status_code=404, detail="Заказ не найден")
 
-    return OrderResponse.model_validate(order)
\ No newline at end of file
+    return OrderResponse.model_validate(order)
+
+
+def as_utc(value: datetime) -> datetime:
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+
+
+@app.get("/admin/rollups", tags=["Admin"], dependencies=[Depends(require_admin)])
+async def get_rollups(
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        db: Session = Depends(get_read_db)
+):
+    """
+    Число заказов и сумма по минутам создания и статусам за [since, until)
+    (по умолчанию - последний час). Читает только order_rollups, не orders.
+    """
+    # Время без часового пояса считаем UTC: иначе вычитание naive и aware значений падает
+    until = as_utc(until) if until else datetime.now(timezone.utc)
+    since = as_utc(since) if since else until - timedelta(hours=1)
+    if until - since > ROLLUPS_MAX_RANGE:
+        raise HTTPException(status_code=400, detail=f"Период не должен превышать {ROLLUPS_MAX_RANGE}")
+    return rollups.read_rollups(db, since, until)
@@ -0,0 +1,79 @@
+"""
+Одноразовый запуск миграций схемы БД сервиса заказов.
+
+Запускается один раз перед стартом инстансов (отдельный контейнер в docker-compose),
+поэтому сами инстансы и воркеры при старте DDL не выполняют.
+"""
+import logging
+import os
+import sys
+import time
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import OperationalError
+
+from database import get_engine
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Ревизия, соответствующая схеме, которую раньше создавал create_all
+BASELINE_REVISION = "0001"
+# Таблица, по которой определяется база, созданная до появления миграций
+BASELINE_TABLE = "orders"
+# Ключ advisory-блокировки: параллельные запуски миграций выполняются по очереди
+MIGRATION_LOCK_ID = 72_001
+
+
+def get_alembic_config() -> Config:
+    config = Config(os.path.join(BASE_DIR, "alembic.ini"))
+    config.set_main_option("script_location", os.path.join(BASE_DIR, "migrations"))
+    return config
+
+
+def wait_for_database(engine, attempts: int = 30, delay: float = 1.0):
+    """Ожидание готовности БД перед миграцией"""
+    for attempt in range(1, attempts + 1):
+        try:
+            with engine.connect() as connection:
+                connection.execute(text("SELECT 1"))
+            return
+        except OperationalError as e:
+            logger.warning(f"БД недоступна (попытка {attempt}/{attempts}): {e}")
+            time.sleep(delay)
+    raise RuntimeError("База данных так и не стала доступна")
+
+
+def run_migrations():
+    started = time.perf_counter()
+    engine = get_engine()
+    wait_for_database(engine)
+    config = get_alembic_config()
+
+    # Вся миграция выполняется в одной транзакции (DDL в PostgreSQL транзакционный)
+    with engine.begin() as connection:
+        if connection.dialect.name == "postgresql":
+            connection.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": MIGRATION_LOCK_ID})
+
+        config.attributes["connection"] = connection
+        tables = set(inspect(connection).get_table_names())
+        if "alembic_version" not in tables and BASELINE_TABLE in tables:
+            # База создана старой версией сервиса через create_all - фиксируем базовую ревизию
+            logger.info(f"Найдена схема без версии, помечаем ревизией {BASELINE_REVISION}")
+            command.stamp(config, BASELINE_REVISION)
+
+        command.upgrade(config, "head")
+
+    logger.info(f"Миграции применены за {time.perf_counter() - started:.3f} с")
+
+
+if __name__ == "__main__":
+    try:
+        run_migrations()
+    except Exception as e:
+        logger.error(f"Ошибка при применении миграций: {e}")
+        sys.exit(1)
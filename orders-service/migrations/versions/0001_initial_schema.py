@@ -0,0 +1,53 @@
+"""Начальная схема: заказы и outbox
+
+Соответствует таблицам, которые раньше создавались через Base.metadata.create_all.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+order_status = sa.Enum("NEW", "FINISHED", "CANCELLED", name="orderstatus")
+
+
+def upgrade():
+    op.create_table(
+        "orders",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("amount", sa.Float(), nullable=False),
+        sa.Column("description", sa.String(), nullable=True),
+        sa.Column("status", order_status, nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=True),
+    )
+    op.create_index("ix_orders_id", "orders", ["id"])
+    op.create_index("ix_orders_user_id", "orders", ["user_id"])
+
+    op.create_table(
+        "outbox_messages",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("event_type", sa.String(), nullable=False),
+        sa.Column("event_data", sa.String(), nullable=False),
+        sa.Column("processed", sa.Boolean(), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column("processed_at", sa.DateTime(timezone=True), nullable=True),
+    )
+    op.create_index("ix_outbox_messages_id", "outbox_messages", ["id"])
+
+
+def downgrade():
+    op.drop_index("ix_outbox_messages_id", table_name="outbox_messages")
+    op.drop_table("outbox_messages")
+    op.drop_index("ix_orders_user_id", table_name="orders")
+    op.drop_index("ix_orders_id", table_name="orders")
+    op.drop_table("orders")
+    order_status.drop(op.get_bind(), checkfirst=True)
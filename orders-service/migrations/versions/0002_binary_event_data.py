@@ -0,0 +1,37 @@
+"""Outbox: бинарный event_data и content_type
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Существующие JSON-строки сохраняются как UTF-8 байты
+    op.alter_column(
+        "outbox_messages", "event_data",
+        type_=sa.LargeBinary(),
+        postgresql_using="convert_to(event_data, 'UTF8')"
+    )
+    op.add_column(
+        "outbox_messages",
+        sa.Column("content_type", sa.String(), nullable=False, server_default="application/json")
+    )
+
+
+def downgrade():
+    # Работает, только если в outbox не осталось msgpack-событий
+    op.drop_column("outbox_messages", "content_type")
+    op.alter_column(
+        "outbox_messages", "event_data",
+        type_=sa.String(),
+        postgresql_using="convert_from(event_data, 'UTF8')"
+    )
@@ -0,0 +1,23 @@
+"""Outbox: очередь назначения (партиция оплат)
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Старые строки без routing_key уходят в общую очередь orders.to_pay
+    op.add_column("outbox_messages", sa.Column("routing_key", sa.String(), nullable=True))
+
+
+def downgrade():
+    op.drop_column("outbox_messages", "routing_key")
@@ -0,0 +1,21 @@
+"""Индекс по created_at для выгрузки заказов за период
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19
+"""
+from alembic import op
+
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index("ix_orders_created_at", "orders", ["created_at"])
+
+
+def downgrade():
+    op.drop_index("ix_orders_created_at", table_name="orders")
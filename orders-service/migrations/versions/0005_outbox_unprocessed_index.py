@@ -0,0 +1,27 @@
+"""Частичный индекс по неотправленным записям outbox
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        "ix_outbox_messages_unprocessed",
+        "outbox_messages",
+        ["id"],
+        postgresql_where=sa.text("processed = false"),
+    )
+
+
+def downgrade():
+    op.drop_index("ix_outbox_messages_unprocessed", table_name="outbox_messages")
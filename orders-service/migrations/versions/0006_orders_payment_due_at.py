@@ -0,0 +1,33 @@
+"""Срок оплаты заказа и частичный индекс по неоплаченным заказам
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("orders", sa.Column("payment_due_at", sa.DateTime(timezone=True), nullable=True))
+    # Срок получают только заказы, ещё ожидающие оплаты (окно и запас по умолчанию)
+    op.execute(
+        "UPDATE orders SET payment_due_at = created_at + interval '960 seconds' WHERE status = 'NEW'"
+    )
+    op.create_index(
+        "ix_orders_payment_due",
+        "orders",
+        ["payment_due_at"],
+        postgresql_where=sa.text("status = 'NEW'"),
+    )
+
+
+def downgrade():
+    op.drop_index("ix_orders_payment_due", table_name="orders")
+    op.drop_column("orders", "payment_due_at")
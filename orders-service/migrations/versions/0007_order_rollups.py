@@ -0,0 +1,39 @@
+"""Поминутные агрегаты заказов
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "order_rollups",
+        sa.Column("bucket_start", sa.DateTime(timezone=True), primary_key=True),
+        sa.Column("shard", sa.SmallInteger(), primary_key=True),
+        sa.Column("status", sa.String(), primary_key=True),
+        sa.Column("orders_count", sa.Integer(), nullable=False),
+        sa.Column("amount_sum", sa.Float(), nullable=False),
+    )
+    # Заполняем по существующим заказам (однократный проход при миграции, всё в шард 0)
+    op.execute(
+        """
+        INSERT INTO order_rollups (bucket_start, shard, status, orders_count, amount_sum)
+        SELECT date_trunc('minute', created_at), 0, status::text, count(*), sum(amount)
+        FROM orders
+        WHERE status IS NOT NULL AND created_at IS NOT NULL
+        GROUP BY 1, 3
+        """
+    )
+
+
+def downgrade():
+    op.drop_table("order_rollups")
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Enum, Boolean, DateTime
+from sqlalchemy import Column, Integer, String, Float, Enum, Boolean, DateTime, LargeBinary, Index, SmallInteger
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import func
 import enum
@@ -27,9 +27,16 @@ class Order(Base):
     status = Column(Enum(OrderStatus), default=OrderStatus.NEW)
 
     # Время создания
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
     # Время последнего обновления
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    # Срок оплаты: заказ, оставшийся к этому времени NEW, проверяет worker_timeouts.py
+    payment_due_at = Column(DateTime(timezone=True), nullable=True)
+
+    # Частичный индекс: в нём только неоплаченные заказы, а не вся история
+    __table_args__ = (
+        Index('ix_orders_payment_due', 'payment_due_at', postgresql_where=status == OrderStatus.NEW),
+    )
 
 
 # Модель для паттерна Transactional Outbox (Техническая таблица)
@@ -38,8 +45,30 @@ class OutboxMessage(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     event_type = Column(String, nullable=False)  # Тип события
-    event_data = Column(String, nullable=False)  # Данные события в формате JSON
+    event_data = Column(LargeBinary, nullable=False)  # Закодированный конверт события (events.py)
+    content_type = Column(String, nullable=False, default="application/json", server_default="application/json")
+    routing_key = Column(String, nullable=True)  # Очередь назначения (партиция оплат)
     processed = Column(Boolean, default=False)
 
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    processed_at = Column(DateTime(timezone=True), nullable=True)  # Когда сообщение было отправлено в RabbitMQ
\ No newline at end of file
+    processed_at = Column(DateTime(timezone=True), nullable=True)  # Когда сообщение было отправлено в RabbitMQ
+
+    # Неотправленных записей мало, а всего - сколько заказов: relay и замер отставания
+    # читают только частичный индекс
+    __table_args__ = (
+        Index('ix_outbox_messages_unprocessed', 'id', postgresql_where=processed == False),
+    )
+
+
+# Поминутные агрегаты заказов для аналитики (rollups.py).
+# Ключ - минута создания заказа, шард и текущий статус: при смене статуса заказ
+# переходит из одной строки в другую. Шарды разносят запись параллельных транзакций
+# по разным строкам, при чтении они суммируются.
+class OrderRollup(Base):
+    __tablename__ = "order_rollups"
+
+    bucket_start = Column(DateTime(timezone=True), primary_key=True)
+    shard = Column(SmallInteger, primary_key=True)
+    status = Column(String, primary_key=True)
+    orders_count = Column(Integer, nullable=False, default=0)
+    amount_sum = Column(Float, nullable=False, default=0.0)
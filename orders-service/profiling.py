@@ -0,0 +1,238 @@
+"""
+Встроенное профилирование (включается PROFILING_ENABLED=true).
+
+- Сэмплирующий профайлер: отдельный поток раз в PROFILE_SAMPLE_INTERVAL снимает стеки
+  потоков через sys._current_frames(). Результат - folded stacks
+  ("func;func;func count"), их напрямую читают flamegraph.pl, speedscope и inferno.
+  * на один запрос: заголовок X-Profile: 1 (вместе с X-Admin-Token). Снимается поток
+    event loop, пока запрос выполняется, поэтому в профиль попадают и конкурентные
+    запросы. Профиль доступен по GET /admin/profiles/{id} из заголовка X-Profile-Id;
+  * на окно времени: GET /admin/profile?seconds=N - все потоки процесса.
+- Медленные SQL-запросы (дольше SLOW_QUERY_THRESHOLD) пишутся в лог с текстом и числом
+  параметров.
+- N+1: одинаковые запросы в рамках одного HTTP-запроса считаются, и если какой-то
+  повторился N_PLUS_ONE_THRESHOLD раз, это пишется в лог.
+
+При выключенном профилировании setup_profiling ничего не регистрирует:
+ни middleware, ни обработчиков событий SQLAlchemy, ни admin-маршрутов.
+"""
+import asyncio
+import hmac
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from contextvars import ContextVar
+from typing import Iterable, Optional
+
+from fastapi import APIRouter, Depends, FastAPI, Header, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+
+logger = logging.getLogger(__name__)
+
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+# Токен для admin-маршрутов и заголовка X-Profile; пустой - доступ закрыт
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", 0.005))
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", 60))
+PROFILE_HISTORY_SIZE = int(os.getenv("PROFILE_HISTORY_SIZE", 20))
+SLOW_QUERY_THRESHOLD = float(os.getenv("SLOW_QUERY_THRESHOLD", 0.2))
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", 10))
+
+PROFILE_HEADER = b"x-profile"
+ADMIN_TOKEN_HEADER = b"x-admin-token"
+
+# Счётчик SQL-запросов текущего HTTP-запроса (None вне запроса)
+_request_queries: ContextVar[Optional[Counter]] = ContextVar("request_queries", default=None)
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)})"
+
+
+def fold_stack(frame) -> str:
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def render_folded(samples: Counter) -> str:
+    return "\n".join(f"{stack} {count}" for stack, count in samples.most_common()) + "\n"
+
+
+class SamplingProfiler:
+    """Снимает стеки заданных потоков (или всех, кроме своего) до вызова stop()"""
+
+    def __init__(self, thread_ids: Optional[Iterable[int]] = None, interval: float = PROFILE_SAMPLE_INTERVAL):
+        self.thread_ids = set(thread_ids) if thread_ids is not None else None
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                if self.thread_ids is not None and thread_id not in self.thread_ids:
+                    continue
+                self.samples[fold_stack(frame)] += 1
+
+    def start(self) -> "SamplingProfiler":
+        self._thread.start()
+        return self
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        self._thread.join()
+        return self.samples
+
+
+class ProfileStore:
+    """Последние профили запросов (ограниченное число)"""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.profiles: "OrderedDict[str, str]" = OrderedDict()
+
+    def add(self, profile_id: str, folded: str):
+        self.profiles[profile_id] = folded
+        if len(self.profiles) > self.size:
+            self.profiles.popitem(last=False)
+
+    def get(self, profile_id: str) -> Optional[str]:
+        return self.profiles.get(profile_id)
+
+
+profile_store = ProfileStore(PROFILE_HISTORY_SIZE)
+_window_lock = asyncio.Lock()
+
+
+def _token_valid(token: Optional[str]) -> bool:
+    return bool(ADMIN_TOKEN) and token is not None and hmac.compare_digest(token, ADMIN_TOKEN)
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if not _token_valid(x_admin_token):
+        raise HTTPException(status_code=403, detail="Требуется X-Admin-Token")
+
+
+class ProfilingMiddleware:
+    """ASGI middleware: профиль по заголовку X-Profile и учёт SQL-запросов для поиска N+1"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        profiler = None
+        if headers.get(PROFILE_HEADER) and _token_valid(headers.get(ADMIN_TOKEN_HEADER, b"").decode()):
+            profiler = SamplingProfiler(thread_ids=[threading.get_ident()]).start()
+        queries: Counter = Counter()
+        token = _request_queries.set(queries)
+        profile_id = uuid.uuid4().hex if profiler is not None else None
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                extra = [(b"x-query-count", str(sum(queries.values())).encode())]
+                if profile_id is not None:
+                    extra.append((b"x-profile-id", profile_id.encode()))
+                message = {**message, "headers": list(message.get("headers", [])) + extra}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_queries.reset(token)
+            if profiler is not None:
+                profile_store.add(profile_id, render_folded(profiler.stop()))
+            _report_n_plus_one(scope, queries)
+
+
+def _report_n_plus_one(scope, queries: Counter):
+    if not queries:
+        return
+    statement, count = queries.most_common(1)[0]
+    if count >= N_PLUS_ONE_THRESHOLD:
+        logger.warning(
+            f"Possible N+1 in {scope.get('method')} {scope.get('path')}: "
+            f"{count} x {statement[:300]} ({sum(queries.values())} queries total)"
+        )
+
+
+def _bind_count(parameters, executemany: bool) -> int:
+    if executemany:
+        return len(parameters or ())
+    return len(parameters) if parameters else 0
+
+
+def instrument_sqlalchemy():
+    """Обработчики событий для всех движков SQLAlchemy процесса"""
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    @event.listens_for(Engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started_at", []).append(time.perf_counter())
+
+    @event.listens_for(Engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started_at"].pop()
+        queries = _request_queries.get()
+        if queries is not None:
+            queries[statement] += 1
+        if elapsed >= SLOW_QUERY_THRESHOLD:
+            logger.warning(
+                f"Slow query {elapsed * 1000:.1f} ms, {_bind_count(parameters, executemany)} binds"
+                f"{' (executemany)' if executemany else ''}: {statement[:1000]}"
+            )
+
+
+def build_admin_router() -> APIRouter:
+    router = APIRouter(prefix="/admin", tags=["Admin"], dependencies=[Depends(require_admin)])
+
+    @router.get("/profile", response_class=PlainTextResponse)
+    async def profile_window(seconds: float = Query(10.0, gt=0, le=PROFILE_MAX_SECONDS)):
+        """Профиль всех потоков процесса за заданное окно (folded stacks)"""
+        if _window_lock.locked():
+            raise HTTPException(status_code=409, detail="Профилирование уже запущено")
+        async with _window_lock:
+            profiler = SamplingProfiler().start()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                samples = profiler.stop()
+        return render_folded(samples)
+
+    @router.get("/profiles/{profile_id}", response_class=PlainTextResponse)
+    async def request_profile(profile_id: str):
+        """Профиль запроса, выполненного с заголовком X-Profile"""
+        folded = profile_store.get(profile_id)
+        if folded is None:
+            raise HTTPException(status_code=404, detail="Профиль не найден")
+        return folded
+
+    return router
+
+
+def setup_profiling(app: FastAPI, sqlalchemy: bool = True):
+    """Подключает профилирование к приложению, если оно включено"""
+    if not PROFILING_ENABLED:
+        return
+    if sqlalchemy:
+        instrument_sqlalchemy()
+    app.add_middleware(ProfilingMiddleware)
+    app.include_router(build_admin_router())
+    logger.info("Profiling enabled")
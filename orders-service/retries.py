@@ -0,0 +1,195 @@
+"""
+Повторная обработка сообщений RabbitMQ с задержкой и очередь «ядовитых» сообщений.
+
+Для рабочей очереди Q объявляются:
+- Q.retry.<delay>ms - очереди задержки с TTL. Сообщение лежит в ней delay мс
+  и через dead-letter возвращается в Q. Задержка растёт экспоненциально с номером попытки;
+  на каждую задержку своя очередь, поэтому все сообщения в ней истекают по порядку
+  и не блокируют друг друга;
+- Q.dlq - parking lot для сообщений, которые исчерпали попытки или не могут быть
+  обработаны в принципе (битый JSON, нет обязательных полей).
+
+Упавшее сообщение переотправляется в очередь задержки, а оригинал подтверждается,
+поэтому повтор не блокирует голову рабочей очереди и не крутится в горячем цикле.
+Оригинал подтверждается только после того, как брокер подтвердил переотправку (канал
+с publisher confirms): иначе при потере соединения сообщение пропало бы совсем.
+
+Очереди, где важен порядок (партиции оплат: сообщения одного пользователя идут
+строго друг за другом), так повторять нельзя - следующее сообщение обогнало бы упавшее.
+Для них process_in_order повторяет обработку на месте с той же задержкой, не подтверждая
+сообщение: консьюмер партиции (prefetch_count=1) ждёт, пока сообщение не обработается
+или не уйдёт в DLQ. Очереди задержки таким очередям не нужны (retry_queues=False).
+
+Вернуть сообщения из DLQ в работу можно командой replay_dlq.py.
+"""
+import logging
+import os
+from typing import Awaitable, Callable
+
+import aio_pika
+import aiormq
+
+import events
+from shutdown import shutdown
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_MAX_ATTEMPTS = int(os.getenv("MESSAGE_MAX_ATTEMPTS", 5))
+MESSAGE_RETRY_BASE_DELAY = float(os.getenv("MESSAGE_RETRY_BASE_DELAY", 1.0))
+MESSAGE_RETRY_MAX_DELAY = float(os.getenv("MESSAGE_RETRY_MAX_DELAY", 300.0))
+
+# Номер попытки хранится в заголовке сообщения
+ATTEMPT_HEADER = "x-attempt"
+ERROR_HEADER = "x-last-error"
+
+
+# Сразу в DLQ идут только сообщения, которые невозможно разобрать (events.decode и
+# events.require). KeyError, ValueError и прочие ошибки в коде обработки могут быть
+# временными или багом, который исправят, - такие сообщения повторяются
+NON_RETRYABLE_ERRORS = (events.EventDecodeError,)
+
+
+def retry_delay_ms(attempt: int) -> int:
+    delay = min(MESSAGE_RETRY_MAX_DELAY, MESSAGE_RETRY_BASE_DELAY * 2 ** (attempt - 1))
+    return int(delay * 1000)
+
+
+def retry_queue_name(queue_name: str, attempt: int) -> str:
+    return f"{queue_name}.retry.{retry_delay_ms(attempt)}ms"
+
+
+def dead_letter_queue_name(queue_name: str) -> str:
+    return f"{queue_name}.dlq"
+
+
+async def declare_retry_topology(channel: aio_pika.abc.AbstractChannel, queue_name: str,
+                                 retry_queues: bool = True):
+    """Объявляет очереди задержки (если повторы идут через них) и DLQ для рабочей очереди"""
+    for attempt in range(1, MESSAGE_MAX_ATTEMPTS + 1 if retry_queues else 1):
+        await channel.declare_queue(
+            retry_queue_name(queue_name, attempt),
+            durable=True,
+            arguments={
+                "x-message-ttl": retry_delay_ms(attempt),
+                # По истечении TTL сообщение возвращается в рабочую очередь
+                "x-dead-letter-exchange": "",
+                "x-dead-letter-routing-key": queue_name,
+            }
+        )
+    await channel.declare_queue(dead_letter_queue_name(queue_name), durable=True)
+
+
+def attempt_of(message: aio_pika.abc.AbstractIncomingMessage) -> int:
+    """Номер текущей попытки обработки (первая доставка - 1)"""
+    return int((message.headers or {}).get(ATTEMPT_HEADER, 0)) + 1
+
+
+def _error_headers(message: aio_pika.abc.AbstractIncomingMessage, attempt: int, error: Exception) -> dict:
+    headers = dict(message.headers or {})
+    headers[ATTEMPT_HEADER] = attempt
+    headers[ERROR_HEADER] = f"{type(error).__name__}: {error}"[:500]
+    return headers
+
+
+async def _republish(channel: aio_pika.abc.AbstractChannel, message: aio_pika.abc.AbstractIncomingMessage,
+                     target: str, headers: dict):
+    """Переотправляет копию сообщения в target и ждёт подтверждения брокера"""
+    if not channel.publisher_confirms:
+        raise RuntimeError("Republishing needs a channel with publisher confirms")
+    confirmation = await channel.default_exchange.publish(
+        aio_pika.Message(
+            body=message.body,
+            headers=headers,
+            content_type=message.content_type,
+            message_id=message.message_id,
+            delivery_mode=aio_pika.DeliveryMode.PERSISTENT
+        ),
+        routing_key=target,
+        mandatory=True
+    )
+    # Nack брокера - исключение в publish; неразмещённое сообщение (нет очереди target)
+    # возвращается вместо Ack - оригинал тоже нельзя подтверждать
+    if not isinstance(confirmation, aiormq.spec.Basic.Ack):
+        raise RuntimeError(f"Broker did not confirm republishing to {target}: {confirmation!r}")
+
+
+async def handle_failure(channel: aio_pika.abc.AbstractChannel,
+                         message: aio_pika.abc.AbstractIncomingMessage,
+                         queue_name: str,
+                         error: Exception):
+    """
+    Переотправляет упавшее сообщение в очередь задержки или в DLQ и ждёт подтверждения брокера.
+    Вызывается внутри message.process(requeue=True) на канале с publisher confirms: если
+    переотправка не подтверждена, оригинал вернётся в очередь, и сообщение не потеряется.
+    """
+    attempt = attempt_of(message)
+    if isinstance(error, NON_RETRYABLE_ERRORS) or attempt >= MESSAGE_MAX_ATTEMPTS:
+        target = dead_letter_queue_name(queue_name)
+        logger.error(f"Message parked in {target} after attempt {attempt}: {error}")
+    else:
+        target = retry_queue_name(queue_name, attempt)
+        logger.warning(f"Message will be retried via {target} (attempt {attempt}): {error}")
+
+    await _republish(channel, message, target, _error_headers(message, attempt, error))
+
+
+async def process_in_order(channel: aio_pika.abc.AbstractChannel,
+                           message: aio_pika.abc.AbstractIncomingMessage,
+                           queue_name: str,
+                           handler: Callable[[], Awaitable[None]]):
+    """
+    Обработка с повторами на месте для очередей с порядком сообщений.
+    handler вызывается до успеха, между попытками - пауза retry_delay_ms; сообщение
+    всё это время не подтверждено, и следующие за ним ждут. После MESSAGE_MAX_ATTEMPTS
+    попыток (или сразу при EventDecodeError) сообщение уходит в DLQ. Остановка воркера
+    прерывает паузу, и сообщение возвращается в очередь.
+    Вызывается внутри message.process(requeue=True), handler должен быть идемпотентным.
+    """
+    attempt = attempt_of(message)
+    while True:
+        try:
+            await handler()
+            return
+        except Exception as e:
+            if isinstance(e, NON_RETRYABLE_ERRORS) or attempt >= MESSAGE_MAX_ATTEMPTS:
+                target = dead_letter_queue_name(queue_name)
+                logger.error(f"Message parked in {target} after attempt {attempt}: {e}")
+                await _republish(channel, message, target, _error_headers(message, attempt, e))
+                return
+            delay = retry_delay_ms(attempt)
+            logger.warning(f"Message from {queue_name} will be retried in place in {delay}ms "
+                           f"(attempt {attempt}): {e}")
+            if await shutdown.sleep(delay / 1000):
+                # Воркер останавливается: сообщение вернётся в голову очереди неподтверждённым
+                raise
+            attempt += 1
+
+
+async def replay_dead_letters(channel: aio_pika.abc.AbstractChannel, queue_name: str,
+                              limit: int = None, dry_run: bool = False) -> int:
+    """Возвращает сообщения из DLQ в рабочую очередь со сброшенным счётчиком попыток"""
+    dlq = await channel.declare_queue(dead_letter_queue_name(queue_name), durable=True)
+    replayed = 0
+    # В режиме dry-run сообщения держатся неподтверждёнными до конца просмотра, затем возвращаются в DLQ
+    inspected = []
+    while limit is None or replayed < limit:
+        message = await dlq.get(no_ack=False, fail=False)
+        if message is None:
+            break
+
+        headers = dict(message.headers or {})
+        error = headers.pop(ERROR_HEADER, None)
+        headers.pop(ATTEMPT_HEADER, None)
+        if dry_run:
+            logger.info(f"[dry-run] {message.message_id or '-'}: {error}")
+            inspected.append(message)
+            replayed += 1
+            continue
+
+        await _republish(channel, message, queue_name, headers)
+        await message.ack()
+        replayed += 1
+
+    for message in inspected:
+        await message.reject(requeue=True)
+    return replayed
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, TypeAdapter
 from datetime import datetime
 from typing import Optional
 from enum import Enum
@@ -30,6 +30,10 @@ class OrderResponse(BaseModel):
         from_attributes = True
 
 
+# Схема списка заказов создаётся один раз, а не на каждый запрос
+ORDER_LIST_ADAPTER = TypeAdapter(list[OrderResponse])
+
+
 # Схема сообщения с результатом оплаты
 # Используется при чтении сообщений из RabbitMQ от сервиса платежей
 class PaymentResult(BaseModel):
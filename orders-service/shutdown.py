@@ -0,0 +1,97 @@
+"""
+Корректная остановка воркеров по SIGTERM/SIGINT (общий для сервисов).
+
+Супервизор и docker stop присылают SIGTERM и ждут GRACEFUL_TIMEOUT, затем SIGKILL.
+Воркер запускается через shutdown.run(main): обработчик сигнала отменяет главную
+задачу, но не посреди работы. Единица работы - сообщение или пачка - оборачивается
+в busy(); если сигнал пришёл во время неё, задача отменяется сразу после выхода из
+последнего busy(). CancelledError выходит из ожидания следующего сообщения или паузы,
+закрывает канал и соединение (async with) и выполняет блоки finally.
+
+Новую работу после сигнала воркер не начинает: консьюмеры, которые вызываются
+не из главной задачи, проверяют requested и оставляют сообщение неподтверждённым -
+брокер вернёт его в очередь при закрытии соединения. Паузы внутри работы (повтор
+на месте) ждут через sleep(), который прерывается сигналом.
+"""
+import asyncio
+import logging
+import signal
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+SIGNALS = (signal.SIGTERM, signal.SIGINT)
+
+
+class GracefulShutdown:
+    def __init__(self):
+        self.requested = False
+        self._busy = 0
+        self._task: Optional[asyncio.Task] = None
+        self._waiters: Set[asyncio.Future] = set()
+
+    def request(self, sig: Optional[int] = None):
+        """Запрос остановки (обработчик сигнала)"""
+        if self.requested:
+            return
+        self.requested = True
+        name = signal.Signals(sig).name if sig is not None else "request"
+        logger.info(f"Stop requested ({name}), in-flight work: {self._busy}")
+        for waiter in self._waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+        if self._busy == 0:
+            self._cancel()
+
+    def _cancel(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+
+    @contextmanager
+    def busy(self):
+        """Единица работы, которую остановка не прерывает"""
+        self._busy += 1
+        try:
+            yield
+        finally:
+            self._busy -= 1
+            if self.requested and self._busy == 0:
+                self._cancel()
+
+    async def sleep(self, seconds: float) -> bool:
+        """Пауза, прерываемая остановкой. True - остановка запрошена"""
+        if self.requested:
+            return True
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.add(waiter)
+        try:
+            await asyncio.wait_for(waiter, timeout=seconds)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self._waiters.discard(waiter)
+        return self.requested
+
+    async def serve(self, main: Callable[[], Awaitable[None]]):
+        """Выполняет main() в текущей задаче до сигнала остановки"""
+        loop = asyncio.get_running_loop()
+        self._task = asyncio.current_task()
+        for sig in SIGNALS:
+            loop.add_signal_handler(sig, self.request, sig)
+        try:
+            await main()
+        except asyncio.CancelledError:
+            if not self.requested:
+                raise
+            logger.info("Worker stopped")
+        finally:
+            for sig in SIGNALS:
+                loop.remove_signal_handler(sig)
+            self._task = None
+
+    def run(self, main: Callable[[], Awaitable[None]]):
+        asyncio.run(self.serve(main))
+
+
+shutdown = GracefulShutdown()
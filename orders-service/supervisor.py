@@ -0,0 +1,171 @@
+"""
+Супервизор процессов сервиса.
+
+Заменяет запуск через `sh -c "... & ... & uvicorn"`:
+- поднимает N процессов uvicorn на общем слушающем сокете (по умолчанию - по числу ядер),
+- N консьюмеров входящих сообщений (worker_inbox.py) и relay исходящих (worker_outbox.py),
+- проверку просроченных оплат (worker_timeouts.py),
+- перезапускает упавшие процессы с экспоненциальной задержкой,
+- пересылает SIGTERM/SIGINT дочерним процессам и ждёт их корректного завершения.
+
+Количество процессов задаётся отдельно для каждой роли:
+API_WORKERS, INBOX_WORKERS, OUTBOX_WORKERS, TIMEOUT_WORKERS.
+"""
+import asyncio
+import logging
+import os
+import signal
+import socket
+import sys
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("supervisor")
+
+HOST = os.getenv("SERVICE_HOST", "0.0.0.0")
+PORT = int(os.getenv("SERVICE_PORT", 8000))
+
+# Сколько ждать корректного завершения дочерних процессов перед SIGKILL
+GRACEFUL_TIMEOUT = float(os.getenv("GRACEFUL_TIMEOUT", 30))
+# Задержка перед перезапуском упавшего процесса (растёт экспоненциально)
+RESTART_BACKOFF_MIN = float(os.getenv("RESTART_BACKOFF_MIN", 0.5))
+RESTART_BACKOFF_MAX = float(os.getenv("RESTART_BACKOFF_MAX", 30))
+# Процесс, проработавший дольше этого времени, считается стабильным - задержка сбрасывается
+STABLE_UPTIME = float(os.getenv("STABLE_UPTIME", 30))
+
+
+def cpu_count() -> int:
+    # sched_getaffinity учитывает ограничения контейнера по ядрам
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def worker_count(env_name: str, default: int) -> int:
+    return max(0, int(os.getenv(env_name, default)))
+
+
+class ManagedProcess:
+    """Дочерний процесс, который перезапускается при падении"""
+
+    def __init__(self, name: str, argv: list, pass_fds: tuple = ()):
+        self.name = name
+        self.argv = argv
+        self.pass_fds = pass_fds
+        self.process = None
+        self.restarts = 0
+
+    async def run(self, stopping: asyncio.Event):
+        loop = asyncio.get_running_loop()
+        backoff = RESTART_BACKOFF_MIN
+
+        while not stopping.is_set():
+            started = loop.time()
+            self.process = await asyncio.create_subprocess_exec(*self.argv, pass_fds=self.pass_fds)
+            logger.info(f"Процесс {self.name} запущен (pid={self.process.pid})")
+            code = await self.process.wait()
+
+            if stopping.is_set():
+                logger.info(f"Процесс {self.name} завершён с кодом {code}")
+                return
+
+            if loop.time() - started >= STABLE_UPTIME:
+                backoff = RESTART_BACKOFF_MIN
+            self.restarts += 1
+            logger.warning(f"Процесс {self.name} упал с кодом {code}, перезапуск через {backoff:.1f} с")
+
+            try:
+                await asyncio.wait_for(stopping.wait(), timeout=backoff)
+                return
+            except asyncio.TimeoutError:
+                pass
+            backoff = min(backoff * 2, RESTART_BACKOFF_MAX)
+
+    def send_signal(self, sig: int):
+        if self.process is not None and self.process.returncode is None:
+            try:
+                self.process.send_signal(sig)
+            except ProcessLookupError:
+                pass
+
+
+def bind_socket() -> socket.socket:
+    """Общий слушающий сокет для всех процессов uvicorn"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((HOST, PORT))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def build_processes(sock: socket.socket) -> list:
+    python = sys.executable
+    here = os.path.dirname(os.path.abspath(__file__))
+    roles = [
+        # (роль, команда, количество по умолчанию, переменная окружения)
+        ("api", [python, os.path.join(here, "supervisor.py"), "api", str(sock.fileno())], cpu_count(), "API_WORKERS"),
+        ("inbox", [python, os.path.join(here, "worker_inbox.py")], 1, "INBOX_WORKERS"),
+        ("outbox", [python, os.path.join(here, "worker_outbox.py")], 1, "OUTBOX_WORKERS"),
+        ("timeouts", [python, os.path.join(here, "worker_timeouts.py")], 1, "TIMEOUT_WORKERS"),
+    ]
+
+    processes = []
+    for role, argv, default, env_name in roles:
+        count = worker_count(env_name, default)
+        logger.info(f"Роль {role}: {count} процесс(ов)")
+        for i in range(count):
+            pass_fds = (sock.fileno(),) if role == "api" else ()
+            processes.append(ManagedProcess(f"{role}-{i + 1}", argv, pass_fds))
+    return processes
+
+
+async def supervise():
+    sock = bind_socket()
+    processes = build_processes(sock)
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stopping.set)
+
+    tasks = [asyncio.create_task(p.run(stopping)) for p in processes]
+    logger.info(f"Супервизор запущен на {HOST}:{PORT}")
+
+    await stopping.wait()
+
+    # Корректное завершение: пересылаем SIGTERM и ждём, пока процессы допишут текущую работу
+    logger.info("Получен сигнал остановки, завершаем дочерние процессы...")
+    for p in processes:
+        p.send_signal(signal.SIGTERM)
+
+    pending = set()
+    if tasks:
+        _, pending = await asyncio.wait(tasks, timeout=GRACEFUL_TIMEOUT)
+    if pending:
+        logger.warning(f"{len(pending)} процесс(ов) не завершились за {GRACEFUL_TIMEOUT} с, SIGKILL")
+        for p in processes:
+            p.send_signal(signal.SIGKILL)
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    sock.close()
+    logger.info("Супервизор остановлен")
+
+
+def run_api_worker(fd: int):
+    """Процесс uvicorn, принимающий соединения с унаследованного сокета"""
+    import uvicorn
+
+    sock = socket.socket(fileno=fd)
+    config = uvicorn.Config(
+        "main:app",
+        log_level=os.getenv("LOG_LEVEL", "info").lower(),
+        timeout_graceful_shutdown=GRACEFUL_TIMEOUT,
+    )
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "api":
+        run_api_worker(int(sys.argv[2]))
+    else:
+        asyncio.run(supervise())
@@ -0,0 +1,109 @@
+import random
+import time
+
+import aio_pika
+import pytest
+from fastapi import HTTPException
+
+import admission as admission_module
+import partitioning
+from admission import AdmissionController
+
+REQUESTS = 10_000
+
+
+class FakeQueue:
+    def __init__(self, depth):
+        self.declaration_result = type("DeclareOk", (), {"message_count": depth})()
+
+
+class FakeChannel:
+    def __init__(self, depths):
+        self.depths = depths
+        self.is_closed = False
+
+    async def declare_queue(self, name, passive):
+        if name not in self.depths:
+            # Так брокер отвечает на пассивное объявление несуществующей очереди
+            self.is_closed = True
+            raise aio_pika.exceptions.ChannelClosed(404, "NOT_FOUND")
+        return FakeQueue(self.depths[name])
+
+
+class FakeConnection:
+    def __init__(self, depths):
+        self.depths = depths
+        self.is_closed = False
+        self.channels = 0
+
+    async def channel(self):
+        self.channels += 1
+        return FakeChannel(self.depths)
+
+
+@pytest.fixture
+def controller(monkeypatch):
+    monkeypatch.setattr(admission_module, "ADMISSION_QUEUE_DEPTH_SOFT", 1_000)
+    monkeypatch.setattr(admission_module, "ADMISSION_QUEUE_DEPTH_HARD", 3_000)
+    monkeypatch.setattr(admission_module, "ADMISSION_OUTBOX_LAG_SOFT", 5.0)
+    monkeypatch.setattr(admission_module, "ADMISSION_OUTBOX_LAG_HARD", 30.0)
+    random.seed(7)
+    controller = AdmissionController()
+    controller.enabled = True
+    return controller
+
+
+def sample(controller, queue_depth=0, outbox_lag=0.0):
+    controller.queue_depth, controller.outbox_lag = queue_depth, outbox_lag
+    controller.sampled_at = time.monotonic()
+
+
+def rejected_share(controller) -> float:
+    rejected = 0
+    for _ in range(REQUESTS):
+        try:
+            controller.check()
+        except HTTPException as e:
+            assert e.status_code == 503 and e.headers["Retry-After"]
+            rejected += 1
+    return rejected / REQUESTS
+
+
+@pytest.mark.parametrize("queue_depth, outbox_lag, expected", [
+    (500, 1.0, 0.0),
+    (2_000, 1.0, 0.5),
+    (500, 23.75, 0.75),
+    (2_000, 23.75, 0.75),
+    (5_000, 0.0, 1.0),
+])
+def test_rejected_share_follows_pressure(controller, queue_depth, outbox_lag, expected):
+    sample(controller, queue_depth, outbox_lag)
+    assert rejected_share(controller) == pytest.approx(expected, abs=0.02)
+    assert controller.stats["admitted"] + controller.stats["rejected"] == REQUESTS
+
+
+def test_stale_samples_admit_everything(controller):
+    sample(controller, queue_depth=5_000)
+    controller.sampled_at -= admission_module.ADMISSION_SAMPLE_INTERVAL * admission_module.STALE_SAMPLES + 1
+    assert rejected_share(controller) == 0.0
+
+
+async def test_sampling_reuses_connection_when_channel_is_closed(controller, monkeypatch):
+    # Очереди одной партиции ещё нет: каждый замер теряет канал на ней
+    depths = {partitioning.partition_queue(p): 10 for p in range(1, partitioning.PAYMENT_PARTITIONS)}
+    depths[partitioning.LEGACY_PAYMENT_QUEUE] = 5
+    connections = []
+
+    async def connect_robust(url):
+        connections.append(FakeConnection(depths))
+        return connections[-1]
+    monkeypatch.setattr(aio_pika, "connect_robust", connect_robust)
+
+    for _ in range(5):
+        assert await controller._sample_queue_depth() == 10 * (partitioning.PAYMENT_PARTITIONS - 1) + 5
+        # Брокер закрыл канал между замерами (например, ошибка канала)
+        controller._channel.is_closed = True
+
+    assert len(connections) == 1
+    # На каждый замер: канал после закрытия и канал после отсутствующей очереди
+    assert connections[0].channels == 5 * 2
@@ -0,0 +1,76 @@
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.pool import StaticPool
+
+import database
+from deadlines import DEADLINE_EXCEEDED_HEADER, DEADLINE_HEADER, QUERY_CANCELED, setup_deadlines
+from main import app
+from models import Base
+
+
+class PgError(Exception):
+    def __init__(self, pgcode):
+        self.pgcode = pgcode
+
+
+@pytest.fixture
+def statements(monkeypatch):
+    """SQL-запросы, дошедшие до БД"""
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    executed = []
+    event.listen(engine, "before_cursor_execute", lambda *args: executed.append(args[2]))
+    monkeypatch.setattr(database, "_engine", engine)
+    monkeypatch.setattr(database, "_read_engines", [])
+    return executed
+
+
+def test_expired_requests_are_shed_before_touching_db(statements):
+    client = TestClient(app)
+    now = time.time()
+    # Очередь запросов после перегрузки: половина клиентов уже перестала ждать ответ
+    backlog = [now - 1 if n % 2 else now + 30 for n in range(20)]
+
+    codes = [
+        client.get("/orders", headers={"X-User-ID": "1", DEADLINE_HEADER: str(deadline)}).status_code
+        for deadline in backlog
+    ]
+
+    assert codes.count(504) == 10 and codes.count(200) == 10
+    assert [code for code, deadline in zip(codes, backlog) if deadline < now] == [504] * 10
+    # В БД ушли только живые запросы
+    assert len(statements) == 10
+
+
+def test_expired_order_creation_is_rejected_without_writes(statements):
+    response = TestClient(app).post(
+        "/orders",
+        json={"amount": 10.0, "description": "Заказ"},
+        headers={"X-User-ID": "1", DEADLINE_HEADER: str(time.time() - 1)},
+    )
+
+    assert response.status_code == 504
+    # Пометка для gateway: инстанс исправен, истёк бюджет запроса
+    assert response.headers[DEADLINE_EXCEEDED_HEADER] == "1"
+    assert statements == []
+
+
+@pytest.mark.parametrize("pgcode, status", [(QUERY_CANCELED, 504), ("23505", 500)])
+def test_uncaught_database_errors_map_to_json_response(pgcode, status):
+    service = FastAPI()
+    setup_deadlines(service)
+
+    @service.get("/boom")
+    async def boom():
+        raise DBAPIError("SELECT 1", {}, PgError(pgcode))
+
+    response = TestClient(service, raise_server_exceptions=False).get("/boom")
+
+    assert response.status_code == status
+    assert "detail" in response.json()
+    assert (DEADLINE_EXCEEDED_HEADER in response.headers) == (status == 504)
@@ -0,0 +1,98 @@
+import json
+
+import aiormq
+import pytest
+
+import events
+import retries
+
+
+class FakeExchange:
+    def __init__(self):
+        self.published = []
+
+    async def publish(self, message, routing_key, mandatory=True):
+        self.published.append((routing_key, message))
+        return aiormq.spec.Basic.Ack()
+
+
+class FakeChannel:
+    publisher_confirms = True
+
+    def __init__(self):
+        self.default_exchange = FakeExchange()
+
+
+class FakeMessage:
+    body = b"{}"
+    content_type = events.JSON_CONTENT_TYPE
+    headers = {}
+    message_id = "m-1"
+
+
+ORDER_CREATED = {"order_id": 1, "user_id": 2, "amount": 10.5}
+
+
+def test_default_producer_format_is_plain_json_without_envelope():
+    assert (events.EVENT_ENVELOPE, events.EVENT_ENCODING) == ("v0", "json")
+    event = events.make_event("order_created", ORDER_CREATED, expires_at=1900000000.0)
+
+    body, content_type = events.encode(event)
+
+    # То, что читает консьюмер до перехода на конверт: json.loads и поля заказа с timestamp
+    legacy = json.loads(body)
+    assert content_type == events.JSON_CONTENT_TYPE
+    assert "v" not in legacy
+    assert {k: legacy[k] for k in ORDER_CREATED} == ORDER_CREATED
+    assert isinstance(legacy["timestamp"], str)
+
+
+def test_v0_event_keeps_expiry_for_new_consumers():
+    event = events.make_event("order_created", ORDER_CREATED, expires_at=1.0)
+    decoded = events.decode(*events.encode(event, envelope="v0"))
+
+    assert decoded["v"] == 0 and decoded["id"] is None
+    assert events.is_expired(decoded)
+
+
+@pytest.mark.parametrize("encoding", sorted(events._CONTENT_TYPES))
+def test_v1_envelope_round_trip(encoding):
+    event = events.make_event("order_created", ORDER_CREATED, event_id="e-1")
+    body, content_type = events.encode(event, encoding=encoding, envelope="v1")
+
+    assert events.decode(body, content_type) == event
+
+
+def test_require_returns_fields_in_order():
+    data = {"success": False, "order_id": 7, "extra": 1}
+    assert events.require(data, order_id=int, success=bool) == (7, False)
+
+
+@pytest.mark.parametrize("data", [
+    {"success": True},
+    {"order_id": "7", "success": True},
+    {"order_id": None, "success": True},
+    [1, 2],
+])
+def test_require_rejects_missing_or_mistyped_fields(data):
+    with pytest.raises(events.EventDecodeError):
+        events.require(data, order_id=int, success=bool)
+
+
+@pytest.mark.parametrize("body", [b"not json", b"[1, 2]", b'{"v": 99, "data": {}}'])
+def test_decode_rejects_broken_bodies(body):
+    with pytest.raises(events.EventDecodeError):
+        events.decode(body, events.JSON_CONTENT_TYPE)
+
+
+@pytest.mark.parametrize("error, target", [
+    (events.EventDecodeError("bad"), "payment.results.dlq"),
+    # Ошибки кода обработки не считаются ядовитыми: сообщение повторяется
+    (KeyError("order_id"), retries.retry_queue_name("payment.results", 1)),
+    (ValueError("boom"), retries.retry_queue_name("payment.results", 1)),
+    (TypeError("boom"), retries.retry_queue_name("payment.results", 1)),
+])
+async def test_only_decode_errors_skip_retries(error, target):
+    channel = FakeChannel()
+    await retries.handle_failure(channel, FakeMessage(), "payment.results", error)
+    assert [routing_key for routing_key, _ in channel.default_exchange.published] == [target]
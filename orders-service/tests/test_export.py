@@ -0,0 +1,61 @@
+import csv
+import io
+from datetime import datetime
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+import export
+from models import Base, Order, OrderStatus
+from serialization import loads
+
+T0 = datetime(2026, 10, 19, 12, 0)
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    monkeypatch.setattr(export, "EXPORT_BATCH_SIZE", 2)
+    engine = create_engine(f"sqlite:///{tmp_path / 'orders.db'}")
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        for n in range(1, 6):
+            session.add(Order(
+                id=n, user_id=1 if n != 3 else 2, amount=float(n), description=f"Заказ, №{n}",
+                status=OrderStatus.NEW, created_at=T0.replace(hour=10 + n)
+            ))
+        session.commit()
+    return engine
+
+
+def test_ndjson_streams_one_chunk_per_batch(engine):
+    chunks = list(export.ndjson_chunks(engine, export.export_statement(user_id=1)))
+
+    # 4 заказа пользователя пачками по EXPORT_BATCH_SIZE = 2
+    assert len(chunks) == 2
+    rows = [loads(line) for chunk in chunks for line in chunk.splitlines()]
+    assert [row["id"] for row in rows] == [1, 2, 4, 5]
+    assert rows[0]["status"] == "NEW" and rows[0]["description"] == "Заказ, №1"
+    assert set(rows[0]) == set(export.EXPORT_FIELDS)
+
+
+def test_csv_has_header_and_escapes_values(engine):
+    chunks = list(export.csv_chunks(engine, export.export_statement()))
+
+    assert len(chunks) == 3
+    rows = list(csv.DictReader(io.StringIO(b"".join(chunks).decode("utf-8"))))
+    assert [row["id"] for row in rows] == ["1", "2", "3", "4", "5"]
+    assert rows[0]["description"] == "Заказ, №1"
+    assert rows[0]["status"] == "NEW"
+    assert rows[0]["created_at"] == "2026-10-19T11:00:00"
+
+
+def test_empty_csv_export_is_header_only(engine):
+    chunks = list(export.csv_chunks(engine, export.export_statement(user_id=42)))
+    assert b"".join(chunks).decode() == ",".join(export.EXPORT_FIELDS) + "\r\n"
+
+
+def test_period_filter_is_half_open(engine):
+    stmt = export.export_statement(since=T0.replace(hour=12), until=T0.replace(hour=14))
+    rows = [loads(line) for chunk in export.ndjson_chunks(engine, stmt) for line in chunk.splitlines()]
+    assert [row["id"] for row in rows] == [2, 3]
@@ -0,0 +1,48 @@
+import asyncio
+import time
+
+import pytest
+
+import loop_monitor as loop_monitor_module
+from loop_monitor import Histogram, LoopMonitor
+
+
+@pytest.fixture
+async def monitor(monkeypatch):
+    monkeypatch.setattr(loop_monitor_module, "LOOP_LAG_INTERVAL", 0.01)
+    monkeypatch.setattr(loop_monitor_module, "LOOP_BLOCK_THRESHOLD", 0.05)
+    monitor = LoopMonitor()
+    monitor.enabled = True
+    await monitor.start()
+    yield monitor
+    monitor._task.cancel()
+
+
+async def test_blocking_call_is_attributed_to_label(monitor):
+    await asyncio.sleep(0.05)
+    with monitor.attribute("x"):
+        time.sleep(0.3)
+    # Даём циклу «тикнуть», а наблюдателю - записать длительность блокировки
+    await asyncio.sleep(0.1)
+
+    assert monitor.stalls == 1
+    assert monitor.blocked["x"]["count"] == 1
+    assert monitor.blocked["x"]["seconds"] >= 0.25
+    assert monitor.lag.max >= 0.25
+
+
+async def test_label_is_restored_after_nested_attribute(monitor):
+    task = asyncio.current_task()
+    with monitor.attribute("outer"):
+        with monitor.attribute("inner"):
+            assert monitor._labels[task] == "inner"
+        assert monitor._labels[task] == "outer"
+    assert task not in monitor._labels
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram(buckets=(0.01, 0.1))
+    for value in (0.005, 0.05, 0.05, 3.0):
+        histogram.observe(value)
+
+    assert histogram.snapshot()["buckets"] == {"0.01": 1, "0.1": 3, "+Inf": 4}
@@ -0,0 +1,282 @@
+import asyncio
+import threading
+
+import aio_pika
+import aiormq
+import pamqp.frame
+import pytest
+from aio_pika.transaction import Transaction
+from aiormq.base import Base as AiormqBase
+from pamqp import commands as spec
+from pamqp.body import ContentBody
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+import outbox_relay
+from models import Base, OutboxMessage
+from outbox_relay import OutboxRelay
+
+
+class FakeExchange:
+    def __init__(self, fail_ids=()):
+        self.written = []
+        self.fail_ids = set(fail_ids)
+
+    async def publish(self, message, routing_key):
+        if int(message.body) in self.fail_ids:
+            raise RuntimeError("channel closed")
+        self.written.append((int(message.body), routing_key))
+        await asyncio.sleep(0.001 * (len(self.written) % 3))
+
+
+class FakeTransaction:
+    def __init__(self, channel):
+        self.channel = channel
+
+    async def select(self):
+        self.channel.selected = True
+
+    async def commit(self):
+        if self.channel.fail_commit:
+            raise RuntimeError("channel closed")
+        self.channel.committed.append(len(self.channel.default_exchange.written))
+
+
+class FakeChannel:
+    """Транзакционный канал: committed - сколько сообщений было записано к каждому commit"""
+    is_closed = False
+
+    def __init__(self, fail_commit=False, **kwargs):
+        self.default_exchange = FakeExchange(**kwargs)
+        self.fail_commit = fail_commit
+        self.selected = False
+        self.committed = []
+
+    def transaction(self):
+        return FakeTransaction(self)
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'outbox.db'}")
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        for n in range(1, 8):
+            session.add(OutboxMessage(id=n, event_type="order_created", event_data=str(n).encode(),
+                                      routing_key=f"orders.to_pay.p{n % 2}" if n != 4 else None))
+        session.commit()
+    return engine
+
+
+async def active_relay(engine, **kwargs):
+    relay = OutboxRelay(engine, OutboxMessage, default_routing_key="orders.to_pay", **kwargs)
+    assert await relay._in_db_thread(relay._acquire)
+    return relay
+
+
+def processed_ids(engine):
+    with Session(engine) as session:
+        return [m.id for m in session.query(OutboxMessage).filter(OutboxMessage.processed == True).order_by(OutboxMessage.id)]
+
+
+async def test_batch_is_written_in_id_order_and_marked(engine):
+    relay = await active_relay(engine, batch_size=5)
+    channel = FakeChannel()
+
+    assert await relay.relay_batch(channel) == 5
+    assert await relay.relay_batch(channel) == 2
+
+    assert [n for n, _ in channel.default_exchange.written] == list(range(1, 8))
+    assert channel.default_exchange.written[3] == (4, "orders.to_pay")
+    # Один commit на пачку, после всех её сообщений
+    assert channel.committed == [5, 7]
+    assert processed_ids(engine) == list(range(1, 8))
+
+
+@pytest.mark.parametrize("channel_kwargs", [{"fail_ids": {3}}, {"fail_commit": True}])
+async def test_uncommitted_batch_is_not_marked(engine, channel_kwargs):
+    relay = await active_relay(engine, batch_size=10)
+    channel = FakeChannel(**channel_kwargs)
+
+    with pytest.raises(RuntimeError):
+        await relay.relay_batch(channel)
+
+    assert channel.committed == []
+    assert processed_ids(engine) == []
+    assert relay.stats["failed"] == 7
+
+    # После переподключения пачка уходит целиком
+    assert await relay.relay_batch(FakeChannel()) == 7
+    assert processed_ids(engine) == list(range(1, 8))
+
+
+async def test_session_is_used_from_one_thread(engine, monkeypatch):
+    threads = set()
+    for name in ("_claim", "_mark_processed"):
+        original = getattr(OutboxRelay, name)
+
+        def traced(self, *args, _original=original):
+            threads.add(threading.get_ident())
+            return _original(self, *args)
+        monkeypatch.setattr(OutboxRelay, name, traced)
+    relay = await active_relay(engine, batch_size=3)
+
+    for _ in range(3):
+        await relay.relay_batch(FakeChannel())
+
+    assert len(threads) == 1 and threading.get_ident() not in threads
+
+
+class WireConnection(AiormqBase):
+    """Соединение aiormq без сокета: кадры каналов остаются в write_queue"""
+    publisher_confirms = False
+
+    class connection_tune:
+        frame_max = 131072
+
+    def __init__(self):
+        super().__init__(loop=asyncio.get_running_loop())
+        self.write_queue = asyncio.Queue()
+
+    def __str__(self):
+        return "wire"
+
+    async def _on_close(self, exc=None):
+        pass
+
+
+class WireChannel:
+    """Канал aio-pika поверх настоящего aiormq.Channel"""
+    is_closed = False
+    publisher_confirms = False
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.default_exchange = aio_pika.Exchange(self, "", durable=True)
+
+    async def get_underlay_channel(self):
+        return self.channel
+
+    def transaction(self):
+        return Transaction(self)
+
+
+def written_frames(frame) -> list:
+    payload, decoded_frames = frame.payload, []
+    while payload:
+        consumed, _, decoded = pamqp.frame.unmarshal(payload)
+        payload = payload[consumed:]
+        decoded_frames.append(decoded)
+    return decoded_frames
+
+
+async def test_real_aiormq_channel_writes_batch_in_id_order_then_commits():
+    connection = WireConnection()
+    channel = aiormq.Channel(connection, 1, publisher_confirms=False)
+    relay = OutboxRelay(None, OutboxMessage, default_routing_key="orders.to_pay")
+    rows = [(n, str(n).encode(), "application/json", "orders.to_pay.p0") for n in range(1, 51)]
+
+    publishing = asyncio.create_task(relay._publish(WireChannel(channel), rows))
+    written = []
+    while True:
+        frame = await asyncio.wait_for(connection.write_queue.get(), timeout=1)
+        decoded = written_frames(frame)
+        frame.drain()
+        if isinstance(decoded[0], spec.Tx.Commit):
+            break
+        written += [int(body.value) for body in decoded if isinstance(body, ContentBody)]
+    # Пока брокер не ответил на commit, пачка не считается отправленной
+    await asyncio.sleep(0.01)
+    assert not publishing.done()
+    await channel.frames.put((0, spec.Tx.CommitOk()))
+
+    assert written == list(range(1, 51))
+    assert await asyncio.wait_for(publishing, timeout=1) == list(range(1, 51))
+    await channel.close()
+
+
+class AdvisoryLocks:
+    """pg_try_advisory_lock в памяти: ключ занят, пока владелец не отпустит соединение"""
+
+    def __init__(self):
+        self.owners = {}
+
+    def install(self, monkeypatch):
+        locks = self
+
+        def try_lock(relay, connection):
+            return locks.owners.setdefault(relay.lock_key, relay) is relay
+
+        def unlock(relay, connection):
+            locks.owners.pop(relay.lock_key, None)
+        monkeypatch.setattr(OutboxRelay, "_try_lock", try_lock)
+        monkeypatch.setattr(OutboxRelay, "_unlock", unlock)
+
+
+class FakeConnection:
+    def __init__(self):
+        self.channel_ = FakeChannel()
+
+    async def channel(self, publisher_confirms=True):
+        assert not publisher_confirms
+        return self.channel_
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+def add_messages(engine, ids):
+    with Session(engine) as session:
+        for n in ids:
+            session.add(OutboxMessage(id=n, event_type="order_created", event_data=str(n).encode(),
+                                      routing_key="orders.to_pay.p0"))
+        session.commit()
+
+
+async def wait_processed(engine, count):
+    for _ in range(500):
+        if len(processed_ids(engine)) == count:
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"processed {processed_ids(engine)}")
+
+
+async def test_only_one_of_racing_relays_publishes(engine, monkeypatch):
+    AdvisoryLocks().install(monkeypatch)
+    monkeypatch.setattr(outbox_relay, "OUTBOX_STANDBY_INTERVAL", 0.01)
+    connections = []
+
+    async def connect(url):
+        connections.append(FakeConnection())
+        return connections[-1]
+    monkeypatch.setattr(outbox_relay.aio_pika, "connect", connect)
+    relays = [OutboxRelay(engine, OutboxMessage, default_routing_key="orders.to_pay", batch_size=3,
+                          poll_interval=0.01) for _ in range(2)]
+    tasks = [asyncio.create_task(relay.run()) for relay in relays]
+    try:
+        await wait_processed(engine, 7)
+        add_messages(engine, range(8, 30))
+        await wait_processed(engine, 29)
+
+        # Публиковал только один relay, и строго по id
+        assert len(connections) == 1
+        assert connections[0].channel_.selected
+        written = [n for n, _ in connections[0].channel_.default_exchange.written]
+        assert written == list(range(1, 30))
+
+        # Активный relay остановлен - резервный забирает блокировку и продолжает
+        active = next(i for i, relay in enumerate(relays) if relay.stats["published"])
+        tasks[active].cancel()
+        await asyncio.gather(tasks[active], return_exceptions=True)
+        add_messages(engine, range(30, 40))
+        await wait_processed(engine, 39)
+
+        assert len(connections) == 2
+        assert [n for n, _ in connections[1].channel_.default_exchange.written] == list(range(30, 40))
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
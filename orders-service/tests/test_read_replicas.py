@@ -0,0 +1,52 @@
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+import database
+from main import app
+from models import Base, Order, OrderStatus
+
+
+def sqlite_engine(path, description):
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add(Order(id=1, user_id=1, amount=10.0, description=description, status=OrderStatus.NEW))
+        session.commit()
+    return engine
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    # Реплика - отдельная база, поэтому по описанию заказа видно, откуда прочитан ответ
+    monkeypatch.setattr(database, "_engine", sqlite_engine(tmp_path / "primary.db", "primary"))
+    monkeypatch.setattr(database, "_read_engines", [sqlite_engine(tmp_path / "replica.db", "replica")])
+    return TestClient(app)
+
+
+def read_order(client, **headers):
+    response = client.get("/orders/1", headers={"X-User-ID": "1", **headers})
+    assert response.status_code == 200
+    return response.json()["description"]
+
+
+def test_reads_go_to_replica(client):
+    assert read_order(client) == "replica"
+    assert [order["description"] for order in client.get("/orders", headers={"X-User-ID": "1"}).json()] == ["replica"]
+
+
+def test_recent_write_reads_from_primary(client):
+    assert read_order(client, **{"X-Read-After": str(time.time())}) == "primary"
+
+
+def test_write_older_than_window_reads_from_replica(client):
+    stale = time.time() - database.READ_YOUR_WRITES_WINDOW - 1
+    assert read_order(client, **{"X-Read-After": str(stale)}) == "replica"
+
+
+def test_without_replicas_reads_from_primary(client, monkeypatch):
+    monkeypatch.setattr(database, "_read_engines", [])
+    assert read_order(client) == "primary"
@@ -0,0 +1,69 @@
+from datetime import datetime, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+
+import database
+import profiling
+import rollups
+from main import app
+from models import Base, OrderRollup
+
+ADMIN = {"X-Admin-Token": "secret"}
+BUCKET = datetime(2026, 10, 19, 12, 0)
+
+
+@pytest.fixture
+def engine(monkeypatch):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        # Одна минута в двух шардах: при чтении шарды суммируются
+        session.add_all([
+            OrderRollup(bucket_start=BUCKET, shard=0, status="NEW", orders_count=2, amount_sum=20.0),
+            OrderRollup(bucket_start=BUCKET, shard=3, status="NEW", orders_count=1, amount_sum=5.0),
+            OrderRollup(bucket_start=BUCKET, shard=1, status="FINISHED", orders_count=4, amount_sum=40.0),
+        ])
+        session.commit()
+    monkeypatch.setattr(database, "_engine", engine)
+    monkeypatch.setattr(database, "_read_engines", [])
+    monkeypatch.setattr(profiling, "ADMIN_TOKEN", "secret")
+    return engine
+
+
+def test_read_rollups_sums_shards(engine):
+    with Session(engine) as session:
+        rows = rollups.read_rollups(session, BUCKET, BUCKET.replace(minute=1))
+
+    assert [(row["status"], row["orders"], row["amount"]) for row in rows] == [
+        ("FINISHED", 4, 40.0), ("NEW", 3, 25.0),
+    ]
+
+
+@pytest.mark.parametrize("since, until", [
+    ("2026-10-19T11:30:00", "2026-10-19T12:30:00+00:00"),
+    ("2026-10-19T11:30:00+00:00", "2026-10-19T12:30:00"),
+    ("2026-10-19T11:30:00", "2026-10-19T12:30:00"),
+    ("2026-10-19T14:30:00+03:00", "2026-10-19T12:30:00Z"),
+])
+def test_naive_and_aware_bounds_are_accepted(engine, since, until):
+    response = TestClient(app).get("/admin/rollups", params={"since": since, "until": until}, headers=ADMIN)
+
+    assert response.status_code == 200
+    assert sum(row["orders"] for row in response.json()) == 7
+
+
+def test_naive_since_with_default_until(engine):
+    since = datetime.now(timezone.utc).replace(tzinfo=None).isoformat()
+    response = TestClient(app).get("/admin/rollups", params={"since": since}, headers=ADMIN)
+    assert response.status_code == 200
+
+
+def test_range_is_limited(engine):
+    response = TestClient(app).get(
+        "/admin/rollups", params={"since": "2026-10-01T00:00:00", "until": "2026-10-19T00:00:00Z"}, headers=ADMIN
+    )
+    assert response.status_code == 400
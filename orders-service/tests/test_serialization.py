@@ -0,0 +1,107 @@
+from datetime import datetime, timezone
+from decimal import Decimal
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import serialization
+from models import OrderStatus
+from schemas import ORDER_LIST_ADAPTER, OrderResponse
+from websocket_manager import WebSocketManager
+
+EVENT = {
+    "type": "order_update",
+    "order_id": 1,
+    "status": OrderStatus.FINISHED,
+    "amount": Decimal("10.50"),
+    "created_at": datetime(2026, 10, 19, 12, 0, tzinfo=timezone.utc),
+    "description": "Заказ",
+}
+
+
+@pytest.fixture(params=sorted(serialization._BACKENDS))
+def backend(request):
+    previous = serialization.get_backend().name
+    serialization.set_backend(request.param)
+    yield request.param
+    serialization.set_backend(previous)
+
+
+def test_backends_encode_extra_types(backend):
+    decoded = serialization.loads(serialization.dumps(EVENT))
+    assert decoded == {
+        "type": "order_update",
+        "order_id": 1,
+        "status": "FINISHED",
+        "amount": 10.5,
+        "created_at": "2026-10-19T12:00:00+00:00",
+        "description": "Заказ",
+    }
+
+
+def test_dumps_str_keeps_unicode(backend):
+    assert "Заказ" in serialization.dumps_str({"description": "Заказ"})
+
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError):
+        serialization.set_backend("pickle")
+
+
+ORDER_ROW = {
+    "id": 1,
+    "user_id": 7,
+    "amount": 10.5,
+    "description": None,
+    "status": OrderStatus.NEW,
+    "created_at": datetime(2026, 10, 19, 12, 0, 0, 123456, tzinfo=timezone.utc),
+}
+
+
+def test_validated_response_writes_utc_with_z_suffix():
+    response = serialization.validated_response(ORDER_LIST_ADAPTER, [ORDER_ROW])
+    assert serialization.loads(response.body)[0]["created_at"] == "2026-10-19T12:00:00.123456Z"
+
+
+def test_validated_response_matches_response_model_output():
+    # Прежний путь: модель из эндпоинта, сериализация FastAPI по response_model
+    app = FastAPI(default_response_class=serialization.FastJSONResponse)
+    rows = [ORDER_ROW, {**ORDER_ROW, "id": 2, "created_at": datetime(2026, 10, 19, 12, 0)}]
+
+    @app.get("/before", response_model=list[OrderResponse])
+    def before():
+        return [OrderResponse.model_validate(row) for row in rows]
+
+    @app.get("/after", response_model=list[OrderResponse])
+    def after():
+        return serialization.validated_response(ORDER_LIST_ADAPTER, rows)
+
+    client = TestClient(app)
+    assert client.get("/after").content == client.get("/before").content
+
+
+def test_fast_json_response_renders_with_backend():
+    response = serialization.FastJSONResponse({"status": OrderStatus.NEW})
+    assert serialization.loads(response.body) == {"status": "NEW"}
+
+
+class FakeSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def send_text(self, payload):
+        self.sent.append(payload)
+
+
+async def test_fan_out_sends_same_encoded_payload_to_every_socket():
+    manager = WebSocketManager()
+    sockets = [FakeSocket(), FakeSocket(), FakeSocket()]
+    manager.active_connections[7] = set(sockets)
+
+    await manager.broadcast_order_update(order_id=1, user_id=7, status="NEW", amount=5.0)
+
+    payloads = [socket.sent[0] for socket in sockets]
+    # Событие закодировано один раз: все получатели получили один и тот же объект строки
+    assert all(payload is payloads[0] for payload in payloads)
+    assert serialization.loads(payloads[0])["order_id"] == 1
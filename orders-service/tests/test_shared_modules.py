@@ -0,0 +1,28 @@
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[2]
+
+# Общие модули лежат копией в каталоге каждого сервиса (у каждого свой образ Docker).
+# Исправление вносится в одну копию и копируется в остальные - иначе тест упадёт
+
+SHARED_MODULES = {
+    "serialization.py": ("orders-service", "payments-service", "api-gateway"),
+    "loop_monitor.py": ("orders-service", "payments-service", "api-gateway"),
+    "profiling.py": ("orders-service", "payments-service", "api-gateway"),
+    "events.py": ("orders-service", "payments-service"),
+    "retries.py": ("orders-service", "payments-service"),
+    "partitioning.py": ("orders-service", "payments-service"),
+    "outbox_relay.py": ("orders-service", "payments-service"),
+    "deadlines.py": ("orders-service", "payments-service"),
+    "shutdown.py": ("orders-service", "payments-service"),
+}
+
+
+@pytest.mark.parametrize("module", sorted(SHARED_MODULES))
+def test_shared_module_copies_are_identical(module):
+    services = SHARED_MODULES[module]
+    reference = (ROOT / services[0] / module).read_bytes()
+    drifted = [service for service in services[1:] if (ROOT / service / module).read_bytes() != reference]
+    assert not drifted, f"{module} differs from {services[0]}/{module} in: {', '.join(drifted)}"
@@ -0,0 +1,56 @@
+import asyncio
+import os
+import signal
+
+from shutdown import GracefulShutdown
+
+
+async def test_sigterm_waits_for_work_in_progress():
+    shutdown = GracefulShutdown()
+    started, release = asyncio.Event(), asyncio.Event()
+    log = []
+
+    async def worker():
+        try:
+            while True:
+                with shutdown.busy():
+                    started.set()
+                    await release.wait()
+                    log.append("message done")
+                # Ожидание следующего сообщения: здесь задачу и отменяет остановка
+                await asyncio.sleep(60)
+        finally:
+            log.append("finally")
+
+    task = asyncio.create_task(shutdown.serve(worker))
+    await started.wait()
+    os.kill(os.getpid(), signal.SIGTERM)
+    await asyncio.sleep(0.05)
+    assert not task.done()
+
+    release.set()
+    await asyncio.wait_for(task, timeout=5)
+    assert log == ["message done", "finally"]
+
+
+async def test_sigterm_interrupts_idle_wait():
+    shutdown = GracefulShutdown()
+    log = []
+
+    async def worker():
+        try:
+            await asyncio.sleep(60)
+        finally:
+            log.append("finally")
+
+    task = asyncio.create_task(shutdown.serve(worker))
+    await asyncio.sleep(0.01)
+    os.kill(os.getpid(), signal.SIGTERM)
+    await asyncio.wait_for(task, timeout=5)
+    assert log == ["finally"]
+
+
+async def test_sleep_is_cut_short_by_stop():
+    shutdown = GracefulShutdown()
+    asyncio.get_running_loop().call_later(0.01, shutdown.request)
+    assert await asyncio.wait_for(shutdown.sleep(60), timeout=5)
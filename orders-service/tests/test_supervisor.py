@@ -0,0 +1,122 @@
+import asyncio
+import json
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+import supervisor
+from models import Base, Order, OrderStatus
+
+CRASH = [sys.executable, "-c", "import sys; sys.exit(3)"]
+SLEEP = [sys.executable, "-c", "import time; time.sleep(60)"]
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Настоящий воркер таймаутов; агрегаты пишутся upsert-ом PostgreSQL, на SQLite их отключаем
+TIMEOUT_WORKER = [sys.executable, "-c", (
+    "import rollups, worker_timeouts\n"
+    "from shutdown import shutdown\n"
+    "rollups.record_transition = lambda *args: None\n"
+    "shutdown.run(worker_timeouts.process_payment_timeouts)\n"
+)]
+
+
+async def test_crashed_process_is_restarted_with_backoff(monkeypatch):
+    monkeypatch.setattr(supervisor, "RESTART_BACKOFF_MIN", 0.01)
+    monkeypatch.setattr(supervisor, "RESTART_BACKOFF_MAX", 0.02)
+    stopping = asyncio.Event()
+    process = supervisor.ManagedProcess("crash", CRASH)
+
+    task = asyncio.create_task(process.run(stopping))
+    while process.restarts < 3:
+        await asyncio.sleep(0.01)
+    stopping.set()
+    await asyncio.wait_for(task, timeout=5)
+
+    assert process.process.returncode == 3
+
+
+async def test_sigterm_stops_process_without_restart():
+    stopping = asyncio.Event()
+    process = supervisor.ManagedProcess("sleep", SLEEP)
+
+    task = asyncio.create_task(process.run(stopping))
+    while process.process is None:
+        await asyncio.sleep(0.01)
+    stopping.set()
+    process.send_signal(signal.SIGTERM)
+    await asyncio.wait_for(task, timeout=5)
+
+    assert process.restarts == 0
+    assert process.process.returncode == -signal.SIGTERM
+
+
+def test_worker_counts_are_set_per_role(monkeypatch):
+    monkeypatch.setenv("API_WORKERS", "3")
+    monkeypatch.setenv("INBOX_WORKERS", "2")
+    monkeypatch.setenv("OUTBOX_WORKERS", "0")
+    monkeypatch.setenv("TIMEOUT_WORKERS", "1")
+    sock = socket.socket()
+    try:
+        names = [p.name for p in supervisor.build_processes(sock)]
+    finally:
+        sock.close()
+
+    assert names == ["api-1", "api-2", "api-3", "inbox-1", "inbox-2", "timeouts-1"]
+
+
+class SlowPayments(BaseHTTPRequestHandler):
+    """Сервис платежей, который отвечает через секунду: воркер получит SIGTERM посреди пачки"""
+    started = threading.Event()
+
+    def do_GET(self):
+        self.started.set()
+        time.sleep(1)
+        body = json.dumps({"items": [], "next_cursor": None}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+async def test_sigterm_lets_worker_finish_its_batch(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'orders.db'}")
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add(Order(id=1, user_id=1, amount=10.0, status=OrderStatus.NEW,
+                          payment_due_at=datetime.now(timezone.utc) - timedelta(minutes=1)))
+        session.commit()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), SlowPayments)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setenv("PYTHONPATH", SERVICE_DIR)
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'orders.db'}")
+    monkeypatch.setenv("PAYMENTS_SERVICE_URL", f"http://127.0.0.1:{server.server_port}")
+    # Redis недоступен: уведомление не уйдёт, но статус заказа к этому времени уже записан
+    monkeypatch.setenv("REDIS_URL", "redis://127.0.0.1:1")
+
+    stopping = asyncio.Event()
+    process = supervisor.ManagedProcess("timeouts", TIMEOUT_WORKER)
+    task = asyncio.create_task(process.run(stopping))
+    try:
+        assert await asyncio.to_thread(SlowPayments.started.wait, 10)
+        stopping.set()
+        process.send_signal(signal.SIGTERM)
+        await asyncio.wait_for(task, timeout=10)
+    finally:
+        server.shutdown()
+
+    # Воркер дождался ответа, закрыл заказ и вышел сам, а не был убит сигналом
+    assert process.process.returncode == 0
+    with Session(engine) as session:
+        assert session.get(Order, 1).status == OrderStatus.CANCELLED
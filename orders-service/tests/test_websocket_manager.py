@@ -0,0 +1,109 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+import websocket_manager
+from serialization import dumps_str, loads
+from websocket_manager import WebSocketManager
+
+
+class FakeSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def send_text(self, payload):
+        self.sent.append(payload)
+
+
+class FakePubSub:
+    def __init__(self, payloads):
+        self.payloads = payloads
+
+    async def listen(self):
+        yield {"type": "subscribe", "data": 1}
+        for payload in self.payloads:
+            yield {"type": "message", "data": payload}
+
+
+def order_update(status, origin="worker", event_id=None):
+    return dumps_str({
+        "type": "order_update",
+        "event_id": event_id or f"order:1:{status}",
+        "origin": origin,
+        "order_id": 1,
+        "user_id": 7,
+        "status": status,
+    })
+
+
+@pytest.fixture
+def manager():
+    manager = WebSocketManager()
+    manager.socket = FakeSocket()
+    manager.active_connections[7] = {manager.socket}
+    return manager
+
+
+async def listen(manager, *payloads):
+    manager.pubsub = FakePubSub(payloads)
+    await manager.listen_to_redis()
+    return [loads(payload)["status"] for payload in manager.socket.sent]
+
+
+def test_is_new_event_forgets_oldest_beyond_window(monkeypatch):
+    monkeypatch.setattr(websocket_manager, "EVENT_DEDUP_WINDOW", 2)
+    manager = WebSocketManager()
+
+    assert manager.is_new_event("a") and manager.is_new_event("b")
+    assert not manager.is_new_event("a")
+    assert manager.is_new_event("c")
+    # "a" вытеснено из окна и снова считается новым
+    assert manager.is_new_event("a")
+
+
+async def test_redelivered_status_event_reaches_client_once(manager):
+    # Воркер результатов оплат обработал сообщение дважды, воркер таймаутов прислал тот же переход
+    statuses = await listen(
+        manager,
+        order_update("FINISHED"),
+        order_update("FINISHED"),
+        order_update("FINISHED", origin="timeouts"),
+    )
+
+    assert statuses == ["FINISHED"]
+    assert manager.stats["skipped_duplicate"] == 2
+
+
+async def test_different_transitions_are_not_deduplicated(manager):
+    statuses = await listen(manager, order_update("NEW"), order_update("FINISHED"))
+    assert statuses == ["NEW", "FINISHED"]
+
+
+async def test_own_events_are_skipped_by_origin(manager):
+    statuses = await listen(
+        manager,
+        order_update("NEW", origin=manager.origin, event_id="local-1"),
+        order_update("CANCELLED"),
+    )
+
+    assert statuses == ["CANCELLED"]
+    assert manager.stats["skipped_own"] == 1
+
+
+async def test_own_broadcast_is_sent_locally_once(manager):
+    await manager.broadcast_order_update(order_id=1, user_id=7, status="NEW")
+    # Та же строка возвращается из Redis - клиент не получит её второй раз
+    statuses = await listen(manager, manager.socket.sent[0])
+
+    assert statuses == ["NEW"]
+
+
+def test_closed_socket_is_unregistered(monkeypatch):
+    manager = WebSocketManager()
+    monkeypatch.setattr(main, "ws_manager", manager)
+
+    with TestClient(main.app).websocket_connect("/ws/7") as ws:
+        ws.receive_text()
+        assert 7 in manager.active_connections
+
+    assert manager.active_connections == {}
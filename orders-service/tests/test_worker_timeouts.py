@@ -0,0 +1,84 @@
+from datetime import datetime, timedelta, timezone
+
+import fakeredis
+import httpx
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+import worker_timeouts
+from models import Base, Order, OrderStatus, OrderRollup
+from serialization import loads
+
+
+def utc(seconds: float) -> datetime:
+    return datetime.now(timezone.utc) + timedelta(seconds=seconds)
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'orders.db'}")
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add_all([
+            Order(id=1, user_id=1, amount=10.0, status=OrderStatus.NEW, payment_due_at=utc(-120)),
+            Order(id=2, user_id=2, amount=20.0, status=OrderStatus.NEW, payment_due_at=utc(-60)),
+            Order(id=3, user_id=3, amount=30.0, status=OrderStatus.NEW, payment_due_at=utc(600)),
+            Order(id=4, user_id=4, amount=40.0, status=OrderStatus.FINISHED, payment_due_at=utc(-60)),
+        ])
+        session.commit()
+    return engine
+
+
+def test_claimed_orders_are_hidden_from_other_workers(engine):
+    first = worker_timeouts.claim_due_orders(engine)
+    second = worker_timeouts.claim_due_orders(engine)
+
+    assert [order.id for order in first] == [1, 2]
+    assert second == []
+
+
+def test_claim_expires_if_worker_dies(engine, monkeypatch):
+    monkeypatch.setattr(worker_timeouts, "PAYMENT_TIMEOUT_CLAIM_TTL", -1)
+    worker_timeouts.claim_due_orders(engine)
+
+    # Срок забранных заказов не продлён - их заберёт следующий воркер
+    assert [order.id for order in worker_timeouts.claim_due_orders(engine)] == [1, 2]
+
+
+def payments(statuses):
+    def handler(request: httpx.Request) -> httpx.Response:
+        status = statuses.get(int(request.url.params["order_id"]))
+        return httpx.Response(200, json={"items": [{"status": status}] if status else [], "next_cursor": None})
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+async def test_check_order_resolves_by_transaction_status(engine, monkeypatch):
+    # Агрегаты считаются функциями PostgreSQL - здесь только проверяем переходы
+    transitions = []
+    monkeypatch.setattr(worker_timeouts.rollups, "record_transition",
+                        lambda session, order_id, amount, old, new: transitions.append((order_id, old, new)))
+    redis_client = fakeredis.aioredis.FakeRedis()
+    pubsub = redis_client.pubsub()
+    await pubsub.subscribe("order_updates")
+    async with payments({1: "SUCCESS"}) as client:
+        for order in worker_timeouts.claim_due_orders(engine):
+            await worker_timeouts.check_order(engine, client, redis_client, *order)
+
+    with Session(engine) as session:
+        statuses = dict(session.query(Order.id, Order.status).order_by(Order.id).all())
+    assert statuses[1] == OrderStatus.FINISHED
+    # Транзакции нет - заказ отменяется
+    assert statuses[2] == OrderStatus.CANCELLED
+    assert transitions == [(1, OrderStatus.NEW, OrderStatus.FINISHED), (2, OrderStatus.NEW, OrderStatus.CANCELLED)]
+
+    await pubsub.get_message(timeout=0.1)  # подтверждение подписки
+    published = [loads((await pubsub.get_message(timeout=0.1))["data"]) for _ in range(2)]
+    assert [event["event_id"] for event in published] == ["order:1:FINISHED", "order:2:CANCELLED"]
+
+
+def test_resolve_skips_order_that_is_no_longer_new(engine):
+    assert not worker_timeouts.resolve_order(engine, 4, 40.0, OrderStatus.CANCELLED)
+    with Session(engine) as session:
+        assert session.get(Order, 4).status == OrderStatus.FINISHED
+        assert session.query(OrderRollup).count() == 0
@@ -1,14 +1,20 @@
 import asyncio
-import json
 import logging
+import uuid
+from collections import OrderedDict
 from typing import Dict, Set
 from fastapi import WebSocket
 from contextlib import asynccontextmanager
 import redis.asyncio as aioredis
 import os
 
+from serialization import DecodeError, dumps_str, loads
+
 logger = logging.getLogger(__name__)
 
+# Сколько последних event_id помнить для отсечения повторных доставок
+EVENT_DEDUP_WINDOW = int(os.getenv("WS_EVENT_DEDUP_WINDOW", 10_000))
+
 
 class WebSocketManager:
     def __init__(self):
@@ -17,6 +23,20 @@ class WebSocketManager:
         self.redis_client = None
         self.pubsub = None
         self.instance_id = os.getenv("INSTANCE_ID", "1")
+        # Источник событий этого процесса: инстанс, PID воркера и случайный суффикс
+        # (после перезапуска PID может повториться)
+        self.origin = f"{self.instance_id}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.seen_events: "OrderedDict[str, None]" = OrderedDict()
+        self.stats = {"sent": 0, "skipped_own": 0, "skipped_duplicate": 0}
+
+    def is_new_event(self, event_id: str) -> bool:
+        """Запоминает event_id; False, если событие уже доставлялось"""
+        if event_id in self.seen_events:
+            return False
+        self.seen_events[event_id] = None
+        if len(self.seen_events) > EVENT_DEDUP_WINDOW:
+            self.seen_events.popitem(last=False)
+        return True
 
     async def connect_redis(self):
         """Подключение к Redis для pub/sub"""
@@ -55,32 +75,44 @@ class WebSocketManager:
 
     async def send_personal_message(self, message: dict, user_id: int):
         """Отправка сообщения конкретному пользователю"""
+        await self.send_encoded(dumps_str(message), user_id)
+
+    async def send_encoded(self, payload: str, user_id: int):
+        """Отправка уже сериализованного сообщения всем сокетам пользователя.
+
+        Событие кодируется один раз, и одни и те же байты уходят каждому получателю.
+        """
         if user_id in self.active_connections:
-            for connection in self.active_connections[user_id]:
+            for connection in list(self.active_connections[user_id]):
                 try:
-                    await connection.send_json(message)
+                    await connection.send_text(payload)
+                    self.stats["sent"] += 1
                 except Exception as e:
                     logger.error(f"Error sending message to user {user_id}: {e}")
 
     async def broadcast_order_update(self, order_id: int, user_id: int, status: str, amount: float = None):
         """Отправка обновления статуса заказа всем подключенным клиентам пользователя"""
+        event_id = uuid.uuid4().hex
         message = {
             "type": "order_update",
+            "event_id": event_id,
+            "origin": self.origin,
             "order_id": order_id,
             "user_id": user_id,
             "status": status,
             "amount": amount,
-            "timestamp": asyncio.get_event_loop().time(),
-            "message": f"Статус заказа #{order_id} изменен на: {status}"
+            "timestamp": asyncio.get_event_loop().time()
         }
+        payload = dumps_str(message)
 
-        # Отправляем локально подключенным клиентам
-        await self.send_personal_message(message, user_id)
+        # Отправляем локально подключенным клиентам.
+        # Своё же событие из Redis этот процесс пропустит по origin.
+        await self.send_encoded(payload, user_id)
 
         # Публикуем в Redis для других инстансов
         if self.redis_client:
             try:
-                await self.redis_client.publish("order_updates", json.dumps(message))
+                await self.redis_client.publish("order_updates", payload)
                 logger.info(f"Order update published to Redis: {order_id} -> {status}")
             except Exception as e:
                 logger.error(f"Failed to publish to Redis: {e}")
@@ -95,14 +127,24 @@ class WebSocketManager:
         try:
             async for message in self.pubsub.listen():
                 if message["type"] == "message":
+                    # Нет подключенных клиентов - незачем разбирать событие
+                    if not self.active_connections:
+                        continue
                     try:
-                        data = json.loads(message["data"])
+                        data = loads(message["data"])
                         if data["type"] == "order_update":
+                            if data.get("origin") == self.origin:
+                                self.stats["skipped_own"] += 1
+                                continue
+                            event_id = data.get("event_id")
+                            if event_id and not self.is_new_event(event_id):
+                                self.stats["skipped_duplicate"] += 1
+                                continue
                             user_id = data["user_id"]
-                            # Отправляем сообщение всем локально подключенным клиентам этого пользователя
-                            await self.send_personal_message(data, user_id)
+                            # Пересылаем исходную строку без повторной сериализации
+                            await self.send_encoded(message["data"], user_id)
                             logger.info(f"Redis message forwarded to user {user_id}")
-                    except json.JSONDecodeError as e:
+                    except DecodeError as e:
                         logger.error(f"Invalid JSON from Redis: {e}")
         except Exception as e:
             logger.error(f"Redis listener error: {e}")
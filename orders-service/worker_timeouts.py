@@ -0,0 +1,151 @@
+"""
+Таймауты оплаты заказов.
+
+Каждый заказ создаётся со сроком payment_due_at (окно оплаты ORDER_PAYMENT_TTL плюс
+запас ORDER_PAYMENT_GRACE). Если к этому сроку заказ всё ещё NEW - результат оплаты
+потерян или не пришёл. Воркер спрашивает сервис платежей, была ли транзакция по заказу:
+- SUCCESS - заказ FINISHED, FAILED - CANCELLED;
+- транзакции нет - CANCELLED: событие order_created уже просрочено, и сервис
+  платежей его не оплатит, даже если оно ещё лежит в очереди.
+
+Просроченные заказы выбираются по частичному индексу (payment_due_at) WHERE status = 'NEW',
+поэтому стоимость проверки зависит от числа неоплаченных заказов, а не от размера таблицы.
+Несколько воркеров (TIMEOUT_WORKERS, инстансы сервиса) не проверяют одни и те же
+заказы: пачка забирается FOR UPDATE SKIP LOCKED, и в той же транзакции её срок
+сдвигается на PAYMENT_TIMEOUT_CLAIM_TTL - до конца проверки заказы не попадут в чужие
+выборки, а если воркер упадёт, снова станут просроченными по истечении этого срока.
+Блокировки на время HTTP-запроса не держатся: статус меняется условным UPDATE
+(только если заказ всё ещё NEW), так что гонка с воркером результатов оплат безопасна.
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+import httpx
+import redis.asyncio as aioredis
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+
+from database import get_engine
+from loop_monitor import loop_monitor
+from models import Order, OrderStatus
+from serialization import dumps
+from shutdown import shutdown
+import rollups
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+PAYMENTS_SERVICE_URL = os.getenv("PAYMENTS_SERVICE_URL", "http://payments-service:8000")
+PAYMENT_TIMEOUT_CHECK_INTERVAL = float(os.getenv("PAYMENT_TIMEOUT_CHECK_INTERVAL", 5.0))
+PAYMENT_TIMEOUT_BATCH_SIZE = int(os.getenv("PAYMENT_TIMEOUT_BATCH_SIZE", 100))
+PAYMENT_LOOKUP_TIMEOUT = float(os.getenv("PAYMENT_LOOKUP_TIMEOUT", 5.0))
+# На сколько откладывается срок забранных заказов (сек): должно хватать на проверку пачки
+PAYMENT_TIMEOUT_CLAIM_TTL = float(os.getenv("PAYMENT_TIMEOUT_CLAIM_TTL", 60.0))
+
+TRANSACTION_STATUSES = {"SUCCESS": OrderStatus.FINISHED, "FAILED": OrderStatus.CANCELLED}
+
+
+def claim_due_orders(engine) -> List[tuple]:
+    """Забирает пачку просроченных заказов, откладывая их срок на время проверки"""
+    with Session(engine) as session:
+        orders = session.execute(
+            select(Order.id, Order.user_id, Order.amount)
+            .where(Order.status == OrderStatus.NEW, Order.payment_due_at <= func.now())
+            .order_by(Order.payment_due_at)
+            .limit(PAYMENT_TIMEOUT_BATCH_SIZE)
+            .with_for_update(skip_locked=True)
+        ).all()
+        if orders:
+            session.execute(
+                update(Order)
+                .where(Order.id.in_([order.id for order in orders]))
+                .values(payment_due_at=datetime.now(timezone.utc) + timedelta(seconds=PAYMENT_TIMEOUT_CLAIM_TTL))
+            )
+        session.commit()
+        return orders
+
+
+def resolve_order(engine, order_id: int, amount: float, status: OrderStatus) -> bool:
+    """Переводит заказ в конечный статус, если он всё ещё NEW"""
+    with Session(engine) as session:
+        result = session.execute(
+            update(Order)
+            .where(Order.id == order_id, Order.status == OrderStatus.NEW)
+            .values(status=status)
+        )
+        if result.rowcount != 1:
+            return False
+        rollups.record_transition(session, order_id, amount, OrderStatus.NEW, status)
+        session.commit()
+        return True
+
+
+async def lookup_payment(client: httpx.AsyncClient, order_id: int, user_id: int) -> Optional[str]:
+    """Статус транзакции по заказу в сервисе платежей (None - транзакции нет)"""
+    response = await client.get(
+        f"{PAYMENTS_SERVICE_URL}/transactions",
+        params={"order_id": order_id, "limit": 1},
+        headers={"X-User-ID": str(user_id)}
+    )
+    response.raise_for_status()
+    items = response.json()["items"]
+    return items[0]["status"] if items else None
+
+
+async def check_order(engine, client: httpx.AsyncClient, redis_client, order_id: int, user_id: int, amount: float):
+    tx_status = await lookup_payment(client, order_id, user_id)
+    status = TRANSACTION_STATUSES.get(tx_status, OrderStatus.CANCELLED)
+    if not await asyncio.to_thread(resolve_order, engine, order_id, amount, status):
+        # Результат оплаты успел прийти, пока мы спрашивали
+        return
+
+    logger.info(f"Payment timeout for Order #{order_id}: transaction {tx_status}, order {status.value}")
+    notification = {
+        "type": "order_update",
+        # Тот же ID, что у уведомления воркера результатов оплат: дубль не дойдёт до клиента
+        "event_id": f"order:{order_id}:{status.value}",
+        "order_id": order_id,
+        "user_id": user_id,
+        "status": status.value,
+        "amount": amount,
+    }
+    await redis_client.publish("order_updates", dumps(notification))
+
+
+async def process_payment_timeouts():
+    logger.info("Payment timeout worker started...")
+    await loop_monitor.start()
+    asyncio.current_task().set_name("payment-timeouts")
+    engine = get_engine()
+    redis_client = aioredis.from_url(REDIS_URL, encoding="utf-8", decode_responses=True)
+
+    async with httpx.AsyncClient(timeout=PAYMENT_LOOKUP_TIMEOUT) as client:
+        while True:
+            # Остановка ждёт конца пачки: забранные заказы не повиснут до истечения PAYMENT_TIMEOUT_CLAIM_TTL
+            with shutdown.busy():
+                try:
+                    orders = await asyncio.to_thread(claim_due_orders, engine)
+                except Exception as e:
+                    logger.error(f"Cannot select overdue orders: {e}")
+                    orders = []
+
+                failed = False
+                for order_id, user_id, amount in orders:
+                    try:
+                        await check_order(engine, client, redis_client, order_id, user_id, amount)
+                    except Exception as e:
+                        # Сервис платежей недоступен - заказ снова станет просроченным через PAYMENT_TIMEOUT_CLAIM_TTL
+                        logger.error(f"Cannot check payment of Order #{order_id}: {e}")
+                        failed = True
+
+            # Полная пачка без ошибок - просроченных заказов может быть больше, проверяем сразу
+            if failed or len(orders) < PAYMENT_TIMEOUT_BATCH_SIZE:
+                await asyncio.sleep(PAYMENT_TIMEOUT_CHECK_INTERVAL)
+
+
+if __name__ == "__main__":
+    shutdown.run(process_payment_timeouts)
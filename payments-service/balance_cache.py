@@ -0,0 +1,133 @@
+"""
+Кэш балансов счетов.
+
+Два уровня: LRU в памяти процесса и (опционально) Redis, общий для всех процессов
+и воркеров сервиса. Кэш заполняется при чтении и обновляется write-through после
+коммита в topup_account и в воркере оплаты. Каждая запись несёт Account.version,
+и значение с меньшей версией никогда не перезаписывает более новое.
+
+Локальный уровень живёт недолго (BALANCE_CACHE_LOCAL_TTL): списания делает
+отдельный процесс-воркер, и до остальных процессов они доходят через Redis.
+"""
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import redis.asyncio as aioredis
+
+from serialization import dumps, loads
+
+logger = logging.getLogger(__name__)
+
+BALANCE_CACHE_ENABLED = os.getenv("BALANCE_CACHE_ENABLED", "true").lower() == "true"
+BALANCE_CACHE_SIZE = int(os.getenv("BALANCE_CACHE_SIZE", 10_000))
+BALANCE_CACHE_LOCAL_TTL = float(os.getenv("BALANCE_CACHE_LOCAL_TTL", 1.0))
+# Redis-уровень включается, если задан URL
+BALANCE_CACHE_REDIS_URL = os.getenv("BALANCE_CACHE_REDIS_URL", "")
+BALANCE_CACHE_REDIS_TTL = int(os.getenv("BALANCE_CACHE_REDIS_TTL", 300))
+
+# Запись в Redis только если версия новее уже сохранённой
+VERSIONED_SET_SCRIPT = """
+local current = redis.call('HGET', KEYS[1], 'version')
+if current and tonumber(current) >= tonumber(ARGV[1]) then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'version', ARGV[1], 'data', ARGV[2])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return 1
+"""
+
+
+def account_snapshot(account, balance: Optional[float] = None) -> dict:
+    """Данные счета для кэша (снимаются до коммита, пока объект не истёк)"""
+    return {
+        "id": account.id,
+        "user_id": account.user_id,
+        "balance": account.balance if balance is None else balance,
+        "version": account.version,
+        "created_at": account.created_at,
+        # Баланс шардированного счета меняется без изменения версии - такие записи
+        # служат только маркером, и чтение всегда идёт в БД
+        "sharded": bool(account.shard_count),
+    }
+
+
+class BalanceCache:
+    def __init__(self):
+        self.enabled = BALANCE_CACHE_ENABLED
+        self.local: "OrderedDict[int, tuple]" = OrderedDict()
+        self.redis_client = None
+        self.script = None
+        if self.enabled and BALANCE_CACHE_REDIS_URL:
+            self.redis_client = aioredis.from_url(BALANCE_CACHE_REDIS_URL)
+            self.script = self.redis_client.register_script(VERSIONED_SET_SCRIPT)
+        self.stats = {"local_hits": 0, "redis_hits": 0, "misses": 0, "stale_writes": 0}
+
+    @staticmethod
+    def _key(user_id: int) -> str:
+        return f"balance:{user_id}"
+
+    def _put_local(self, data: dict) -> bool:
+        user_id = data["user_id"]
+        current = self.local.get(user_id)
+        if current is not None and current[1]["version"] > data["version"]:
+            self.stats["stale_writes"] += 1
+            return False
+        self.local[user_id] = (time.monotonic() + BALANCE_CACHE_LOCAL_TTL, data)
+        self.local.move_to_end(user_id)
+        if len(self.local) > BALANCE_CACHE_SIZE:
+            self.local.popitem(last=False)
+        return True
+
+    async def get(self, user_id: int) -> Optional[dict]:
+        if not self.enabled:
+            return None
+
+        entry = self.local.get(user_id)
+        if entry is not None and entry[0] > time.monotonic():
+            if entry[1].get("sharded"):
+                self.stats["misses"] += 1
+                return None
+            self.local.move_to_end(user_id)
+            self.stats["local_hits"] += 1
+            return entry[1]
+
+        if self.redis_client is not None:
+            try:
+                raw = await self.redis_client.hget(self._key(user_id), "data")
+            except Exception as e:
+                logger.warning(f"Balance cache Redis read failed: {e}")
+                raw = None
+            if raw is not None:
+                data = loads(raw)
+                self._put_local(data)
+                if not data.get("sharded"):
+                    self.stats["redis_hits"] += 1
+                    return data
+
+        self.stats["misses"] += 1
+        return None
+
+    async def put(self, data: dict):
+        """Сохраняет значение, если его версия не старее закэшированной"""
+        if not self.enabled:
+            return
+        if not self._put_local(data):
+            return
+        if self.script is not None:
+            try:
+                await self.script(
+                    keys=[self._key(data["user_id"])],
+                    args=[data["version"], dumps(data), BALANCE_CACHE_REDIS_TTL]
+                )
+            except Exception as e:
+                logger.warning(f"Balance cache Redis write failed: {e}")
+
+    async def close(self):
+        if self.redis_client is not None:
+            await self.redis_client.close()
+
+
+balance_cache = BalanceCache()
@@ -0,0 +1,80 @@
+"""
+Дедлайны запросов.
+
+API Gateway передаёт в заголовке X-Request-Deadline момент (unix time, сек), после
+которого ответ ему уже не нужен. Сервис:
+- сразу отвечает 504, если дедлайн прошёл до начала работы с БД;
+- в каждой транзакции запроса ставит statement_timeout по оставшемуся времени,
+  чтобы PostgreSQL сам прервал запрос, результат которого уже никто не ждёт.
+Оба ответа 504 помечаются заголовком X-Deadline-Exceeded: истёк бюджет клиента,
+а не сломался инстанс, и circuit breaker в gateway их не учитывает.
+"""
+import logging
+import time
+from typing import Optional
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse
+from sqlalchemy import event
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+DEADLINE_HEADER = "X-Request-Deadline"
+# Отметка ответа 504 по истёкшему дедлайну: gateway не считает его отказом инстанса
+DEADLINE_EXCEEDED_HEADER = "X-Deadline-Exceeded"
+
+# Код ошибки PostgreSQL query_canceled (в т.ч. по statement_timeout)
+QUERY_CANCELED = "57014"
+
+
+def remaining(deadline: Optional[float]) -> Optional[float]:
+    """Оставшееся время в секундах (None - дедлайна нет)"""
+    if deadline is None:
+        return None
+    return deadline - time.time()
+
+
+def deadline_exceeded() -> HTTPException:
+    return HTTPException(status_code=504, detail="Дедлайн запроса истёк", headers={DEADLINE_EXCEEDED_HEADER: "1"})
+
+
+def check_deadline(deadline: Optional[float]):
+    left = remaining(deadline)
+    if left is not None and left <= 0:
+        raise deadline_exceeded()
+
+
+def bind_deadline(session: Session, deadline: Optional[float]):
+    """Проверяет дедлайн и ограничивает им каждую транзакцию сессии"""
+    if deadline is None:
+        return
+    check_deadline(deadline)
+
+    @event.listens_for(session, "after_begin")
+    def set_statement_timeout(session, transaction, connection):
+        if connection.dialect.name != "postgresql":
+            return
+        # Минимум 1 мс: statement_timeout = 0 означает «без ограничения»
+        timeout_ms = max(1, int(remaining(deadline) * 1000))
+        connection.exec_driver_sql(f"SET LOCAL statement_timeout = {timeout_ms}")
+
+
+def is_statement_timeout(error: Exception) -> bool:
+    return isinstance(error, DBAPIError) and getattr(error.orig, "pgcode", None) == QUERY_CANCELED
+
+
+def setup_deadlines(app: FastAPI):
+    """
+    Ошибки БД, не перехваченные в эндпоинте: запрос, прерванный PostgreSQL по
+    statement_timeout, отдаётся как 504, остальные - как 500
+    """
+
+    @app.exception_handler(DBAPIError)
+    async def database_error_handler(request: Request, exc: DBAPIError):
+        if is_statement_timeout(exc):
+            exceeded = deadline_exceeded()
+            return JSONResponse(status_code=504, content={"detail": exceeded.detail}, headers=exceeded.headers)
+        logger.error(f"Database error in {request.method} {request.url.path}: {exc}")
+        return JSONResponse(status_code=500, content={"detail": "Ошибка базы данных"})
@@ -0,0 +1,183 @@
+"""
+Монитор задержек event loop (включается LOOP_MONITOR_ENABLED=true).
+
+- Задержка цикла: фоновая задача засыпает на LOOP_LAG_INTERVAL и измеряет, насколько
+  позже она проснулась. Значения копятся в гистограмме (Prometheus-совместимые бакеты).
+- Блокирующие вызовы: поток-наблюдатель видит, что задача перестала «тикать» дольше
+  LOOP_BLOCK_THRESHOLD, и пишет в лог стек потока event loop в этот момент -
+  то есть стек того кода, который держит цикл.
+- Атрибуция: заблокированное время относится к метке задачи, выполнявшейся в момент
+  блокировки - маршруту HTTP-запроса (LoopAttributionMiddleware) или консьюмеру
+  (контекстный менеджер attribute()).
+
+При выключенном мониторе start() ничего не запускает, а attribute() только
+возвращает управление.
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional, Union
+from weakref import WeakKeyDictionary
+
+logger = logging.getLogger(__name__)
+
+LOOP_MONITOR_ENABLED = os.getenv("LOOP_MONITOR_ENABLED", "false").lower() == "true"
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", 0.1))
+LOOP_BLOCK_THRESHOLD = float(os.getenv("LOOP_BLOCK_THRESHOLD", 0.1))
+
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+Label = Union[str, Callable[[], str]]
+
+
+class Histogram:
+    def __init__(self, buckets=LAG_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def snapshot(self) -> dict:
+        # Накопительные значения, как у бакетов le в Prometheus
+        cumulative, total = {}, 0
+        for bound, count in zip(list(self.buckets) + ["+Inf"], self.counts):
+            total += count
+            cumulative[str(bound)] = total
+        return {"buckets": cumulative, "count": self.count, "sum": round(self.sum, 6), "max": round(self.max, 6)}
+
+
+class LoopMonitor:
+    def __init__(self):
+        self.enabled = LOOP_MONITOR_ENABLED
+        self.lag = Histogram()
+        self.blocked: Dict[str, dict] = {}
+        self.stalls = 0
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.loop_thread_id: Optional[int] = None
+        self.last_tick = 0.0
+        self._labels: "WeakKeyDictionary[asyncio.Task, Label]" = WeakKeyDictionary()
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """Запуск в работающем event loop (lifespan приложения или начало воркера)"""
+        if not self.enabled or self._task is not None:
+            return
+        self.loop = asyncio.get_running_loop()
+        self.loop_thread_id = threading.get_ident()
+        self.last_tick = time.perf_counter()
+        self._task = asyncio.create_task(self._measure_lag(), name="loop-monitor")
+        threading.Thread(target=self._watch, name="loop-watchdog", daemon=True).start()
+        logger.info("Event loop monitor started")
+
+    async def _measure_lag(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(LOOP_LAG_INTERVAL)
+            self.last_tick = time.perf_counter()
+            self.lag.observe(max(0.0, self.last_tick - started - LOOP_LAG_INTERVAL))
+
+    def _current_label(self) -> str:
+        # Чтение текущей задачи из другого потока: это просмотр словаря, GIL делает его безопасным
+        task = asyncio.current_task(self.loop)
+        if task is None:
+            return "<loop callback>"
+        label = self._labels.get(task)
+        if label is None:
+            return task.get_name()
+        return label() if callable(label) else label
+
+    def _watch(self):
+        """Поток-наблюдатель: фиксирует блокировки цикла и их виновника"""
+        check_interval = max(0.01, LOOP_BLOCK_THRESHOLD / 2)
+        while True:
+            time.sleep(check_interval)
+            tick = self.last_tick
+            stalled = time.perf_counter() - tick - LOOP_LAG_INTERVAL
+            if stalled < LOOP_BLOCK_THRESHOLD:
+                continue
+
+            self.stalls += 1
+            try:
+                label = self._current_label()
+            except Exception:
+                label = "<unknown>"
+            frame = sys._current_frames().get(self.loop_thread_id)
+            stack = "".join(traceback.format_stack(frame, limit=30)) if frame is not None else ""
+            logger.warning(f"Event loop blocked for more than {stalled * 1000:.0f} ms in {label}:\n{stack}")
+
+            # Ждём конца блокировки и относим всё время к метке
+            while self.last_tick == tick:
+                time.sleep(check_interval)
+            duration = self.last_tick - tick - LOOP_LAG_INTERVAL
+            stats = self.blocked.setdefault(label, {"count": 0, "seconds": 0.0})
+            stats["count"] += 1
+            stats["seconds"] = round(stats["seconds"] + duration, 6)
+
+    @contextmanager
+    def attribute(self, label: Label):
+        """Относит блокировки внутри блока к метке (консьюмер, обработчик)"""
+        if not self.enabled:
+            yield
+            return
+        task = asyncio.current_task()
+        previous = self._labels.get(task)
+        self._labels[task] = label
+        try:
+            yield
+        finally:
+            if previous is None:
+                self._labels.pop(task, None)
+            else:
+                self._labels[task] = previous
+
+    def snapshot(self) -> dict:
+        if not self.enabled:
+            return {"enabled": False}
+        return {"enabled": True, "lag": self.lag.snapshot(), "stalls": self.stalls, "blocked": self.blocked}
+
+
+class LoopAttributionMiddleware:
+    """ASGI middleware: метка задачи - метод и обработчик маршрута"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        def label() -> str:
+            # endpoint появляется в scope после маршрутизации
+            endpoint = scope.get("endpoint")
+            name = getattr(endpoint, "__name__", None) or scope.get("path", "")
+            return f"{scope.get('method', 'WS')} {name}"
+
+        with loop_monitor.attribute(label):
+            await self.app(scope, receive, send)
+
+
+def setup_loop_monitor(app):
+    """Регистрирует middleware атрибуции (сам монитор запускается в lifespan)"""
+    if loop_monitor.enabled:
+        app.add_middleware(LoopAttributionMiddleware)
+
+
+loop_monitor = LoopMonitor()
@@ -1,18 +1,56 @@
-from fastapi import FastAPI, Depends, HTTPException, Header, status
+from fastapi import FastAPI, Depends, HTTPException, Header, Query, Response, status
+from fastapi.middleware.gzip import GZipMiddleware
 from sqlalchemy.orm import Session
-from sqlalchemy import text
+from sqlalchemy import text, tuple_
 import asyncio
+import base64
 import logging
-
-from database import get_db
-from models import Account
-from schemas import AccountTopUp, AccountResponse
+import os
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Optional
+
+from database import get_db, get_read_db, mark_write
+from deadlines import deadline_exceeded, is_statement_timeout, setup_deadlines
+from models import Account, ProcessedTransaction
+from schemas import (
+    ACCOUNT_ADAPTER, TRANSACTION_PAGE_ADAPTER, AccountTopUp, AccountResponse, AccountShardsUpdate, TransactionPage
+)
+from profiling import setup_profiling
+from loop_monitor import loop_monitor, setup_loop_monitor
+from serialization import FastJSONResponse, validated_response
+from balance_cache import balance_cache, account_snapshot
+import sharded_balance
 
 # Настройка логирования для отслеживания операций
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="💰 Payments Service", version="1.0.0")
+# Момент импорта приложения: от него считается время старта инстанса
+STARTED_AT = time.perf_counter()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await loop_monitor.start()
+    # Схема создаётся миграциями (migrate.py), поэтому старт не включает DDL
+    logger.info(f"Сервис платежей запущен за {time.perf_counter() - STARTED_AT:.3f} с")
+    yield
+    await balance_cache.close()
+
+
+app = FastAPI(
+    title="💰 Payments Service",
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse
+)
+setup_profiling(app)
+setup_loop_monitor(app)
+setup_deadlines(app)
+# Сжатие ответов для API Gateway (он пересылает их клиенту без перепаковки)
+app.add_middleware(GZipMiddleware, minimum_size=int(os.getenv("GZIP_MIN_SIZE", 1024)))
 
 
 # 1. Эмуляция аутентификации: извлекаем ID пользователя из заголовка запроса.
@@ -29,24 +67,26 @@ async def health_check(db: Session = Depends(get_db)):
     """
     try:
         db.execute(text("SELECT 1"))
-        return {"status": "healthy"}
+        return {"status": "healthy", "event_loop": loop_monitor.snapshot()}
     except Exception as e:
         raise HTTPException(status_code=503, detail=str(e))
 
 
 @app.post("/accounts", response_model=AccountResponse, status_code=201)
-async def create_account(user_id: int = Depends(verify_user_id), db: Session = Depends(get_db)):
+async def create_account(response: Response, user_id: int = Depends(verify_user_id), db: Session = Depends(get_db)):
     # 3. Бизнес-правило: У одного пользователя может быть только один счет.
     existing = db.query(Account).filter(Account.user_id == user_id).first()
     if existing:
         raise HTTPException(status_code=400, detail="Account already exists")
 
     try:
-        account = Account(user_id=user_id, balance=0.0)
+        account = Account(user_id=user_id, balance=0.0, version=0)
         db.add(account)
         # 4. Фиксируем транзакцию: сохраняем новый счет в БД.
         db.commit()
+        mark_write(response)
         db.refresh(account)
+        await balance_cache.put(account_snapshot(account))
 
         # Используем метод model_validate (Pydantic v2)
         # для корректного преобразования объекта SQLAlchemy в схему ответа.
@@ -54,44 +94,159 @@ async def create_account(user_id: int = Depends(verify_user_id), db: Session = D
     except Exception as e:
         # 6. В случае любой ошибки откатываем транзакцию, чтобы не было "битых" данных.
         db.rollback()
+        if is_statement_timeout(e):
+            raise deadline_exceeded()
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.post("/accounts/topup", response_model=AccountResponse)
-async def topup_account(data: AccountTopUp, user_id: int = Depends(verify_user_id), db: Session = Depends(get_db)):
+async def topup_account(
+        data: AccountTopUp,
+        response: Response,
+        user_id: int = Depends(verify_user_id),
+        db: Session = Depends(get_db)
+):
     try:
-        # 7. Используем пессимистичную блокировку
-        account = db.query(Account).filter(Account.user_id == user_id).with_for_update().first()
+        # 7. Используем пессимистичную блокировку (для шардированного счета - блокировку одного шарда)
+        account = sharded_balance.find_account(db, user_id)
 
         if not account:
             raise HTTPException(status_code=404, detail="Account not found")
 
-        # 8. Обновляем баланс защищенным образом (внутри блокировки).
-        account.balance += data.amount
+        if account.shard_count:
+            sharded_balance.credit(db, account, data.amount)
+            snapshot = account_snapshot(account, balance=sharded_balance.total_balance(db, account))
+        else:
+            # 8. Обновляем баланс защищенным образом (внутри блокировки).
+            account.balance += data.amount
+            account.version += 1
+            snapshot = account_snapshot(account)
 
         db.commit()
-        db.refresh(account)
-        return AccountResponse.model_validate(account)
+        mark_write(response)
+        # Write-through: после коммита обновляем кэш новой версией баланса
+        await balance_cache.put(snapshot)
+        return AccountResponse.model_validate(snapshot)
+    except HTTPException:
+        raise
+    except Exception as e:
+        db.rollback()
+        if is_statement_timeout(e):
+            raise deadline_exceeded()
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/accounts/shards", response_model=AccountResponse)
+async def enable_account_sharding(
+        data: AccountShardsUpdate,
+        response: Response,
+        user_id: int = Depends(verify_user_id),
+        db: Session = Depends(get_db)
+):
+    # Перевод «горячего» счета в режим суб-балансов (опционально, см. sharded_balance.py)
+    if not sharded_balance.SHARDED_BALANCES_ENABLED:
+        raise HTTPException(status_code=400, detail="Sharded balances are disabled")
+
+    try:
+        account = db.query(Account).filter(Account.user_id == user_id).with_for_update().first()
+        if not account:
+            raise HTTPException(status_code=404, detail="Account not found")
+        if account.shard_count:
+            raise HTTPException(status_code=400, detail="Account is already sharded")
+
+        balance = account.balance
+        sharded_balance.enable_sharding(db, account, data.shards)
+        snapshot = account_snapshot(account, balance=balance)
+
+        db.commit()
+        mark_write(response)
+        await balance_cache.put(snapshot)
+        return AccountResponse.model_validate(snapshot)
     except HTTPException:
         raise
     except Exception as e:
         db.rollback()
+        if is_statement_timeout(e):
+            raise deadline_exceeded()
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/accounts", response_model=AccountResponse)
-async def get_account(user_id: int = Depends(verify_user_id), db: Session = Depends(get_db)):
-    # 9. Получение полной информации о счете текущего пользователя.
+async def get_account(user_id: int = Depends(verify_user_id), db: Session = Depends(get_read_db)):
+    # 9. Получение полной информации о счете текущего пользователя (сначала из кэша).
+    # Снимок из кэша проверяется и сериализуется одним вызовом, без повторной проверки по response_model
+    cached = await balance_cache.get(user_id)
+    if cached is not None:
+        return validated_response(ACCOUNT_ADAPTER, cached)
+
     account = db.query(Account).filter(Account.user_id == user_id).first()
     if not account:
         raise HTTPException(status_code=404, detail="Account not found")
-    return AccountResponse.model_validate(account)
+    snapshot = account_snapshot(account, balance=sharded_balance.total_balance(db, account))
+    await balance_cache.put(snapshot)
+    return validated_response(ACCOUNT_ADAPTER, snapshot)
 
 
 @app.get("/accounts/balance")
-async def get_balance(user_id: int = Depends(verify_user_id), db: Session = Depends(get_db)):
+async def get_balance(user_id: int = Depends(verify_user_id), db: Session = Depends(get_read_db)):
     # 10. Упрощенный эндпоинт для получения только текущего баланса и валюты.
-    account = db.query(Account).filter(Account.user_id == user_id).first()
-    if not account:
-        raise HTTPException(status_code=404, detail="Account not found")
-    return {"user_id": user_id, "balance": account.balance, "currency": "RUB"}
\ No newline at end of file
+    cached = await balance_cache.get(user_id)
+    if cached is None:
+        account = db.query(Account).filter(Account.user_id == user_id).first()
+        if not account:
+            raise HTTPException(status_code=404, detail="Account not found")
+        cached = account_snapshot(account, balance=sharded_balance.total_balance(db, account))
+        await balance_cache.put(cached)
+    return {"user_id": user_id, "balance": cached["balance"], "currency": "RUB"}
+
+
+# Колонки истории платежей: поля TransactionResponse и id для курсора
+TRANSACTION_COLUMNS = (
+    ProcessedTransaction.id, ProcessedTransaction.transaction_id, ProcessedTransaction.order_id,
+    ProcessedTransaction.amount, ProcessedTransaction.status, ProcessedTransaction.reason,
+    ProcessedTransaction.processed_at,
+)
+
+
+def encode_cursor(tx) -> str:
+    raw = f"{tx.processed_at.isoformat()}|{tx.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str):
+    try:
+        processed_at, tx_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(processed_at), int(tx_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+@app.get("/transactions", response_model=TransactionPage)
+async def get_transactions(
+        limit: int = Query(50, ge=1, le=500),
+        cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+        order_id: Optional[int] = None,
+        tx_status: Optional[str] = Query(None, alias="status", pattern="^(SUCCESS|FAILED)$"),
+        user_id: int = Depends(verify_user_id),
+        db: Session = Depends(get_read_db)
+):
+    # 11. История платежей пользователя, от новых к старым.
+    # Keyset-пагинация по индексу (user_id, processed_at, id): стоимость страницы не зависит от её номера.
+    # Только колонки ответа и курсора: строки без ORM-объектов
+    query = db.query(*TRANSACTION_COLUMNS).filter(ProcessedTransaction.user_id == user_id)
+    if order_id is not None:
+        query = query.filter(ProcessedTransaction.order_id == order_id)
+    if tx_status is not None:
+        query = query.filter(ProcessedTransaction.status == tx_status)
+    if cursor:
+        query = query.filter(
+            tuple_(ProcessedTransaction.processed_at, ProcessedTransaction.id) < tuple_(*decode_cursor(cursor))
+        )
+
+    rows = query.order_by(
+        ProcessedTransaction.processed_at.desc(),
+        ProcessedTransaction.id.desc()
+    ).limit(limit + 1).all()
+
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return validated_response(TRANSACTION_PAGE_ADAPTER, {"items": rows[:limit], "next_cursor": next_cursor})
@@ -0,0 +1,84 @@
+"""Начальная схема: счета, inbox, outbox и журнал транзакций
+
+Соответствует таблицам, которые раньше создавались через Base.metadata.create_all.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "accounts",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("balance", sa.Float(), nullable=False),
+        sa.Column("version", sa.Integer(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=True),
+        sa.CheckConstraint("balance >= 0", name="balance_non_negative"),
+    )
+    op.create_index("ix_accounts_id", "accounts", ["id"])
+    op.create_index("ix_accounts_user_id", "accounts", ["user_id"], unique=True)
+
+    op.create_table(
+        "inbox_messages",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("message_id", sa.String(), nullable=False),
+        sa.Column("event_type", sa.String(), nullable=False),
+        sa.Column("event_data", sa.String(), nullable=False),
+        sa.Column("processed", sa.Boolean(), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column("processed_at", sa.DateTime(timezone=True), nullable=True),
+    )
+    op.create_index("ix_inbox_messages_id", "inbox_messages", ["id"])
+    op.create_index("ix_inbox_messages_message_id", "inbox_messages", ["message_id"], unique=True)
+
+    op.create_table(
+        "outbox_messages",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("event_type", sa.String(), nullable=False),
+        sa.Column("event_data", sa.String(), nullable=False),
+        sa.Column("processed", sa.Boolean(), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column("processed_at", sa.DateTime(timezone=True), nullable=True),
+    )
+    op.create_index("ix_outbox_messages_id", "outbox_messages", ["id"])
+
+    op.create_table(
+        "processed_transactions",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("transaction_id", sa.String(), nullable=False),
+        sa.Column("order_id", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("amount", sa.Float(), nullable=False),
+        sa.Column("status", sa.String(), nullable=False),
+        sa.Column("processed_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+    )
+    op.create_index("ix_processed_transactions_id", "processed_transactions", ["id"])
+    op.create_index(
+        "ix_processed_transactions_transaction_id", "processed_transactions", ["transaction_id"], unique=True
+    )
+
+
+def downgrade():
+    op.drop_index("ix_processed_transactions_transaction_id", table_name="processed_transactions")
+    op.drop_index("ix_processed_transactions_id", table_name="processed_transactions")
+    op.drop_table("processed_transactions")
+    op.drop_index("ix_outbox_messages_id", table_name="outbox_messages")
+    op.drop_table("outbox_messages")
+    op.drop_index("ix_inbox_messages_message_id", table_name="inbox_messages")
+    op.drop_index("ix_inbox_messages_id", table_name="inbox_messages")
+    op.drop_table("inbox_messages")
+    op.drop_index("ix_accounts_user_id", table_name="accounts")
+    op.drop_index("ix_accounts_id", table_name="accounts")
+    op.drop_table("accounts")
@@ -0,0 +1,35 @@
+"""Шардированные суб-балансы для горячих счетов
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("accounts", sa.Column("shard_count", sa.Integer(), nullable=False, server_default="0"))
+
+    op.create_table(
+        "account_shards",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("account_id", sa.Integer(), sa.ForeignKey("accounts.id"), nullable=False),
+        sa.Column("shard_no", sa.Integer(), nullable=False),
+        sa.Column("balance", sa.Float(), nullable=False),
+        sa.UniqueConstraint("account_id", "shard_no", name="uq_account_shard"),
+        sa.CheckConstraint("balance >= 0", name="shard_balance_non_negative"),
+    )
+    op.create_index("ix_account_shards_id", "account_shards", ["id"])
+
+
+def downgrade():
+    op.drop_index("ix_account_shards_id", table_name="account_shards")
+    op.drop_table("account_shards")
+    op.drop_column("accounts", "shard_count")
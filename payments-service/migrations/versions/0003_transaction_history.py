@@ -0,0 +1,28 @@
+"""История платежей: причина отказа и индекс для keyset-пагинации
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("processed_transactions", sa.Column("reason", sa.String(), nullable=True))
+    op.create_index(
+        "ix_processed_transactions_user_time",
+        "processed_transactions",
+        ["user_id", "processed_at", "id"]
+    )
+
+
+def downgrade():
+    op.drop_index("ix_processed_transactions_user_time", table_name="processed_transactions")
+    op.drop_column("processed_transactions", "reason")
@@ -0,0 +1,41 @@
+"""Inbox/outbox: бинарный event_data и content_type
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+TABLES = ("inbox_messages", "outbox_messages")
+
+
+def upgrade():
+    # Существующие JSON-строки сохраняются как UTF-8 байты
+    for table in TABLES:
+        op.alter_column(
+            table, "event_data",
+            type_=sa.LargeBinary(),
+            postgresql_using="convert_to(event_data, 'UTF8')"
+        )
+        op.add_column(
+            table,
+            sa.Column("content_type", sa.String(), nullable=False, server_default="application/json")
+        )
+
+
+def downgrade():
+    # Работает, только если в таблицах не осталось msgpack-событий
+    for table in TABLES:
+        op.drop_column(table, "content_type")
+        op.alter_column(
+            table, "event_data",
+            type_=sa.String(),
+            postgresql_using="convert_from(event_data, 'UTF8')"
+        )
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, UniqueConstraint, CheckConstraint
+from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, LargeBinary, UniqueConstraint, CheckConstraint, ForeignKey, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import func
 import uuid
@@ -17,6 +17,9 @@ class Account(Base):
     # Поле версии для реализации Optimistic Locking
     version = Column(Integer, nullable=False, default=0)
 
+    # Количество суб-балансов (account_shards). 0 - обычный режим, баланс хранится в этой строке
+    shard_count = Column(Integer, nullable=False, default=0, server_default="0")
+
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
@@ -26,6 +29,22 @@ class Account(Base):
     )
 
 
+# Суб-баланс «горячего» счета. Баланс счета в шардированном режиме - сумма суб-балансов,
+# а списания и пополнения блокируют только одну строку-шард вместо строки счета.
+class AccountShard(Base):
+    __tablename__ = "account_shards"
+
+    id = Column(Integer, primary_key=True, index=True)
+    account_id = Column(Integer, ForeignKey("accounts.id"), nullable=False)
+    shard_no = Column(Integer, nullable=False)
+    balance = Column(Float, nullable=False, default=0.0)
+
+    __table_args__ = (
+        UniqueConstraint('account_id', 'shard_no', name='uq_account_shard'),
+        CheckConstraint('balance >= 0', name='shard_balance_non_negative'),
+    )
+
+
 # Таблица для паттерна Transactional Inbox (Входящие сообщения)
 class InboxMessage(Base):
     __tablename__ = "inbox_messages"
@@ -36,7 +55,9 @@ class InboxMessage(Base):
     message_id = Column(String, nullable=False, unique=True, index=True)
 
     event_type = Column(String, nullable=False)
-    event_data = Column(String, nullable=False)
+    # Тело сообщения как пришло из брокера
+    event_data = Column(LargeBinary, nullable=False)
+    content_type = Column(String, nullable=False, default="application/json", server_default="application/json")
     processed = Column(Boolean, default=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     processed_at = Column(DateTime(timezone=True), nullable=True)
@@ -49,8 +70,9 @@ class OutboxMessage(Base):
     id = Column(Integer, primary_key=True, index=True)
     event_type = Column(String, nullable=False)
 
-    # Данные события (JSON)
-    event_data = Column(String, nullable=False)
+    # Закодированный конверт события (events.py)
+    event_data = Column(LargeBinary, nullable=False)
+    content_type = Column(String, nullable=False, default="application/json", server_default="application/json")
 
     # Флаг, показывающий, было ли сообщение успешно передано в брокер
     processed = Column(Boolean, default=False)
@@ -69,7 +91,14 @@ class ProcessedTransaction(Base):
     user_id = Column(Integer, nullable=False)
     amount = Column(Float, nullable=False)
 
-    # Статус операции
+    # Статус операции: SUCCESS или FAILED
     status = Column(String, nullable=False)
+    # Причина отказа для неуспешных попыток
+    reason = Column(String, nullable=True)
 
-    processed_at = Column(DateTime(timezone=True), server_default=func.now())
\ No newline at end of file
+    processed_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    # Индекс для постраничной выдачи истории пользователя по ключу (processed_at, id)
+    __table_args__ = (
+        Index('ix_processed_transactions_user_time', 'user_id', 'processed_at', 'id'),
+    )
\ No newline at end of file
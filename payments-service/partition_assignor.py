@@ -0,0 +1,81 @@
+"""
+Распределение партиций оплат между консьюмерами.
+
+Каждый процесс-консьюмер регистрируется в Redis (sorted set, score - время
+последнего heartbeat). Участники, не обновлявшие heartbeat дольше
+PARTITION_MEMBER_TTL, считаются ушедшими. Владелец партиции выбирается
+rendezvous-хешированием: у кого из живых участников hash(member, partition)
+наибольший. При входе или выходе участника переезжает только ~1/N партиций,
+и все консьюмеры приходят к одному распределению без координатора.
+
+Пока распределение сходится, партицию могут читать двое - порядок сохраняет
+x-single-active-consumer очереди. Если Redis недоступен, консьюмер берёт все
+партиции и полагается на тот же механизм.
+"""
+import logging
+import os
+import socket
+import time
+import zlib
+from typing import List, Set
+
+import redis.asyncio as aioredis
+
+logger = logging.getLogger(__name__)
+
+PARTITION_REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+PARTITION_HEARTBEAT_INTERVAL = float(os.getenv("PARTITION_HEARTBEAT_INTERVAL", 2.0))
+PARTITION_MEMBER_TTL = float(os.getenv("PARTITION_MEMBER_TTL", 10.0))
+
+MEMBERS_KEY = "payments:partition_members"
+
+
+def rendezvous_owner(partition: int, members: List[str]) -> str:
+    return max(members, key=lambda member: zlib.crc32(f"{member}/{partition}".encode()))
+
+
+class PartitionAssignor:
+    def __init__(self, partitions: int):
+        self.partitions = partitions
+        self.member_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.redis_client = None
+        self.members: List[str] = []
+
+    async def connect(self):
+        try:
+            self.redis_client = aioredis.from_url(PARTITION_REDIS_URL, decode_responses=True)
+        except Exception as e:
+            logger.error(f"Partition assignor failed to connect to Redis: {e}")
+
+    async def refresh(self) -> Set[int]:
+        """Heartbeat и пересчёт своих партиций"""
+        all_partitions = set(range(self.partitions))
+        if self.redis_client is None:
+            return all_partitions
+
+        now = time.time()
+        try:
+            async with self.redis_client.pipeline(transaction=True) as pipe:
+                pipe.zadd(MEMBERS_KEY, {self.member_id: now})
+                pipe.zremrangebyscore(MEMBERS_KEY, "-inf", now - PARTITION_MEMBER_TTL)
+                pipe.zrange(MEMBERS_KEY, 0, -1)
+                _, _, members = await pipe.execute()
+        except Exception as e:
+            logger.warning(f"Partition assignor Redis error, consuming all partitions: {e}")
+            return all_partitions
+
+        members = sorted(members)
+        if members != self.members:
+            logger.info(f"Partition members changed: {members}")
+            self.members = members
+        return {p for p in all_partitions if rendezvous_owner(p, members) == self.member_id}
+
+    async def leave(self):
+        """Выход из группы: партиции сразу переходят к остальным"""
+        if self.redis_client is None:
+            return
+        try:
+            await self.redis_client.zrem(MEMBERS_KEY, self.member_id)
+            await self.redis_client.aclose()
+        except Exception as e:
+            logger.warning(f"Partition assignor failed to leave: {e}")
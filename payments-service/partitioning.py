@@ -0,0 +1,49 @@
+"""
+Партиционирование потока оплат по user_id.
+
+Outbox сервиса заказов публикует order_created не в одну очередь orders.to_pay,
+а в одну из PAYMENT_PARTITIONS очередей orders.to_pay.p<N>; номер партиции -
+crc32(user_id) mod PAYMENT_PARTITIONS. Все оплаты пользователя попадают в одну очередь
+и обрабатываются по порядку, а разные пользователи - параллельно разными консьюмерами.
+
+Очереди объявляются с x-single-active-consumer: даже если при перебалансировке на
+партицию подписались два консьюмера, сообщения получает только один.
+Кто какие партиции читает, решает PartitionAssignor (сервис платежей).
+
+PAYMENT_PARTITIONS должен совпадать в обоих сервисах. При его изменении пользователи
+переезжают в другие партиции, поэтому перед сменой очереди нужно вычитать.
+"""
+import os
+import zlib
+
+import aio_pika
+
+PAYMENT_PARTITIONS = int(os.getenv("PAYMENT_PARTITIONS", 8))
+# Общая очередь до партиционирования: дочитывается при обновлении
+LEGACY_PAYMENT_QUEUE = "orders.to_pay"
+
+
+def partition_of(user_id: int) -> int:
+    return zlib.crc32(str(user_id).encode()) % PAYMENT_PARTITIONS
+
+
+def partition_queue(partition: int) -> str:
+    return f"{LEGACY_PAYMENT_QUEUE}.p{partition}"
+
+
+def payment_queue_for(user_id: int) -> str:
+    """Очередь, в которую публикуется оплата заказа пользователя"""
+    return partition_queue(partition_of(user_id))
+
+
+async def declare_partition_queue(channel: aio_pika.abc.AbstractChannel, partition: int):
+    return await channel.declare_queue(
+        partition_queue(partition),
+        durable=True,
+        arguments={"x-single-active-consumer": True}
+    )
+
+
+async def declare_partition_queues(channel: aio_pika.abc.AbstractChannel):
+    """Объявляет все очереди партиций (аргументы должны совпадать у всех сервисов)"""
+    return [await declare_partition_queue(channel, p) for p in range(PAYMENT_PARTITIONS)]
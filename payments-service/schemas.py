@@ -1,5 +1,5 @@
-from pydantic import BaseModel, Field
-from typing import Optional
+from pydantic import BaseModel, Field, TypeAdapter
+from typing import List, Optional
 from datetime import datetime
 
 
@@ -12,6 +12,11 @@ class AccountTopUp(BaseModel):
     amount: float = Field(gt=0, description="Amount must be positive")
 
 
+# Перевод счета в шардированный режим: на сколько суб-балансов разбить баланс
+class AccountShardsUpdate(BaseModel):
+    shards: int = Field(ge=2, le=64, description="Number of sub-balances")
+
+
 # Схема для сериализации ответа клиенту с текущим состоянием счета
 class AccountResponse(BaseModel):
     id: int
@@ -39,4 +44,27 @@ class PaymentResult(BaseModel):
     user_id: int
     success: bool
     message: Optional[str] = None
-    remaining_balance: Optional[float] = None
\ No newline at end of file
+    remaining_balance: Optional[float] = None
+
+# Запись истории платежей пользователя
+class TransactionResponse(BaseModel):
+    transaction_id: str
+    order_id: int
+    amount: float
+    status: str
+    reason: Optional[str] = None
+    processed_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+# Страница истории: next_cursor передаётся в следующий запрос, None - записей больше нет
+class TransactionPage(BaseModel):
+    items: List[TransactionResponse]
+    next_cursor: Optional[str] = None
+
+
+# Схемы ответов создаются один раз, а не на каждый запрос
+ACCOUNT_ADAPTER = TypeAdapter(AccountResponse)
+TRANSACTION_PAGE_ADAPTER = TypeAdapter(TransactionPage)
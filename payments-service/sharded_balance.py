@@ -0,0 +1,110 @@
+"""
+Шардированный режим баланса для «горячих» счетов.
+
+Обычный счет - одна строка accounts, и каждое списание берёт на неё FOR UPDATE,
+поэтому сотни заказов в секунду от одного пользователя выстраиваются в очередь.
+В шардированном режиме баланс разбит на K строк account_shards:
+- списание берёт случайный свободный шард с достаточной суммой (SKIP LOCKED),
+  а если такого нет - блокирует все шарды по порядку и списывает с нескольких;
+- пополнение зачисляется на случайный свободный шард;
+- баланс счета - сумма шардов.
+Инвариант balance >= 0 проверяется CHECK-ограничением каждого шарда.
+
+Режим включается для счета явно (POST /accounts/shards), если SHARDED_BALANCES_ENABLED=true.
+"""
+import os
+import random
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from models import Account, AccountShard
+
+SHARDED_BALANCES_ENABLED = os.getenv("SHARDED_BALANCES_ENABLED", "false").lower() == "true"
+MAX_SHARDS = int(os.getenv("MAX_BALANCE_SHARDS", 64))
+
+
+def find_account(session: Session, user_id: int, for_update: bool = True):
+    """
+    Загружает счет. Строка шардированного счета не блокируется -
+    блокировки берутся на уровне шардов.
+    """
+    query = session.query(Account).filter(Account.user_id == user_id)
+    if not SHARDED_BALANCES_ENABLED:
+        return query.with_for_update().first() if for_update else query.first()
+
+    account = query.first()
+    if account is None or account.shard_count or not for_update:
+        return account
+    # Обычный счет блокируем; после блокировки перепроверяем режим
+    return query.with_for_update().populate_existing().first()
+
+
+def total_balance(session: Session, account: Account) -> float:
+    if not account.shard_count:
+        return account.balance
+    total = session.query(func.coalesce(func.sum(AccountShard.balance), 0.0)).filter(
+        AccountShard.account_id == account.id
+    ).scalar()
+    return float(total)
+
+
+def enable_sharding(session: Session, account: Account, shards: int):
+    """Переводит счет (заблокированный FOR UPDATE) в шардированный режим"""
+    shards = max(2, min(shards, MAX_SHARDS))
+    # Делим баланс поровну в копейках, остаток уходит в первый шард
+    cents = round(account.balance * 100)
+    share, remainder = divmod(cents, shards)
+    for shard_no in range(shards):
+        amount = share + (remainder if shard_no == 0 else 0)
+        session.add(AccountShard(account_id=account.id, shard_no=shard_no, balance=amount / 100))
+
+    account.balance = 0.0
+    account.shard_count = shards
+    account.version += 1
+
+
+def credit(session: Session, account: Account, amount: float):
+    """Зачисление на случайный незаблокированный шард"""
+    shard = session.query(AccountShard).filter(
+        AccountShard.account_id == account.id
+    ).order_by(func.random()).with_for_update(skip_locked=True).first()
+
+    if shard is None:
+        # Все шарды заняты - ждём случайный
+        shard = session.query(AccountShard).filter(
+            AccountShard.account_id == account.id,
+            AccountShard.shard_no == random.randrange(account.shard_count)
+        ).with_for_update().first()
+
+    shard.balance += amount
+
+
+def debit(session: Session, account: Account, amount: float) -> bool:
+    """Списание. Возвращает False, если суммарного баланса не хватает."""
+    # Быстрый путь: один свободный шард, на котором хватает средств
+    shard = session.query(AccountShard).filter(
+        AccountShard.account_id == account.id,
+        AccountShard.balance >= amount
+    ).order_by(func.random()).with_for_update(skip_locked=True).first()
+
+    if shard is not None:
+        shard.balance -= amount
+        return True
+
+    # Медленный путь (sweep): блокируем все шарды в порядке номеров, чтобы не было дедлоков
+    shards = session.query(AccountShard).filter(
+        AccountShard.account_id == account.id
+    ).order_by(AccountShard.shard_no).with_for_update().all()
+
+    if sum(s.balance for s in shards) < amount:
+        return False
+
+    remaining = amount
+    for s in sorted(shards, key=lambda s: s.balance, reverse=True):
+        taken = min(s.balance, remaining)
+        s.balance -= taken
+        remaining -= taken
+        if remaining <= 0:
+            break
+    return True
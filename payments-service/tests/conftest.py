@@ -0,0 +1,4 @@
+import os
+
+# Модули сервиса читают настройки при импорте: по умолчанию тесты не ходят в PostgreSQL
+os.environ.setdefault("DATABASE_URL", "sqlite://")
@@ -0,0 +1,62 @@
+import asyncio
+import random
+
+import fakeredis
+import pytest
+
+from balance_cache import VERSIONED_SET_SCRIPT, BalanceCache
+from serialization import loads
+
+
+def snapshot(version: int) -> dict:
+    return {"id": 1, "user_id": 1, "balance": float(version), "version": version, "sharded": False}
+
+
+@pytest.fixture
+def redis_client():
+    return fakeredis.aioredis.FakeRedis()
+
+
+def cache_with_redis(redis_client) -> BalanceCache:
+    # Отдельный экземпляр - отдельный процесс сервиса со своим локальным уровнем
+    cache = BalanceCache()
+    cache.enabled = True
+    cache.redis_client = redis_client
+    cache.script = redis_client.register_script(VERSIONED_SET_SCRIPT)
+    return cache
+
+
+async def test_stale_put_does_not_overwrite_local_value():
+    cache = BalanceCache()
+    cache.enabled = True
+    await cache.put(snapshot(2))
+    await cache.put(snapshot(1))
+
+    assert (await cache.get(1))["version"] == 2
+    assert cache.stats["stale_writes"] == 1
+
+
+async def test_stale_put_from_other_process_does_not_overwrite_redis(redis_client):
+    fresh, lagging = cache_with_redis(redis_client), cache_with_redis(redis_client)
+    await fresh.put(snapshot(2))
+    # Локально у второго процесса версии нет - старое значение отсекает только Lua CAS
+    await lagging.put(snapshot(1))
+
+    stored = await redis_client.hget("balance:1", "data")
+    assert loads(stored)["version"] == 2
+    reader = cache_with_redis(redis_client)
+    assert (await reader.get(1))["version"] == 2
+
+
+async def test_interleaved_puts_keep_newest_version(redis_client):
+    caches = [cache_with_redis(redis_client) for _ in range(4)]
+    versions = list(range(1, 51))
+    random.Random(42).shuffle(versions)
+
+    await asyncio.gather(*(caches[i % len(caches)].put(snapshot(v)) for i, v in enumerate(versions)))
+
+    assert loads(await redis_client.hget("balance:1", "data"))["version"] == 50
+    for n, cache in enumerate(caches):
+        # Локально остаётся самая новая из версий, которые записывал этот процесс
+        assert cache.local[1][1]["version"] == max(versions[n::len(caches)])
+    assert (await cache_with_redis(redis_client).get(1))["version"] == 50
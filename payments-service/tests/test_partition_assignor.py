@@ -0,0 +1,83 @@
+import asyncio
+import os
+import signal
+
+import fakeredis
+import pytest
+
+import partition_assignor
+import partitioning
+import worker_inbox
+from partition_assignor import MEMBERS_KEY, PartitionAssignor
+from shutdown import GracefulShutdown
+
+
+class FakeQueue:
+    def __init__(self, name):
+        self.name = name
+
+    async def consume(self, callback):
+        return f"ctag-{self.name}"
+
+    async def cancel(self, consumer_tag):
+        pass
+
+
+class FakeChannel:
+    async def set_qos(self, **kwargs):
+        pass
+
+    async def declare_queue(self, name, **kwargs):
+        return FakeQueue(name)
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+
+    async def channel(self, publisher_confirms=True):
+        return FakeChannel()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.closed = True
+
+
+@pytest.fixture
+def redis_server(monkeypatch):
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(partition_assignor.aioredis, "from_url",
+                        lambda *args, **kwargs: fakeredis.aioredis.FakeRedis(server=server, decode_responses=True))
+    return server
+
+
+async def test_sigterm_hands_partitions_to_other_members(redis_server, monkeypatch):
+    connection = FakeConnection()
+
+    async def connect_robust(url):
+        return connection
+
+    monkeypatch.setattr(worker_inbox.aio_pika, "connect_robust", connect_robust)
+    monkeypatch.setattr(worker_inbox, "PARTITION_HEARTBEAT_INTERVAL", 0.01)
+    shutdown = GracefulShutdown()
+    monkeypatch.setattr(worker_inbox, "shutdown", shutdown)
+
+    other = PartitionAssignor(partitioning.PAYMENT_PARTITIONS)
+    other.member_id = "other:1"
+    await other.connect()
+    observer = fakeredis.aioredis.FakeRedis(server=redis_server, decode_responses=True)
+
+    task = asyncio.create_task(shutdown.serve(worker_inbox.process_inbox))
+    await other.refresh()
+    while len(await observer.zrange(MEMBERS_KEY, 0, -1)) < 2:
+        await asyncio.sleep(0.01)
+
+    os.kill(os.getpid(), signal.SIGTERM)
+    await asyncio.wait_for(task, timeout=5)
+
+    # Участник ушёл сразу, а не через PARTITION_MEMBER_TTL: его партиции уже у оставшегося
+    assert connection.closed
+    assert await observer.zrange(MEMBERS_KEY, 0, -1) == ["other:1"]
+    assert await other.refresh() == set(range(partitioning.PAYMENT_PARTITIONS))
@@ -0,0 +1,146 @@
+import asyncio
+
+import aiormq
+import pytest
+
+import events
+import partitioning
+import replay_dlq
+import retries
+from shutdown import GracefulShutdown
+
+QUEUE = "orders.to_pay.p0"
+
+
+class FakeExchange:
+    def __init__(self):
+        self.published = []
+        # Ответ брокера на публикацию; future - пока брокер не ответил
+        self.confirmation = aiormq.spec.Basic.Ack()
+
+    async def publish(self, message, routing_key, mandatory=True):
+        self.published.append((routing_key, message))
+        if isinstance(self.confirmation, asyncio.Future):
+            return await self.confirmation
+        return self.confirmation
+
+
+class FakeChannel:
+    def __init__(self, publisher_confirms=True):
+        self.publisher_confirms = publisher_confirms
+        self.default_exchange = FakeExchange()
+
+
+class FakeMessage:
+    def __init__(self, name):
+        self.body = name.encode()
+        self.content_type = events.JSON_CONTENT_TYPE
+        self.headers = {}
+        self.message_id = name
+
+
+@pytest.fixture(autouse=True)
+def short_delays(monkeypatch):
+    monkeypatch.setattr(retries, "MESSAGE_RETRY_BASE_DELAY", 0.001)
+
+
+def flaky(log, name, failures, error=ConnectionError):
+    """Обработчик, который падает failures раз, затем проходит"""
+    async def handler():
+        log.append(name)
+        if log.count(name) <= failures:
+            raise error("database is down")
+    return handler
+
+
+async def test_failed_message_is_retried_before_next_one():
+    channel, log = FakeChannel(), []
+    # Консьюмер партиции обрабатывает сообщения по одному (prefetch_count=1)
+    for name, failures in (("a", 2), ("b", 0)):
+        await retries.process_in_order(channel, FakeMessage(name), QUEUE, flaky(log, name, failures))
+
+    assert log == ["a", "a", "a", "b"]
+    assert channel.default_exchange.published == []
+
+
+async def test_exhausted_attempts_go_to_partition_dlq(monkeypatch):
+    monkeypatch.setattr(retries, "MESSAGE_MAX_ATTEMPTS", 3)
+    channel, log = FakeChannel(), []
+
+    await retries.process_in_order(channel, FakeMessage("a"), QUEUE, flaky(log, "a", failures=10))
+
+    assert log == ["a"] * 3
+    [(target, message)] = channel.default_exchange.published
+    assert target == "orders.to_pay.p0.dlq"
+    assert message.headers[retries.ATTEMPT_HEADER] == 3
+
+
+async def test_undecodable_message_skips_retries():
+    channel, log = FakeChannel(), []
+
+    await retries.process_in_order(channel, FakeMessage("a"), QUEUE,
+                                   flaky(log, "a", failures=10, error=events.EventDecodeError))
+
+    assert log == ["a"]
+    assert [target for target, _ in channel.default_exchange.published] == ["orders.to_pay.p0.dlq"]
+
+
+async def test_stop_interrupts_in_place_retry(monkeypatch):
+    monkeypatch.setattr(retries, "MESSAGE_RETRY_BASE_DELAY", 60)
+    shutdown = GracefulShutdown()
+    monkeypatch.setattr(retries, "shutdown", shutdown)
+    channel, log = FakeChannel(), []
+    asyncio.get_running_loop().call_later(0.01, shutdown.request)
+
+    # Исключение выходит из message.process(requeue=True): сообщение вернётся в голову партиции
+    with pytest.raises(ConnectionError):
+        await asyncio.wait_for(
+            retries.process_in_order(channel, FakeMessage("a"), QUEUE, flaky(log, "a", failures=10)), timeout=5
+        )
+    assert log == ["a"]
+    assert channel.default_exchange.published == []
+
+
+async def test_failure_waits_for_broker_confirmation():
+    channel = FakeChannel()
+    channel.default_exchange.confirmation = asyncio.get_running_loop().create_future()
+
+    # Пока брокер не подтвердил копию, handle_failure не возвращается - оригинал не подтверждён
+    republishing = asyncio.create_task(
+        retries.handle_failure(channel, FakeMessage("a"), QUEUE, ConnectionError("database is down")))
+    await asyncio.sleep(0.01)
+    assert not republishing.done()
+    assert [target for target, _ in channel.default_exchange.published] == [f"{QUEUE}.retry.1ms"]
+
+    channel.default_exchange.confirmation.set_result(aiormq.spec.Basic.Ack())
+    await asyncio.wait_for(republishing, timeout=1)
+
+
+async def test_unconfirmed_republish_raises():
+    # Исключение выходит из message.process(requeue=True): оригинал вернётся в очередь
+    returned = FakeChannel()
+    returned.default_exchange.confirmation = object()  # сообщение вернулось неразмещённым
+    with pytest.raises(RuntimeError, match="did not confirm"):
+        await retries.handle_failure(returned, FakeMessage("a"), QUEUE, ConnectionError("database is down"))
+
+    without_confirms = FakeChannel(publisher_confirms=False)
+    with pytest.raises(RuntimeError, match="publisher confirms"):
+        await retries.handle_failure(without_confirms, FakeMessage("a"), QUEUE, ConnectionError("database is down"))
+    assert without_confirms.default_exchange.published == []
+
+
+async def test_partition_queues_get_only_dlq():
+    declared = []
+
+    class DeclaringChannel:
+        async def declare_queue(self, name, **kwargs):
+            declared.append(name)
+
+    await retries.declare_retry_topology(DeclaringChannel(), QUEUE, retry_queues=False)
+    assert declared == ["orders.to_pay.p0.dlq"]
+
+
+def test_replay_defaults_to_all_partition_dlqs():
+    assert replay_dlq.DEFAULT_QUEUES == [
+        *(f"orders.to_pay.p{p}" for p in range(partitioning.PAYMENT_PARTITIONS)), "orders.to_pay"
+    ]
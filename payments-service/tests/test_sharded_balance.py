@@ -0,0 +1,91 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+import sharded_balance
+from models import Account, AccountShard, Base
+
+
+@pytest.fixture
+def session():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add(Account(user_id=1, balance=100.01, version=3))
+        session.commit()
+        yield session
+
+
+# Баланс 100.01 на четырёх шардах: остаток в копейках уходит в первый шард
+SPLIT = [25.01, 25.0, 25.0, 25.0]
+
+
+def shard_balances(session, account):
+    return [s.balance for s in session.query(AccountShard).filter(
+        AccountShard.account_id == account.id).order_by(AccountShard.shard_no)]
+
+
+def sharded_account(session, shards=4):
+    account = session.query(Account).one()
+    sharded_balance.enable_sharding(session, account, shards)
+    session.flush()
+    return account
+
+
+def test_enable_sharding_splits_balance_in_cents(session):
+    account = sharded_account(session)
+
+    assert shard_balances(session, account) == SPLIT
+    assert account.balance == 0.0 and account.shard_count == 4 and account.version == 4
+    assert sharded_balance.total_balance(session, account) == pytest.approx(100.01)
+
+
+def test_debit_takes_one_shard_when_it_has_enough(session):
+    account = sharded_account(session)
+
+    assert sharded_balance.debit(session, account, 10.0)
+
+    taken = [before - after for before, after in zip(SPLIT, shard_balances(session, account))]
+    assert sorted(taken) == pytest.approx([0, 0, 0, 10.0])
+    assert sharded_balance.total_balance(session, account) == pytest.approx(90.01)
+
+
+def test_debit_sweeps_across_shards(session):
+    account = sharded_account(session)
+
+    assert sharded_balance.debit(session, account, 60.0)
+
+    assert sharded_balance.total_balance(session, account) == pytest.approx(40.01)
+    assert all(b >= 0 for b in shard_balances(session, account))
+
+
+def test_debit_over_total_balance_changes_nothing(session):
+    account = sharded_account(session)
+
+    assert not sharded_balance.debit(session, account, 100.02)
+    assert shard_balances(session, account) == SPLIT
+
+
+def test_credit_goes_to_single_shard(session):
+    account = sharded_account(session)
+
+    sharded_balance.credit(session, account, 5.0)
+
+    assert sharded_balance.total_balance(session, account) == pytest.approx(105.01)
+    assert sum(1 for b in shard_balances(session, account) if b >= 30.0) == 1
+
+
+def test_shard_count_is_clamped(session, monkeypatch):
+    monkeypatch.setattr(sharded_balance, "MAX_SHARDS", 8)
+    account = sharded_account(session, shards=1000)
+    assert account.shard_count == 8
+
+
+def test_find_account_returns_sharded_account_without_row_lock(session, monkeypatch):
+    monkeypatch.setattr(sharded_balance, "SHARDED_BALANCES_ENABLED", True)
+    sharded_account(session)
+
+    account = sharded_balance.find_account(session, user_id=1)
+
+    assert account.shard_count == 4
+    assert sharded_balance.find_account(session, user_id=2) is None
@@ -0,0 +1,68 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+
+import database
+from main import app, decode_cursor, encode_cursor
+from models import Base, ProcessedTransaction
+
+T0 = datetime(2026, 10, 19, 12, 0)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        # Три записи с одинаковым processed_at: порядок внутри них задаёт id
+        times = [T0, T0, T0, T0 + timedelta(seconds=1), T0 + timedelta(seconds=2)]
+        for n, processed_at in enumerate(times, start=1):
+            session.add(ProcessedTransaction(
+                id=n, transaction_id=f"tx-{n}", order_id=n, user_id=1, amount=float(n),
+                status="FAILED" if n % 2 else "SUCCESS", processed_at=processed_at
+            ))
+        session.add(ProcessedTransaction(
+            id=6, transaction_id="tx-other", order_id=6, user_id=2, amount=1.0,
+            status="SUCCESS", processed_at=T0
+        ))
+        session.commit()
+    monkeypatch.setattr(database, "_engine", engine)
+    monkeypatch.setattr(database, "_read_engines", [])
+    return TestClient(app)
+
+
+def pages(client, **params):
+    cursor, result = None, []
+    while True:
+        query = {**params, **({"cursor": cursor} if cursor else {})}
+        page = client.get("/transactions", params=query, headers={"X-User-ID": "1"}).json()
+        result.append([item["order_id"] for item in page["items"]])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return result
+
+
+def test_cursor_round_trip():
+    row = ProcessedTransaction(id=7, processed_at=T0)
+    assert decode_cursor(encode_cursor(row)) == (T0, 7)
+
+
+def test_invalid_cursor_is_rejected(client):
+    response = client.get("/transactions", params={"cursor": "garbage"}, headers={"X-User-ID": "1"})
+    assert response.status_code == 400
+
+
+def test_pages_walk_history_newest_first_without_gaps(client):
+    assert pages(client, limit=2) == [[5, 4], [3, 2], [1]]
+
+
+def test_full_last_page_has_no_cursor(client):
+    assert pages(client, limit=5) == [[5, 4, 3, 2, 1]]
+
+
+def test_filters_apply_on_every_page(client):
+    assert pages(client, limit=1, status="SUCCESS") == [[4], [2]]